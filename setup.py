@@ -1,4 +1,7 @@
-from distutils.core import setup
+try:
+    from setuptools import setup
+except ImportError:
+    from distutils.core import setup
 from glob import glob
 
 
@@ -10,4 +13,8 @@ setup(
     packages = ["sixteen", "sixteen.web"],
     scripts = glob("scripts/*"),
     install_requires = ["twisted", "txws"],
+    # running many cpus at once with sixteen.lockstep needs numpy.
+    extras_require = {"lockstep": ["numpy"]},
+    tests_require = ["numpy"],
+    test_suite = "sixteen.tests",
 )
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""Translating a whole program ahead of time. Starting from some entry
+points, follow every jump whose target is known without running anything and
+write a Python module with a function for each basic block it finds. Running
+that module with `Precompiled` skips decoding and translating altogether;
+computed jumps and code that's been overwritten since go to the interpreter.
+"""
+
+from sixteen.utilities import OpcodeError
+from sixteen.registers import slots
+from sixteen.blocks import BlockCompiler, Instruction, find, translate_block, \
+    skip, standard
+
+
+def constant(instruction):
+    "The value of an instruction's a, if it's a literal; otherwise None."
+    if instruction.a == 0x1f:
+        return instruction.a_word
+    elif instruction.a >= 0x20:
+        return (instruction.a - 0x21) & 0xffff
+
+
+def successors(cpu, instruction):
+    "The addresses that can come after an instruction that ends a block."
+    mnemonic = instruction.mnemonic
+    target = constant(instruction)
+    if instruction.conditional:
+        return [instruction.next, skip(cpu, instruction.next)[0]]
+    elif mnemonic == "jsr":
+        if target is None:
+            return [instruction.next]
+        return [target, instruction.next]
+    elif mnemonic in ("int", "hwi"):
+        return [instruction.next]
+    elif instruction.special or instruction.b != 0x1c:
+        # rfi, iag pc and hwn pc; we can't know where they go.
+        return []
+    elif target is None:
+        return []
+    elif mnemonic == "set":
+        return [target]
+    elif mnemonic == "add":
+        return [(instruction.next + target) & 0xffff]
+    elif mnemonic == "sub":
+        return [(instruction.next - target) & 0xffff]
+    return []
+
+
+def discover(cpu, entries=(0,), limit=BlockCompiler.limit):
+    """Find every block reachable from some entry points, returning a dict
+    of their starting addresses to their instructions.
+    """
+    found = {}
+    pending = list(entries)
+    while pending:
+        address = pending.pop()
+        if address in found or address >= cpu.cells:
+            continue
+        instructions = find(cpu, address, limit)
+        found[address] = instructions
+        if not instructions:
+            # the cpu has to run this one itself; if it falls through, keep
+            # looking after it.
+            try:
+                instruction = Instruction(cpu, address)
+            except OpcodeError:
+                continue
+            if not instruction.ends_block:
+                pending.append(instruction.next & 0xffff)
+            continue
+        for instruction in instructions:
+            # interrupt handlers set with a literal
+            if instruction.mnemonic == "ias":
+                handler = constant(instruction)
+                if handler:
+                    pending.append(handler)
+        last = instructions[-1]
+        if last.ends_block:
+            pending.extend(successors(cpu, last))
+        else:
+            # it got too long, or the next one can't be translated.
+            pending.append(last.next & 0xffff)
+    return dict((a, i) for a, i in found.iteritems() if i)
+
+
+def generate(cpu, entries=(0,), limit=BlockCompiler.limit):
+    "Write the source of a module with every block reachable from `entries`."
+    lines = [
+        "# -*- coding: utf-8 -*-",
+        '"Translated ahead of time by sixteen-aot; run it with Precompiled."',
+        "",
+        "from sixteen.bits import as_signed, from_signed",
+        "",
+    ]
+    names = []
+    for address, instructions in sorted(discover(cpu, entries,
+            limit).iteritems()):
+        name = "block_0x%04x" % address
+        source, writes, end = translate_block(cpu, instructions, name)
+        lines.extend(["", source])
+        lines.append("%s.writes = %r" % (name, sorted(slots[r]
+            for r in writes)))
+        lines.append("%s.start = 0x%04x" % (name, address))
+        lines.append("%s.end = 0x%04x" % (name, end))
+        # the words it was translated from, to check against.
+        lines.append("%s.words = (%s,)" % (name,
+            ", ".join("0x%04x" % w for w in cpu.ram[address:end])))
+        lines.append("")
+        names.append((address, name))
+    lines.extend(["", "blocks = {"])
+    for address, name in names:
+        lines.append("    0x%04x: %s," % (address, name))
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+class Precompiled(BlockCompiler):
+    """Runs the blocks from a module written by `generate`. Only blocks
+    whose code matches what's in the cpu's RAM get used, so load the program
+    first; anything else is left to the interpreter.
+    """
+    def __init__(self, cpu, module, limit=None):
+        super(Precompiled, self).__init__(cpu, limit)
+        self.load(module)
+
+    def load(self, module):
+        """Use every block from a module that matches the cpu's RAM and
+        doesn't use anything the cpu's class overrides.
+        """
+        ram = self.cpu.ram
+        for address, block in module.blocks.iteritems():
+            if (tuple(ram[block.start:block.end]) != block.words or
+                    not self.standard(block)):
+                continue
+            self.blocks[address] = block
+            for covered in xrange(block.start, block.end):
+                self.covering.setdefault(covered, set()).add(address)
+
+    def standard(self, block):
+        """Whether the cpu uses the usual method for every instruction in a
+        block, the same as `find` checks before translating.
+        """
+        cpu = self.cpu
+        table = cpu.table or cpu.decode_table()
+        address = block.start
+        while address < block.end:
+            entry = table[cpu.ram[address]]
+            if entry.mnemonic is None or not standard(cpu, entry.mnemonic):
+                return False
+            address += entry.length
+        return True
+
+    def compile(self, address):
+        "There's nothing here that wasn't translated ahead of time."
+        self.blocks[address] = None
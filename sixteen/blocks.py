@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+"""A faster way to run DCPU-16 code: straight-line runs of instructions get
+translated into Python source once, compiled, and then called as a single
+function every time the cpu gets back to them.
+
+A basic block ends at the first instruction that writes to PC, any
+conditional, JSR, INT, RFI or HWI. Guest registers live in local variables
+while a block runs and get written back when it finishes; devices get to see
+the cpu (and interrupt it) between blocks rather than between instructions.
+"""
+
+from sixteen.bits import as_signed, from_signed
+from sixteen.utilities import OpcodeError
+from sixteen.registers import slots, PC
+from sixteen.dcpu16 import DCPU16
+
+
+# the names of the registers that operand codes 0x00-0x07 refer to.
+general = ["A", "B", "C", "X", "Y", "Z", "I", "J"]
+
+
+class Operand(object):
+    """What an operand turns into in generated code: some lines to run when
+    it's evaluated, an expression to read it, and what to assign to in order to
+    write it (a register name, a RAM address expression, or None).
+    """
+    def __init__(self, read, setup=(), register=None, address=None):
+        self.read = read
+        self.setup = list(setup)
+        self.register = register
+        self.address = address
+
+
+def operand(code, is_a, word, name):
+    """Make an Operand for value `code`; `word` is the next word, if this
+    operand consumes one, and `name` is a prefix for any temporaries.
+    """
+    if code < 0x08:
+        register = general[code]
+        return Operand(register, register=register)
+    elif code < 0x10:
+        address = general[code - 0x08]
+        return Operand("ram[%s]" % address, address=address)
+    elif code < 0x18:
+        address = "(%s + 0x%04x) & 0xffff" % (general[code - 0x10], word)
+        return Operand("ram[%s]" % address, address=address)
+    elif code == 0x18:
+        if is_a:
+            # POP; writing to it does nothing.
+            return Operand(name + "pop", [
+                "%spop = ram[SP]" % name,
+                "SP = (SP + 1) & 0xffff",
+            ])
+        else:
+            # PUSH
+            return Operand("ram[%spush]" % name, [
+                "SP = (SP - 1) & 0xffff",
+                "%spush = SP" % name,
+            ], address=name + "push")
+    elif code == 0x19:
+        return Operand("ram[SP]", address="SP")
+    elif code == 0x1a:
+        address = "(SP + 0x%04x) & 0xffff" % word
+        return Operand("ram[%s]" % address, address=address)
+    elif code == 0x1b:
+        return Operand("SP", register="SP")
+    elif code == 0x1c:
+        # reading PC gets filled in with the address of the next instruction.
+        return Operand("{pc}", register="PC")
+    elif code == 0x1d:
+        return Operand("EX", register="EX")
+    elif code == 0x1e:
+        return Operand("ram[0x%04x]" % word, address="0x%04x" % word)
+    elif code == 0x1f:
+        return Operand("0x%04x" % word)
+    else:
+        return Operand("0x%04x" % ((code - 0x21) & 0xffff))
+
+
+# lines of code for each operation, in terms of `b_` and `a_` (which hold the
+# values of b and a) and `result`, which gets written to b. `EX` can be set
+# before the result, as it is by the methods themselves.
+arithmetic = {
+    "set": ["result = a_"],
+    "add": ["t = b_ + a_", "EX = t >> 16", "result = t & 0xffff"],
+    "sub": ["t = b_ - a_", "EX = 0xffff if t < 0 else 0",
+        "result = t & 0xffff"],
+    "mul": ["t = b_ * a_", "EX = t >> 16", "result = t & 0xffff"],
+    "mli": ["t = from_signed(as_signed(b_) * as_signed(a_))",
+        "EX = (t >> 16) & 0xffff", "result = t & 0xffff"],
+    "div": ["if a_ == 0:", "    result = EX = 0", "else:",
+        "    result = b_ // a_", "    EX = ((b_ << 16) // a_) & 0xffff"],
+    "dvi": ["t = from_signed(as_signed(b_) // as_signed(a_))",
+        "EX = (t >> 16) & 0xffff", "result = t & 0xffff"],
+    "mod": ["result = 0 if a_ == 0 else b_ % a_"],
+    "mdi": ["t = from_signed(as_signed(b_) % as_signed(a_) - as_signed(a_))",
+        "EX = (t >> 16) & 0xffff", "result = t & 0xffff"],
+    "AND": ["result = b_ & a_"],
+    "bor": ["result = b_ | a_"],
+    "xor": ["result = b_ ^ a_"],
+    "shr": ["result = b_ >> a_", "EX = ((b_ << 16) >> a_) & 0xffff"],
+    "asr": ["t = from_signed(as_signed(b_) >> as_signed(a_))",
+        "EX = (t >> 16) & 0xffff", "result = t & 0xffff"],
+    "shl": ["t = b_ << a_", "EX = (t >> 16) & 0xffff", "result = t & 0xffff"],
+    "adx": ["t = b_ + a_ + EX", "EX = 1 if t > 0xffff else 0",
+        "result = t & 0xffff"],
+    "sbx": ["t = b_ - a_ + EX", "EX = 0xffff if t >> 16 else 0",
+        "result = t & 0xffff"],
+}
+
+
+# the condition each conditional checks.
+conditions = {
+    "ifb": "(b_ & a_) != 0", "ifc": "(b_ & a_) == 0", "ife": "b_ == a_",
+    "ifn": "b_ != a_", "ifg": "b_ > a_", "ifa": "as_signed(b_) > as_signed(a_)",
+    "ifl": "b_ < a_", "ifu": "as_signed(b_) < as_signed(a_)",
+}
+
+
+# the operations that set EX.
+sets_ex = set(["add", "sub", "mul", "mli", "div", "dvi", "mdi", "shr", "asr",
+    "shl", "adx", "sbx"])
+
+
+# every mnemonic the translator knows how to write code for.
+translatable = set(arithmetic) | set(conditions) | set(["sti", "std", "jsr",
+    "int", "iag", "ias", "rfi", "iaq", "hwn", "hwq", "hwi"])
+
+# special operations that always end a block.
+enders = set(["jsr", "int", "rfi", "hwi"])
+
+
+class Instruction(object):
+    "One instruction of a block, as the translator sees it."
+    def __init__(self, cpu, address):
+        self.address = address
+        entry = (cpu.table or cpu.decode_table())[cpu.ram[address]]
+        if entry.mnemonic is None:
+            raise OpcodeError(entry.illegal, address)
+        self.decoded = entry
+        self.mnemonic = entry.mnemonic
+        self.op, self.b, self.a = entry.op, entry.b, entry.a
+        # the words that come after this one, in the order they get used.
+        words = iter(cpu.ram[address + 1:address + self.decoded.length])
+        self.a_word = next(words) if self.a in consumers else None
+        self.b_word = None
+        if self.op != 0 and self.b in consumers:
+            self.b_word = next(words)
+        self.next = address + self.decoded.length
+        self.special = self.op == 0
+        self.conditional = self.mnemonic in conditions
+
+    @property
+    def cost(self):
+        return self.decoded.cost
+
+    def translate(self):
+        "Write the lines for this instruction; see `translate_instruction`."
+        return translate_instruction(self)
+
+    @property
+    def ends_block(self):
+        if self.conditional or self.mnemonic in enders:
+            return True
+        # anything that writes to PC.
+        if self.special:
+            return self.a == 0x1c and self.mnemonic in ("iag", "hwn")
+        return self.b == 0x1c
+
+
+# value codes that consume the next word
+consumers = set(range(0x10, 0x18) + [0x1a, 0x1e, 0x1f])
+
+
+class BlockCompiler(object):
+    """Translates and runs basic blocks of a cpu's code. Call `step` to run
+    the block at the cpu's PC; anything that can't be translated (illegal
+    opcodes, methods a subclass has overridden) is run by the cpu itself.
+    """
+    # the most instructions to put in one block.
+    limit = 64
+
+    def __init__(self, cpu, limit=None):
+        self.cpu = cpu
+        if limit is not None:
+            self.limit = limit
+        # addresses to compiled blocks, or None if there isn't one there.
+        self.blocks = {}
+        # addresses to the starting addresses of blocks that use them
+        self.covering = {}
+        self.compiled = 0
+        self.invalidations = 0
+        cpu.ram.watchers.append(self.invalidate)
+
+    def invalidate(self, start, stop):
+        "Throw away every block that uses an address in this range."
+        covering = self.covering
+        if not covering:
+            return
+        if stop - start > len(covering):
+            addresses = [a for a in covering if start <= a < stop]
+        else:
+            addresses = [a for a in xrange(start, stop) if a in covering]
+        for address in addresses:
+            for block in covering.pop(address, ()):
+                if self.blocks.pop(block, None) is not None:
+                    self.invalidations += 1
+
+    def step(self):
+        "Run the block at PC, returning the Direct state it ran on."
+        cpu = self.cpu
+        registers = cpu.register_file
+        pc = registers[PC]
+        try:
+            block = self.blocks[pc]
+        except KeyError:
+            block = self.compile(pc)
+        if block is None:
+            return cpu.step()
+        state = cpu.direct_state()
+        block(state, registers, cpu.ram, state.ram.changes)
+        if cpu.hardware:
+            state.registers.changes.update((r, registers[r])
+                    for r in block.writes)
+        return cpu.settle(state)
+
+    def run(self, **conditions):
+        "Like the cpu's `run`, a block at a time."
+        return self.cpu.run(step=self.step, **conditions)
+
+    def compile(self, address):
+        "Translate and compile the block at an address, returning it."
+        instructions = self.find(address)
+        if instructions:
+            source, writes, end = translate_block(self.cpu, instructions)
+            namespace = {
+                "as_signed": as_signed, "from_signed": from_signed,
+            }
+            code = compile(source, "<block 0x%04x>" % address, "exec")
+            exec code in namespace
+            block = namespace["block"]
+            block.source = source
+            block.writes = sorted(slots[r] for r in writes)
+            block.start = address
+            block.end = end
+            for covered in xrange(address, end):
+                self.covering.setdefault(covered, set()).add(address)
+            self.compiled += 1
+        else:
+            block = None
+            # if the first word gets rewritten, try again.
+            self.covering.setdefault(address, set()).add(address)
+        self.blocks[address] = block
+        return block
+
+    def find(self, address):
+        "Find the instructions in the block starting at an address."
+        return find(self.cpu, address, self.limit)
+
+
+# the names that need to be loaded at the start of a block if they're used.
+names = set(general + ["SP", "EX", "IA", "hardware"])
+
+
+def tokens(source):
+    "Split some source up into its names."
+    word = []
+    for char in source:
+        if char.isalnum() or char == "_":
+            word.append(char)
+        elif word:
+            yield "".join(word)
+            word = []
+    if word:
+        yield "".join(word)
+
+
+def standard(cpu, mnemonic):
+    "Whether a cpu uses the usual method for this mnemonic."
+    method = getattr(type(cpu), mnemonic, None)
+    return method is not None and (getattr(method, "im_func", None) is
+            getattr(DCPU16, mnemonic).im_func)
+
+
+def skip(cpu, address):
+    """Work out where a failed conditional at `address` ends up, and how
+    many instructions it skips; this returns None if that can't be known
+    ahead of time.
+    """
+    table = cpu.table or cpu.decode_table()
+    skipped = 0
+    while address < cpu.cells:
+        entry = table[cpu.ram[address]]
+        if entry.mnemonic is None:
+            return None
+        skipped += 1
+        address += entry.length
+        if not entry.conditional:
+            return (address, skipped) if address <= cpu.cells else None
+
+
+def translate_instruction(instruction):
+    """Write the lines for a single instruction. Returns them, the
+    registers they read and write, and whether they store to RAM.
+    """
+    a = operand(instruction.a, True, instruction.a_word, "a")
+    mnemonic = instruction.mnemonic
+    pc = "0x%04x" % (instruction.next & 0xffff)
+    lines = list(a.setup)
+    if instruction.special:
+        b = None
+    else:
+        b = operand(instruction.b, False, instruction.b_word, "b")
+        lines.extend(b.setup)
+    a_read = a.read.format(pc=pc)
+    written = set()
+    # POP and PUSH move the stack pointer as they're evaluated.
+    if len(lines):
+        written.add("SP")
+    stores = [False]
+
+    def write(target, value):
+        "Lines that write `value` (a name) to an operand."
+        if target.register is not None:
+            written.add(target.register)
+            return ["%s = %s" % (target.register, value)]
+        elif target.address is not None:
+            stores[0] = True
+            return ["store = %s" % target.address,
+                "ram[store] = changed[store] = %s" % value]
+        else:
+            # writes to literals are silently ignored
+            return []
+
+    if mnemonic in arithmetic or mnemonic in conditions:
+        if mnemonic != "set":
+            lines.append("b_ = %s" % b.read.format(pc=pc))
+        lines.append("a_ = %s" % a_read)
+        if mnemonic in arithmetic:
+            lines.extend(arithmetic[mnemonic])
+            if mnemonic in sets_ex:
+                written.add("EX")
+            lines.extend(write(b, "result"))
+    elif mnemonic in ("sti", "std"):
+        sign = "+" if mnemonic == "sti" else "-"
+        lines.append("a_ = %s" % a_read)
+        lines.extend(write(b, "a_"))
+        lines.append("I = (I %s 1) & 0xffff" % sign)
+        lines.append("J = (J %s 1) & 0xffff" % sign)
+        written |= set(["I", "J"])
+    elif mnemonic == "jsr":
+        lines.extend(["SP = (SP - 1) & 0xffff",
+            "ram[SP] = changed[SP] = %s" % pc,
+            "PC = %s" % a_read])
+        written |= set(["SP", "PC"])
+        stores[0] = True
+    elif mnemonic == "int":
+        lines.append("a_ = %s" % a_read)
+    elif mnemonic == "iag":
+        lines.extend(write(a, "IA"))
+    elif mnemonic == "ias":
+        lines.append("IA = %s" % a_read)
+        written.add("IA")
+    elif mnemonic == "rfi":
+        lines.extend(["state.queuing = False",
+            "A = ram[SP]", "SP = (SP + 1) & 0xffff",
+            "PC = ram[SP]", "SP = (SP + 1) & 0xffff"])
+        written |= set(["A", "SP", "PC"])
+    elif mnemonic == "iaq":
+        lines.append("state.queuing = bool(%s)" % a_read)
+    elif mnemonic == "hwn":
+        lines.append("a_ = len(hardware) & 0xffff")
+        lines.extend(write(a, "a_"))
+    elif mnemonic == "hwq":
+        lines.extend([
+            "a_ = %s" % a_read,
+            "if a_ < len(hardware):",
+            "    device = hardware[a_]",
+            "    B, A = divmod(device.identifier, 0x10000)",
+            "    C = device.version & 0xffff",
+            "    Y, X = divmod(device.manufacturer, 0x10000)",
+        ])
+        written |= set(["A", "B", "C", "X", "Y"])
+    elif mnemonic == "hwi":
+        lines.extend([
+            "a_ = %s" % a_read,
+            "if a_ < len(hardware):",
+            "    state.interrupts.append(a_)",
+        ])
+    used = set(tokens("\n".join(lines))) & names
+    return lines, used, written, stores[0]
+
+
+def find(cpu, address, limit=BlockCompiler.limit):
+    "Find the instructions in the block starting at an address."
+    instructions = []
+    while len(instructions) < limit and address < cpu.cells:
+        try:
+            instruction = Instruction(cpu, address)
+        except OpcodeError:
+            break
+        # don't translate anything a subclass has changed the meaning of,
+        # or blocks that would run off the end of RAM.
+        if (instruction.mnemonic not in translatable or
+                instruction.next > cpu.cells or
+                not standard(cpu, instruction.mnemonic)):
+            break
+        # if we can't tell where a conditional would skip to (because of
+        # an illegal instruction) let the cpu deal with it.
+        if instruction.conditional and skip(cpu, instruction.next) is None:
+            break
+        instructions.append(instruction)
+        if instruction.ends_block:
+            break
+        address = instruction.next
+    return instructions
+
+
+def translate_block(cpu, instructions, name="block"):
+    """Write the source of a function called `name` for some instructions.
+    Returns the source, the registers it writes, and the address after the
+    last word it depends on.
+    """
+    start = instructions[0].address
+    end = instructions[-1].next
+    body = []
+    reads = set()
+    writes = set()
+    cycles = 0
+    for n, instruction in enumerate(instructions):
+        lines, used, written, stores = instruction.translate()
+        cycles += instruction.cost
+        last = n == len(instructions) - 1
+        if last and instruction.conditional:
+            skip_to, skipped = skip(cpu, instruction.next)
+            end = max(end, skip_to)
+            lines.extend([
+                "if %s:" % conditions[instruction.mnemonic],
+                "    PC = 0x%04x" % (instruction.next & 0xffff),
+                "else:",
+                "    PC = 0x%04x" % (skip_to & 0xffff),
+                "    state.cycles += %d" % skipped,
+            ])
+            written.add("PC")
+        body.append("# 0x%04x: %s" % (instruction.address,
+            instruction.mnemonic))
+        body.extend(lines)
+        reads |= used
+        writes |= written
+        # if this wrote to the block's own code, stop right after it.
+        if stores and not last:
+            body.append(("exit", instruction.next & 0xffff, cycles))
+    if "PC" not in writes:
+        # running off the end of RAM wraps around to the start.
+        body.append("PC = 0x%04x" % (instructions[-1].next & 0xffff))
+        writes.add("PC")
+    body.append(("exit", None, cycles))
+    if instructions[-1].mnemonic == "int":
+        # software interrupts happen once everything's been written back.
+        body.append("state.interrupt(a_)")
+    return assemble(name, body, reads, writes, start, end), writes, end
+
+
+def assemble(name, body, reads, writes, start, end):
+    "Put together the lines of a block function."
+    registers = sorted((reads | writes) - set(["PC"]))
+    lines = ["def %s(state, registers, ram, changed):" % name]
+    if "hardware" in reads:
+        registers.remove("hardware")
+        lines.append("    hardware = state.cpu.hardware")
+    for r in registers:
+        lines.append("    %s = registers[%d]" % (r, slots[r]))
+    stored = sorted(writes - set(["PC"]))
+    for line in body:
+        if not isinstance(line, tuple):
+            lines.append("    " + line)
+            continue
+        # write everything back to the cpu; if this is an early exit,
+        # only do so if the block just wrote to itself.
+        _, pc, cycles = line
+        indent = "    "
+        if pc is not None:
+            lines.append("    if 0x%04x <= store < 0x%04x:" % (start, end))
+            indent = "        "
+        for r in stored:
+            lines.append(indent + "registers[%d] = %s" % (slots[r], r))
+        if pc is None:
+            lines.append(indent + "registers[%d] = PC" % PC)
+        else:
+            lines.append(indent + "registers[%d] = 0x%04x" % (PC, pc))
+        lines.append(indent + "state.cycles += %d" % cycles)
+        if pc is not None:
+            lines.append(indent + "return")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Counted STI/STD loops, worked out in closed form. The usual way to copy
+or fill memory on the DCPU-16 is something like
+
+    :loop STI [I], [J]      ; or STD, or STI [I], A to fill
+          IFN I, end        ; or J
+          SUB PC, 3         ; or SET PC, loop, or ADD PC, ...
+
+which goes around once per word. Once the STI has started, everything about
+the rest of the loop -- how many times it goes around, where I and J end up,
+how many cycles it takes -- can be worked out from the registers, so the cpu
+can do the whole thing with one slice.
+"""
+
+from sixteen.registers import I, J
+
+
+# the conditional operands that can be the loop's counter.
+counters = {0x06: I, 0x07: J}
+
+
+class CountedLoop(object):
+    "What's known about a counted loop before it runs."
+    def __init__(self, start, step, counter, end, copy, cost, jump_cost,
+            ex, exit):
+        # the address of the STI or STD and the address after the loop
+        self.start = start
+        self.exit = exit
+        # 1 for STI, -1 for STD
+        self.step = step
+        # the slot of the register that's compared, and what with
+        self.counter = counter
+        self.end = end
+        # whether it copies from [J], rather than filling
+        self.copy = copy
+        # the cycles for the STI or STD and the conditional, and for the jump
+        self.cost = cost
+        self.jump_cost = jump_cost
+        # what the jump leaves in EX, or None if it doesn't touch it
+        self.ex = ex
+
+    def iterations(self, registers):
+        "How many times the loop goes around, starting from some registers."
+        return ((self.end - registers[self.counter]) * self.step) & 0xffff \
+            or 0x10000
+
+    def cycles(self, iterations):
+        "How many cycles that many iterations take, skipping the last jump."
+        return (iterations * self.cost + (iterations - 1) * self.jump_cost
+            + 1)
+
+
+def literal(ram, entry, address):
+    "The value of an entry's a if it's a literal, or None."
+    if entry.a == 0x1f:
+        return ram[(address + 1) % len(ram)]
+    elif entry.a >= 0x20:
+        return (entry.a - 0x21) & 0xffff
+
+
+def counted_loop(table, ram, address):
+    """If `address` is right after the STI or STD of a counted loop, return a
+    CountedLoop for it; otherwise, None.
+    """
+    cells = len(ram)
+    test = table[ram[address]]
+    if (test.mnemonic != "ifn" or test.b not in counters or
+            address + test.length >= cells):
+        return None
+    end = literal(ram, test, address)
+    if end is None:
+        return None
+    at = address + test.length
+    jump = table[ram[at]]
+    target = literal(ram, jump, at)
+    exit = at + jump.length
+    if jump.op == 0 or jump.b != 0x1c or target is None or exit > cells:
+        return None
+    ex = None
+    if jump.mnemonic == "set":
+        start = target
+    elif jump.mnemonic == "sub":
+        start = (exit - target) & 0xffff
+        ex = 0xffff if exit < target else 0
+    elif jump.mnemonic == "add":
+        start = (exit + target) & 0xffff
+        ex = 1 if exit + target > 0xffff else 0
+    else:
+        return None
+    copy = table[ram[start]]
+    if (copy.mnemonic not in ("sti", "std") or copy.b != 0x0e or
+            start + copy.length != address):
+        return None
+    # copying from [J], or filling with anything the loop doesn't change
+    if copy.a != 0x0f and not (copy.a < 0x06 or copy.a == 0x1f or
+            copy.a >= 0x20):
+        return None
+    return CountedLoop(start, 1 if copy.mnemonic == "sti" else -1,
+        counters[test.b], end, copy.a == 0x0f, copy.cost + test.cost,
+        jump.cost, ex, exit)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+
+class Entry(object):
+    """What a first word means on any cpu with the same opcodes and values:
+    its fields, mnemonic, its values, its length and its cost.
+    `mnemonic` is None for illegal words.
+    """
+    __slots__ = ["word", "op", "b", "a", "mnemonic", "a_value", "b_value",
+        "length", "cost", "conditional"]
+
+    def __init__(self, word, op, b, a, mnemonic, a_value, b_value, length,
+            cost):
+        self.word = word
+        self.op, self.b, self.a = op, b, a
+        self.mnemonic = mnemonic
+        self.a_value = a_value
+        # None for special opcodes.
+        self.b_value = b_value
+        self.length = length
+        self.cost = cost
+        self.conditional = mnemonic is not None and mnemonic.startswith("if")
+
+    @property
+    def illegal(self):
+        "The number OpcodeError should complain about, or None if it's legal."
+        if self.mnemonic is None:
+            return self.b if self.op == 0 else self.op
+
+
+def build_table(operations, special_operations, values, costs):
+    "Decode every possible first word into a list of Entries."
+    table = []
+    append = table.append
+    # the parts of each word that only depend on a.
+    a_parts = [(values[a].as_a, int(values[a].consumes))
+            for a in xrange(0x40)]
+    for word in xrange(0x10000):
+        op = word & 0x1f
+        b = (word >> 5) & 0x1f
+        a = word >> 10
+        a_value, extra = a_parts[a]
+        if op == 0:
+            mnemonic = special_operations.get(b)
+            b_value = None
+        else:
+            mnemonic = operations.get(op)
+            b_value = values[b].as_b
+            extra += b_value.consumes
+        if mnemonic is None:
+            append(Entry(word, op, b, a, None, a_value, b_value, 1, 0))
+        else:
+            # each value that takes the next word takes another cycle, too.
+            append(Entry(word, op, b, a, mnemonic, a_value, b_value,
+                1 + extra, costs[mnemonic] + extra))
+    return table
+
+
+# tables that have been built, by the dictionaries they were built from.
+tables = {}
+
+
+def decode_table(operations, special_operations, values, costs):
+    """Get the table for some opcodes and values, building it the first time
+    it's asked for. Every cpu class that doesn't change these dictionaries
+    (even if it overrides the methods) gets the same table.
+    """
+    key = tuple(id(d) for d in (operations, special_operations, values,
+        costs))
+    found = tables.get(key)
+    if found is None:
+        table = build_table(operations, special_operations, values, costs)
+        # keep the dictionaries around so their ids aren't reused.
+        found = tables[key] = (table, (operations, special_operations,
+            values, costs))
+    return found[0]
+
+
+class Decoded(object):
+    """An instruction that's already been decoded, with everything needed to
+    run it again except for the words it consumes.
+    """
+    def __init__(self, word, mnemonic, method, a, b, length, cost):
+        self.word = word
+        self.mnemonic = mnemonic
+        # the bound method that runs this instruction
+        self.method = method
+        # the values; `b` is None for special opcodes.
+        self.a = a
+        self.b = b
+        # the number of words this takes up, including the first
+        self.length = length
+        # the number of cycles this takes, not counting skipping
+        self.cost = cost
+
+
+class InstructionCache(object):
+    """A cache of decoded instructions by address, and of the counted loops
+    (see sixteen.bulk) the instructions at each address end, if any. Writing
+    to an address throws away whatever got worked out from it, so
+    self-modifying code and loading new programs work as they should.
+    """
+    def __init__(self):
+        # a dictionary of addresses to Decoded instructions
+        self.entries = {}
+        # a dictionary of addresses to the CountedLoop whose STI or STD is
+        # right before them, or None
+        self.loops = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def invalidate(self, start, stop):
+        "Forget anything worked out from the words from `start` up to `stop`."
+        self.invalidations += forget(self.entries, start, stop)
+        if self.loops:
+            # a counted loop depends on the words from two before the
+            # address it's kept under up to four after it.
+            forget(self.loops, start - 3, stop + 2)
+
+    def clear(self):
+        self.invalidations += len(self.entries)
+        self.entries = {}
+        self.loops = {}
+
+    def stats(self):
+        "Return a dictionary of the hits, misses, and invalidations."
+        return {
+            "hits": self.hits, "misses": self.misses,
+            "invalidations": self.invalidations, "size": len(self.entries),
+        }
+
+
+def forget(entries, start, stop):
+    """Delete the keys from `start` up to `stop` from a dictionary keyed by
+    address, returning how many there were.
+    """
+    if not entries:
+        return 0
+    # don't go over every address of a big write if we needn't
+    if stop - start > len(entries):
+        addresses = [a for a in entries if start <= a < stop]
+    else:
+        addresses = [a for a in xrange(start, stop) if a in entries]
+    for address in addresses:
+        del entries[address]
+    return len(addresses)
@@ -3,103 +3,85 @@
 from sixteen.values import NextWord, NextWordPointer, RegisterValue, \
     RegisterPointer, RegisterPlusNextWord, Literal, POPorPUSH
 from sixteen.utilities import OpcodeError
-from sixteen.states import State
-from sixteen.bits import as_instruction, as_signed, from_signed
-from functools import wraps
-
-
-def signed(fn):
-    """A decorator for basic operations that casts the arguments to signed
-    (two's complement) integers and casts the single returned value back to
-    unsigned.
+from sixteen.states import State, Direct
+from sixteen.memory import RAM, PagedRAM
+from sixteen.cache import Decoded, InstructionCache, decode_table
+from sixteen.bits import as_signed, from_signed
+from sixteen.bulk import counted_loop
+from sixteen.scheduler import Scheduler
+from array import array
+from sixteen.registers import RegisterView, names, \
+    register_property, A, B, C, X, Y, I, J, PC, SP, EX, IA
+from itertools import chain
+
+
+class RunResult(object):
+    """What happened during `DCPU16.run`: why it stopped, and how many cycles
+    and instructions it took. `reason` is one of "cycles", "instructions",
+    "breakpoint", "until", "halt" or "error"; for "halt", `halt` is the Halt
+    that stopped it (see sixteen.halting), and for "error", `error` is the
+    OpcodeError.
     """
-    @set_value
-    @wraps(fn)
-    def signed_wrapper(self, state, b_unsigned, a_unsigned):
-        b = as_signed(b_unsigned)
-        a = as_signed(a_unsigned)
-        value = from_signed(fn(self, state, b, a))
-        # handle overflow for signed values
-        overflow, result = divmod(value, self.cells)
-        # NOTE: this clears overflow for all signed operations.
-        # this may be wrong; I don't care right now.
-        return value, overflow
+    def __init__(self, reason, cycles, instructions, error=None, halt=None):
+        self.reason = reason
+        self.cycles = cycles
+        self.instructions = instructions
+        self.error = error
+        self.halt = halt
 
-    return signed_wrapper
+    def __repr__(self):
+        return "<RunResult %s after %d instructions, %d cycles>" % (
+                self.reason, self.instructions, self.cycles)
 
 
-def set_value(fn):
-    """A decorator simplifying basic operations that set their `a` value and
-    possibly EX. Each should return a tuple of their value and, optionally,
-    the value for EX.
+class Snapshot(object):
+    """A cpu's registers, RAM, cycles and interrupt queue as they were at some
+    point; see `DCPU16.snapshot`. Devices aren't included.
     """
-    @wraps(fn)
-    def set_wrapper(self, state, b, a):
-        t = fn(self, state, b.get(), a.get())
-        if len(t) == 2:
-            state.registers["EX"] = t[1]
-        b.set(t[0])
-    return set_wrapper
-
-
-def conditional(fn):
-    """A decorator for wrapping conditional basic operations. The decorated
-    function should just return a boolean of whether to continue or to skip.
-    """
-    @wraps(fn)
-    def conditional_wrapper(self, state, b, a):
-        # initialize the values
-        if fn(self, state, b.get(), a.get()):
-            # if the predicate returns True, we continue as usuaul
-            return
-        else:
-            pc = state.registers["PC"]
-            while True:
-                state.cycles += 1
-                # run the next instruction so we can see how much it consumes
-                _, _, skip_state = self.get_instruction(pc)
-                pc = skip_state.registers["PC"]
-                # if it's a conditional, continue
-                if not self.is_conditional(skip_state.consumed[0]):
-                    break
-            # skip ahead to where that instruction stopped
-            state.registers["PC"] = pc
-    return conditional_wrapper
-
-
-def signed_conditional(fn):
-    @conditional
-    @wraps(fn)
-    def signed_conditional_wrapper(self, state, b, a):
-        return fn(self, state, as_signed(b), as_signed(a))
-    return signed_conditional_wrapper
+    def __init__(self, registers, ram, cycles, queuing, interrupt_queue):
+        self.registers = registers
+        self.ram = ram
+        self.cycles = cycles
+        self.queuing = queuing
+        self.interrupt_queue = interrupt_queue
 
 
 class DCPU16(object):
     # DCPU16 has 0x10000 cells
     cells = 0x10000
 
-    # a class-attribute list of all of the register names.
-    _registers = [
-        # basic registers
-        "A", "B", "C", "X", "Y", "Z", "I", "J",
-        # special registers
-        "PC", "SP", "EX", "IA"
-    ]
-
-    def __init__(self, hardware=None):
-        # make a dictionary of all the registers of this class, initializing
-        # them all to 0x0000.
-        self.registers = dict((r, 0x0000) for r in self._registers)
+    # a class-attribute list of all of the register names, in slot order.
+    _registers = names
+
+    def __init__(self, hardware=None, direct=False, paged=False, ram=None):
+        # the registers, by slot, all initialized to 0x0000; `registers` lets
+        # them be used like a dictionary keyed by name.
+        self.register_file = [0x0000] * len(self._registers)
+        self.registers = RegisterView(self.register_file)
         # initialize the hardware list
         self.hardware = hardware or []
-        # initialize the RAM
-        self.ram_init()
+        # initialize the RAM; paged RAM is slower to use, but cheaper to
+        # clone and snapshot, and only allocates the pages that get used.
+        self.paged = paged
+        if ram is None:
+            self.ram_init()
+        else:
+            self.ram_init(ram)
         # initialize the queue and queuing
         self.queuing = False
         self.interrupt_queue = []
         # initialize cycle counting
         self.cycles = 0
+        # whether `cycle` should change the registers and RAM in place rather
+        # than going through a State; see `step`.
+        self.direct = direct
+        # the bound method for every mnemonic, so that running an instruction
+        # doesn't have to look it up.
+        self.handlers = self.handler_table()
+        self._direct = None
+        self._state = None
+        # what decides when each device gets called
+        self.scheduler = Scheduler(self)
 
     def __getattr__(self, name):
         "If an attribute doesn't exist, try the registers."
@@ -109,9 +91,25 @@ class DCPU16(object):
         else:
             return r
 
-    def ram_init(self):
-        "A function that sets the RAM of this CPU to its initial values."
-        self.ram = [0x0000] * self.cells
+    # the cache of decoded instructions, if the RAM can keep it up to date.
+    cache = None
+
+    # how much the states `cycle` returns know about their instruction, from
+    # `states.details`. Nothing by default, since keeping track costs time;
+    # states from `get_instruction` always have the full detail.
+    detail = "none"
+
+    def ram_init(self, ram=None):
+        """A function that sets the RAM of this CPU to its initial values, or
+        to `ram` if it's given.
+        """
+        if ram is None:
+            ram = PagedRAM(self.cells) if self.paged else RAM(self.cells)
+        self.ram = ram
+        # the states kept for running instructions read the old RAM.
+        self._state = self._direct = None
+        self.cache = InstructionCache()
+        self.ram.watchers.append(self.cache.invalidate)
 
     values = {
         # POP/PUSH
@@ -138,48 +136,106 @@ class DCPU16(object):
     for n in xrange(0, 31):
         values[0x21 + n] = Literal(n)
 
+    def clone(self, hardware=None):
+        """A new cpu in the same state as this one, sharing as much of its
+        RAM as it can (see PagedRAM). Devices don't get copied; give the
+        clone its own, if it needs any.
+        """
+        cpu = type(self)(hardware, self.direct, self.paged, self.ram.clone())
+        cpu.restore(self.snapshot())
+        return cpu
+
+    def snapshot(self):
+        "Remember the state of this cpu, to `restore` later."
+        return Snapshot(self.register_tuple(), self.ram.snapshot(),
+            self.cycles, self.queuing, list(self.interrupt_queue))
+
+    def restore(self, snapshot):
+        "Put this cpu back the way it was when a snapshot was taken."
+        self.set_register_tuple(snapshot.registers)
+        self.ram.restore(snapshot.ram)
+        self.cycles = snapshot.cycles
+        self.queuing = snapshot.queuing
+        self.interrupt_queue[:] = snapshot.interrupt_queue
+
+    def register_tuple(self):
+        "Return the values of all the registers at once, in slot order."
+        return tuple(self.register_file)
+
+    def set_register_tuple(self, values):
+        """Set all the registers at once from values in slot order, like the
+        ones `register_tuple` returns.
+        """
+        if len(values) != len(self.register_file):
+            raise ValueError("expected %d registers, got %d" %
+                (len(self.register_file), len(values)))
+        self.register_file[:] = [value & 0xffff for value in values]
+
     def get_instruction(self, location=None):
-        state = State(self, location)
-        # unpack the opcode, a, and b
-        op, b, a = as_instruction(next(state.ram_iter))
-        # get the mnemonic and the method corresponding to it.
-        if op == 0:
-            mnemonic = self.special_operations.get(b)
-            if mnemonic is None:
-                raise OpcodeError(b, location)
-            a_value = self.values[a](state, True)
+        """Decode the instruction at `location` (or PC) for a look at it,
+        without running it or touching the instruction cache.
+        """
+        return self.decode(State(self, location), preview=True)
+
+    def decode(self, state, preview=False):
+        """Read an instruction from a state, returning its method and values.
+        Previews don't go through the instruction cache.
+        """
+        cache = None if preview else self.cache
+        pc = state.registers[PC]
+        if cache is None:
+            decoded = self.decode_word(state.ram[pc], pc)
+        else:
+            decoded = cache.entries.get(pc)
+            if decoded is None:
+                cache.misses += 1
+                decoded = self.decode_word(state.ram[pc], pc)
+                cache.entries[pc] = decoded
+            else:
+                cache.hits += 1
+        # consume the first word; the values consume the rest.
+        next(state.ram_iter)
+        state.decoded = decoded
+        a_value = state.a.bind(decoded.a)
+        if decoded.b is None:
             arguments = (a_value,)
-            state.dis = "{0} {1}".format(mnemonic, a_value.dis)
         else:
-            mnemonic = self.operations.get(op)
-            if mnemonic is None:
-                raise OpcodeError(op, location)
-            a_value = self.values[a](state, True)
-            b_value = self.values[b](state, False)
-            arguments = (b_value, a_value)
-            state.dis = "{0} {1}, {2}".format(mnemonic, b_value.dis,
-                    a_value.dis)
-        method = getattr(self, mnemonic)
-        # run the method and decide what changes to do.
-        return method, arguments, state
+            arguments = (state.b.bind(decoded.b), a_value)
+        return decoded.method, arguments, state
+
+    def decode_word(self, word, location=None):
+        "Decode the first word of an instruction, without running anything."
+        entry = (self.table or self.decode_table())[word]
+        if entry.mnemonic is None:
+            raise OpcodeError(entry.illegal, location)
+        return Decoded(word, entry.mnemonic, self.handlers[entry.mnemonic],
+                entry.a_value, entry.b_value, entry.length, entry.cost)
+
+    def handler_table(self):
+        """Return a dictionary of mnemonics to this cpu's bound methods for
+        them, including any a subclass overrides.
+        """
+        return dict((mnemonic, getattr(self, mnemonic)) for mnemonic in
+            chain(self.operations.itervalues(),
+                self.special_operations.itervalues()))
+
+    # the table of every first word decoded, shared by every cpu with the
+    # same opcodes and values; it's built the first time it's needed.
+    table = None
+
+    def decode_table(self):
+        "Return the table of decoded first words, building it if need be."
+        self.table = decode_table(self.operations, self.special_operations,
+                self.values, self.costs)
+        return self.table
 
     def cycle(self):
         "Run for one instruction, returning the executed instruction."
-        method, arguments, state = self.get_instruction()
+        if self.direct:
+            return self.step()
+        method, arguments, state = self.decode(self.state())
         method(state, *arguments)
-        # hand hardware interrupts to devices
-        for index in state.interrupts:
-            device = self.hardware[index]
-            device.on_interrupt(state.registers, state.ram)
-        # allow each of the devices to interrupt
-        #TODO: run queued interrupts
-        for device in self.hardware:
-            value = device.on_cycle(state.registers.changes, state.ram.changes)
-            if value is not None:
-                state.interrupt(value)
-        # if there's anything in the queue...
-        if state.interrupt_queue:
-            state.do_interrupt(state.interrupt_queue.pop())
+        self.run_hardware(state)
         # update queuing and the queue:
         self.interrupt_queue.extend(state.interrupt_queue)
         self.queuing = state.queuing
@@ -193,9 +249,130 @@ class DCPU16(object):
         self.cycles = state.cycles
         return state
 
-    def update_register(self, name, value):
+    def run(self, cycles=None, until=None, max_instructions=None,
+            breakpoints=(), step=None, detail=None, halts=(), strict=False):
+        """Run until something says to stop: once at least `cycles` cycles
+        have gone by, after `max_instructions` instructions, when PC gets to
+        one of `breakpoints`, when `until(cpu)` is true, or when there's an
+        illegal opcode. Returns a RunResult.
+
+        `step` is what to call to run an instruction; it defaults to `cycle`,
+        but a BlockCompiler's or Tracer's `step` works too, in which case
+        every block counts as one instruction and only the addresses blocks
+        start at can be breakpoints.
+
+        `halts` are Halts (see sixteen.halting) to check before every
+        instruction; if one says the program's finished, it stops there with
+        "halt". An illegal opcode otherwise stops it with "error", or, if
+        `strict` is true, raises the OpcodeError.
+
+        `detail`, if it's given, is what to use as the cpu's `detail` until
+        this returns.
+        """
+        if detail is not None and detail != self.detail:
+            kept, self.detail = self.detail, detail
+            try:
+                return self.run(cycles, until, max_instructions, breakpoints,
+                    step, halts=halts, strict=strict)
+            finally:
+                self.detail = kept
+        if self.bulk and (breakpoints or until is not None or halts):
+            # a whole counted loop at once would run straight past them.
+            self.bulk = False
+            try:
+                return self.run(cycles, until, max_instructions, breakpoints,
+                    step, halts=halts, strict=strict)
+            finally:
+                self.bulk = True
+        step = step or self.cycle
+        registers = self.register_file
+        started = self.cycles
+        budget = None if cycles is None else started + cycles
+        limit = -1 if max_instructions is None else max_instructions
+        breakpoints = frozenset(breakpoints)
+        n = 0
+        reason = error = halted = None
+        while reason is None:
+            if n == limit:
+                reason = "instructions"
+                break
+            if budget is not None and self.cycles >= budget:
+                reason = "cycles"
+                break
+            if halts:
+                pc = registers[PC]
+                word = self.ram[pc]
+                for halt in halts:
+                    if halt.check(self, pc, word):
+                        reason, halted = "halt", halt
+                        break
+                if reason is not None:
+                    break
+            try:
+                step()
+            except OpcodeError as e:
+                if strict:
+                    raise
+                reason, error = "error", e
+                break
+            n += 1
+            if breakpoints and registers[PC] in breakpoints:
+                reason = "breakpoint"
+            elif until is not None and until(self):
+                reason = "until"
+        return RunResult(reason, self.cycles - started, n, error, halted)
+
+    def step(self):
+        """Run for one instruction, changing the registers and RAM in place
+        rather than committing a State afterwards. The returned state can't be
+        used once the next instruction has started.
+        """
+        state = self.direct_state()
+        try:
+            method, arguments, _ = self.decode(state)
+            method(state, *arguments)
+        except:
+            # don't leave PC pointing past the bad instruction, or SP moved
+            # by its operands; the same as if a State had been thrown away.
+            state.registers.undo()
+            raise
+        return self.settle(state)
+
+    def state(self):
+        "Return this cpu's State, reset and ready for an instruction."
+        if self._state is None:
+            self._state = State(self)
+        return self._state.reset(detail=self.detail)
+
+    def direct_state(self):
+        "Return this cpu's Direct state, reset and ready for an instruction."
+        if self._direct is None:
+            self._direct = Direct(self)
+        return self._direct.reset(detail=self.detail)
+
+    def settle(self, state):
+        """Once something has run in place on a Direct state, let the devices
+        see it and catch the cpu up with its interrupts and cycles.
+        """
+        self.run_hardware(state)
+        self.interrupt_queue.extend(state.interrupt_queue)
+        self.queuing = state.queuing
+        self.cycles = state.cycles
+        return state
+
+    def run_hardware(self, state):
+        "Let the devices see a state after its instruction has run."
+        # hand out hardware interrupts, and let the devices that need to
+        # see the instruction interrupt.
+        if self.hardware:
+            self.scheduler.run(state)
+        # if there's anything in the queue...
+        if state.interrupt_queue:
+            state.do_interrupt(state.interrupt_queue.pop())
+
+    def update_register(self, slot, value):
         # use modulus to take overflow and underflow into account
-        self.registers[name] = value % self.cells
+        self.register_file[slot] = value % self.cells
 
     def update_ram(self, addr, value):
         # use modulus to take overflow and underflow into account
@@ -211,161 +388,271 @@ class DCPU16(object):
         0x1b: "sbx", 0x1e: "sti", 0x1f: "std"
     }
 
-    @set_value
+    # the number of cycles each operation takes, not counting its values or
+    # any skipping; these should agree with what the methods themselves add.
+    costs = {
+        "set": 1, "add": 2, "sub": 2, "mul": 2, "mli": 2, "div": 3, "dvi": 3,
+        "mod": 3, "mdi": 3, "AND": 1, "bor": 1, "xor": 1, "shr": 1, "asr": 1,
+        "shl": 1, "ifb": 2, "ifc": 2, "ife": 2, "ifn": 2, "ifg": 2, "ifa": 2,
+        "ifl": 2, "ifu": 2, "adx": 3, "sbx": 3, "sti": 2, "std": 2,
+        "jsr": 3, "int": 4, "iag": 1, "ias": 1, "rfi": 3, "iaq": 2,
+        "hwn": 2, "hwq": 4, "hwi": 4,
+    }
+
+    # each of these takes its operands, reads them, and writes whatever it
+    # works out -- EX before b, so that b wins when it's EX.
+
     def set(self, state, b, a):
         state.cycles += 1
-        return a,
+        b.set(a.get())
 
-    @set_value
     def add(self, state, b, a):
         state.cycles += 2
-        overflow, result = divmod(b + a, self.cells)
-        return result, int(overflow > 0)
+        overflow, result = divmod(b.get() + a.get(), self.cells)
+        state.registers[EX] = int(overflow > 0)
+        b.set(result)
 
-    @set_value
     def sub(self, state, b, a):
         state.cycles += 2
-        overflow, result = divmod(b - a, self.cells)
-        return result, overflow < 0 and 0xffff
+        overflow, result = divmod(b.get() - a.get(), self.cells)
+        state.registers[EX] = 0xffff if overflow < 0 else 0
+        b.set(result)
 
-    @set_value
     def mul(self, state, b, a):
         state.cycles += 2
-        overflow, result = divmod(b * a, self.cells)
-        return result, overflow
+        overflow, result = divmod(b.get() * a.get(), self.cells)
+        state.registers[EX] = overflow
+        b.set(result)
+
+    def set_signed(self, state, b, value):
+        """Write the result of a signed operation to b, and its overflow to
+        EX.
+        """
+        value = from_signed(value)
+        # NOTE: this clears overflow for all signed operations.
+        # this may be wrong; I don't care right now.
+        state.registers[EX] = value // self.cells
+        b.set(value)
 
-    @signed
     def mli(self, state, b, a):
         state.cycles += 2
-        return b * a
+        self.set_signed(state, b, as_signed(b.get()) * as_signed(a.get()))
 
-    @set_value
     def div(self, state, b, a):
         state.cycles += 3
-        if a == 0:
-            return 0, 0
+        b_value, a_value = b.get(), a.get()
+        if a_value == 0:
+            state.registers[EX] = 0
+            b.set(0)
         else:
-            return b // a, ((b << 16) // a) & 0xffff
+            state.registers[EX] = ((b_value << 16) // a_value) & 0xffff
+            b.set(b_value // a_value)
 
-    @signed
     def dvi(self, state, b, a):
         state.cycles += 3
-        return b // a
+        self.set_signed(state, b, as_signed(b.get()) // as_signed(a.get()))
 
-    @set_value
     def mod(self, state, b, a):
         state.cycles += 3
-        if a == 0:
-            return 0,
-        else:
-            return b % a,
+        b_value, a_value = b.get(), a.get()
+        b.set(0 if a_value == 0 else b_value % a_value)
 
-    @signed
     def mdi(self, state, b, a):
         state.cycles += 3
+        b_value, a_value = as_signed(b.get()), as_signed(a.get())
         # if notch changes it to true modulus, it'll be
-        # > return b % a
-        return b % a - a
+        # > b_value % a_value
+        self.set_signed(state, b, b_value % a_value - a_value)
 
-    @set_value
     def AND(self, state, b, a):
         state.cycles += 1
-        return b & a,
+        b.set(b.get() & a.get())
 
-    @set_value
     def bor(self, state, b, a):
         state.cycles += 1
-        return b | a,
+        b.set(b.get() | a.get())
 
-    @set_value
     def xor(self, state, b, a):
         state.cycles += 1
-        return b ^ a,
+        b.set(b.get() ^ a.get())
 
-    @set_value
     def shr(self, state, b, a):
         state.cycles += 1
-        return b >> a, ((b << 16) >> a) & 0xffff
+        b_value, a_value = b.get(), a.get()
+        state.registers[EX] = ((b_value << 16) >> a_value) & 0xffff
+        b.set(b_value >> a_value)
 
-    @signed
     def asr(self, state, b, a):
         state.cycles += 1
-        return b >> a
+        self.set_signed(state, b, as_signed(b.get()) >> as_signed(a.get()))
 
-    @set_value
     def shl(self, state, b, a):
         state.cycles += 1
-        overflow, result = divmod(b << a, self.cells)
-        return result, overflow
+        overflow, result = divmod(b.get() << a.get(), self.cells)
+        state.registers[EX] = overflow
+        b.set(result)
+
+    # the conditionals carry on as usual if their test passes, and `skip`
+    # otherwise.
 
-    @conditional
     def ifb(self, state, b, a):
         state.cycles += 2
-        return (b & a) != 0
+        if not b.get() & a.get():
+            self.skip(state)
 
-    @conditional
     def ifc(self, state, b, a):
         state.cycles += 2
-        return (b & a) == 0
+        if b.get() & a.get():
+            self.skip(state)
 
-    @conditional
     def ife(self, state, b, a):
         state.cycles += 2
-        return b == a
+        if b.get() != a.get():
+            self.skip(state)
 
-    @conditional
     def ifn(self, state, b, a):
         state.cycles += 2
-        return b != a
+        if b.get() == a.get():
+            self.skip(state)
 
-    @conditional
     def ifg(self, state, b, a):
         state.cycles += 2
-        return b > a
+        if not b.get() > a.get():
+            self.skip(state)
 
-    @signed_conditional
     def ifa(self, state, b, a):
         state.cycles += 2
-        return b > a
+        if not as_signed(b.get()) > as_signed(a.get()):
+            self.skip(state)
 
-    @conditional
     def ifl(self, state, b, a):
         state.cycles += 2
-        return b < a
+        if not b.get() < a.get():
+            self.skip(state)
 
-    @signed_conditional
     def ifu(self, state, b, a):
         state.cycles += 2
-        return b < a
+        if not as_signed(b.get()) < as_signed(a.get()):
+            self.skip(state)
+
+    def skip(self, state):
+        """Skip the next instruction after a failed conditional, and any
+        conditionals chained before it, a cycle each.
+        """
+        table = self.table or self.decode_table()
+        ram = state.ram
+        pc = state.registers[PC]
+        while True:
+            state.cycles += 1
+            # the first word says how long the instruction is
+            entry = table[ram[pc]]
+            if entry.mnemonic is None:
+                raise OpcodeError(entry.illegal, pc)
+            pc = (pc + entry.length) % self.cells
+            # if it's a conditional, continue
+            if not entry.conditional:
+                break
+        # skip ahead to where that instruction stopped
+        state.registers[PC] = pc
 
     def is_conditional(self, instruction):
-        o, b, a = as_instruction(instruction)
-        name = self.operations.get(o)
-        return name is not None and name.startswith("if")
+        return (self.table or self.decode_table())[instruction].conditional
 
-    @set_value
     def adx(self, state, b, a):
         state.cycles += 3
-        overflow, result = divmod(b + a + state.registers["EX"], self.cells)
-        return result, int(overflow > 0)
+        overflow, result = divmod(b.get() + a.get() + state.registers[EX],
+            self.cells)
+        state.registers[EX] = int(overflow > 0)
+        b.set(result)
 
-    @set_value
     def sbx(self, state, b, a):
         state.cycles += 3
-        overflow, result = divmod(b - a + state.registers["EX"], self.cells)
-        return result, overflow and 0xffff
+        overflow, result = divmod(b.get() - a.get() + state.registers[EX],
+            self.cells)
+        state.registers[EX] = 0xffff if overflow else 0
+        b.set(result)
 
     def sti(self, state, b, a):
+        if self.bulk and self.run_counted_loop(state, a):
+            return
         state.cycles += 2
         b.set(a.get())
-        state.registers["I"] += 1
-        state.registers["J"] += 1
+        state.registers[I] += 1
+        state.registers[J] += 1
 
     def std(self, state, b, a):
+        if self.bulk and self.run_counted_loop(state, a):
+            return
         state.cycles += 2
         b.set(a.get())
-        state.registers["I"] -= 1
-        state.registers["J"] -= 1
+        state.registers[I] -= 1
+        state.registers[J] -= 1
+
+    # whether counted STI/STD loops get run all at once; see sixteen.bulk.
+    # That makes a whole loop one instruction, so nothing can stop partway
+    # through one and devices only hear about it at the end; it's off unless
+    # you ask for it, and `run` turns it off for breakpoints, `until` and
+    # halts.
+    bulk = False
+
+    def run_counted_loop(self, state, a):
+        """If the STI or STD that's running starts a counted loop, run the
+        whole loop with one write, returning whether it did.
+        """
+        registers = state.registers
+        after = registers[PC]
+        loop = self.counted_loop(after)
+        if loop is None:
+            return False
+        n = loop.iterations(registers)
+        i, j = registers[I], registers[J]
+        # the lowest addresses written and read
+        if loop.step > 0:
+            low, source = i, j
+        else:
+            low, source = i - n + 1, j - n + 1
+        # don't wrap around, or write over the loop itself
+        if (low < 0 or low + n > self.cells or
+                (low < loop.exit and low + n > loop.start)):
+            return False
+        if loop.copy:
+            # or copy over what's still to be read
+            if (source < 0 or source + n > self.cells or
+                    (loop.step > 0 and j < i < j + n) or
+                    (loop.step < 0 and j - n < i < j)):
+                return False
+            values = self.ram[source:source + n]
+        else:
+            values = array("H", [a.get()]) * n
+        state.ram.write(low, values)
+        registers[I] = (i + n * loop.step) % self.cells
+        registers[J] = (j + n * loop.step) % self.cells
+        if n > 1 and loop.ex is not None:
+            registers[EX] = loop.ex
+        registers[PC] = loop.exit
+        # the STI's next word, if it had one, has already been counted.
+        state.cycles += loop.cycles(n) - int(a.value.consumes)
+        return True
+
+    def counted_loop(self, address):
+        """The CountedLoop whose STI or STD is right before an address, or
+        None if there isn't one there.
+        """
+        cache = self.cache
+        if cache is not None:
+            try:
+                return cache.loops[address]
+            except KeyError:
+                pass
+        loop = counted_loop(self.table or self.decode_table(), self.ram,
+            address)
+        if loop is not None and not all(getattr(type(self), m).im_func is
+                getattr(DCPU16, m).im_func for m in ("sti", "std", "ifn",
+                "set", "add", "sub")):
+            loop = None
+        if cache is not None:
+            cache.loops[address] = loop
+        return loop
 
     # a dict of nonbasic opcode numbers to mnemonics
     special_operations = {
@@ -377,22 +664,21 @@ class DCPU16(object):
         "Pass special opcodes to their methods."
         mnemonic = self.special_operations.get(o)
         if mnemonic is None:
-            raise OpcodeError(o, state.registers["PC"])
-        method = getattr(self, mnemonic)
-        return method(state, a)
+            raise OpcodeError(o, state.registers[PC])
+        return self.handlers[mnemonic](state, a)
 
     def jsr(self, state, a):
         state.cycles += 3
-        state.push(state.registers["PC"])
-        state.registers["PC"] = a.get()
+        state.push(state.registers[PC])
+        state.registers[PC] = a.get()
 
     def iag(self, state, a):
         state.cycles += 1
-        a.set(state.registers["IA"])
+        a.set(state.registers[IA])
 
     def ias(self, state, a):
         state.cycles += 1
-        state.registers["IA"] = a.get()
+        state.registers[IA] = a.get()
 
     def int(self, state, a):
         state.cycles += 4
@@ -402,8 +688,8 @@ class DCPU16(object):
     def rfi(self, state, a):
         state.cycles += 3
         state.queuing = False
-        state.registers["A"] = state.pop()
-        state.registers["PC"] = state.pop()
+        state.registers[A] = state.pop()
+        state.registers[PC] = state.pop()
 
     def iaq(self, state, a):
         state.cycles += 2
@@ -425,16 +711,24 @@ class DCPU16(object):
         if a < len(self.hardware):
             device = self.hardware[a]
             id_top, id_bottom = divmod(device.identifier, self.cells)
-            state.registers["B"] = id_top
-            state.registers["A"] = id_bottom
+            state.registers[B] = id_top
+            state.registers[A] = id_bottom
             # set C to version
-            state.registers["C"] = device.version % self.cells
+            state.registers[C] = device.version % self.cells
             m_top, m_bottom = divmod(device.manufacturer, self.cells)
-            state.registers["Y"] = m_top
-            state.registers["X"] = m_bottom
+            state.registers[Y] = m_top
+            state.registers[X] = m_bottom
 
     def hwi(self, state, a_value):
         state.cycles += 4
         a = a_value.get()
         if a < len(self.hardware):
             state.interrupts.append(a)
+
+
+# each register can be read and written as an attribute of a cpu, named in
+# upper or lower case, as in `cpu.pc` or `cpu.PC`.
+for slot, name in enumerate(names):
+    setattr(DCPU16, name, register_property(slot))
+    setattr(DCPU16, name.lower(), register_property(slot))
+del slot, name
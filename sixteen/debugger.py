@@ -3,8 +3,8 @@
 
 import readline
 from functools import wraps
-from sixteen.bits import as_instruction
 from sixteen.utilities import OpcodeError
+from sixteen.registers import names
 
 
 class Debugger(object):
@@ -17,6 +17,10 @@ class Debugger(object):
 	def __init__(self, cpu, keyboard):
 		"Given a cpu, initialize a Debugger."
 		self.cpu = cpu
+		# `step` shows what each instruction was and the words it took up
+		self.cpu.detail = "full"
+		# and steps through counted loops a word at a time
+		self.cpu.bulk = False
 		self.keyboard = keyboard
 		self.commands = {
 			"r": self.registers,
@@ -72,25 +76,34 @@ class Debugger(object):
 	@format_output
 	def registers(self, r=None):
 		if r == None:
-			return self.cpu.registers
+			return dict(zip(names, self.cpu.register_tuple()))
 		else:
 			return self.cpu.registers[r.upper()]
 
 	def continue_until(self, pc):
 		"Continue until PC is at the greater than the given address."
-		while True:
-			if self.cpu.registers["PC"] > self.parse_number(pc):
-				break
-			print self.step()
-		return "<<"
+		address = self.parse_number(pc)
+		if self.cpu.registers["PC"] > address:
+			return "<<"
+		return self.report(self.cpu.run(until=lambda cpu:
+			cpu.registers["PC"] > address))
 
 	def until(self, pc):
 		"Continue until PC is exactly equal to the given address."
-		while True:
-			if self.cpu.registers["PC"] == self.parse_number(pc):
-				break
-			print self.step()
-		return "<<"
+		address = self.parse_number(pc)
+		if self.cpu.registers["PC"] == address:
+			return "<<"
+		return self.report(self.cpu.run(breakpoints=[address]))
+
+	def report(self, result):
+		"Describe how a run went."
+		if result.error is not None:
+			return self.error + str(result.error)
+		if result.halt is not None:
+			return "<< halted at %r after %d instructions, %d cycles" % (
+				result.halt, result.instructions, result.cycles)
+		return "<< %d instructions, %d cycles" % (result.instructions,
+			result.cycles)
 
 	def parse_number(self, n):
 		i = int(n, base=16)
@@ -100,15 +113,14 @@ class Debugger(object):
 	def dis(self, addr):
 		"Given an address, disassemble the word there."
 		addr = self.parse_number(addr)
-		try:
-			# parse the opcodes and values out of the word
-			_, _, state = self.cpu.get_instruction(addr)
-			# print each opcode and its arguments
-			assembly = state.dis
-		# if there's an OpcodeError, pretend it's a DAT instruction.
-		except OpcodeError:
-			assembly = "DAT 0x%04x" % cpu.ram[addr]
-		return assembly
+		table = self.cpu.table or self.cpu.decode_table()
+		# if the first word isn't an instruction, pretend it's a DAT.
+		if table[self.cpu.ram[addr]].mnemonic is None:
+			return "DAT 0x%04x" % self.cpu.ram[addr]
+		# parse the opcodes and values out of the word
+		_, _, state = self.cpu.get_instruction(addr)
+		# print each opcode and its arguments
+		return state.dis
 
 	def jump(self, pc):
 		"Move the PC to a given address."
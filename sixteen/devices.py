@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 from collections import deque
+from math import ceil
+from time import time
 
 
 class Hardware(object):
@@ -14,6 +16,12 @@ class Hardware(object):
     of hardware of the CPU. this number is meant to be gotten with `HWN` (which
     sets A to the number of hardware devices) and `HWQ` (which gets information
     about the device at a specific ordinal number).
+
+    After that, the cpu only calls a device when it says it needs to be: its
+    `on_event` at the cycle `next_event` gives, and its `on_write_range` for
+    each run of writes to the memory `watched` gives (see sixteen.scheduler).
+    Devices that only define `on_cycle` get it called after every instruction
+    instead.
     """
     # the hardware id of the device
     identifier = 0x0000
@@ -27,6 +35,9 @@ class Hardware(object):
     # the name of the hardware.
     name = ""
 
+    # the Scheduler running this device, once a cpu has started running it.
+    scheduler = None
+
     def on_interrupt(self, registers, ram):
         """This gets called when a program does HWI, usually. It gets
         dictionaries of the current state's registers and RAM, which it can
@@ -34,15 +45,94 @@ class Hardware(object):
         """
         pass
 
+    def on_interrupt_at(self, registers, ram, cycles):
+        """What the cpu actually calls for HWI, with the cycle count after the
+        instruction too; devices that need to know when it happened can
+        override this instead of `on_interrupt`, which it calls otherwise.
+        """
+        return self.on_interrupt(registers, ram)
+
+    def on_event(self, cycles, changed_ram):
+        """This gets called once the cpu's cycle count has got to this
+        device's `next_event`; `cycles` is the cycle count after the
+        instruction that got it there, and `changed_ram` everything that
+        instruction wrote. If it returns a thing (an integer no greater than
+        0xffff, ideally), that thing gets used as the message for an
+        interrupt. It shouldn't modify the changed_ram.
+        """
+        pass
+
+    def on_write(self, region, offset, value):
+        """This gets called for every word written inside one of the ranges
+        `watched` gives, with that range's region, how far into it the word
+        is, and the new value. Returning a thing interrupts, the same as
+        `on_event`.
+        """
+        pass
+
+    def on_write_range(self, region, offset, values):
+        """This gets called instead of `on_write` with each run of
+        consecutive words written inside one of the ranges `watched` gives,
+        so a copy that writes a whole range at once is only one call.
+        Returning a thing interrupts; unless it's overridden, it calls
+        `on_write` for each word, and interrupts with the last thing any of
+        those returned.
+        """
+        message = None
+        for n, value in enumerate(values):
+            result = self.on_write(region, offset + n, value)
+            if result is not None:
+                message = result
+        return message
+
     def on_cycle(self, changed_registers, changed_ram):
-        """This gets called for each device for each cycle. If it returns a
-        thing (an integer no greater than 0xffff, ideally), that thing gets
-        used as the message for an intterupt. That should be its only means of
-        communicating to the CPU; it shouldn't modify the changed_ram or
-        changed_registers.
+        """The old way of hearing about instructions: devices that define this
+        and not `on_event` get it called after every instruction, and
+        returning a thing interrupts, the same way. It shouldn't modify the
+        changed_ram or changed_registers.
         """
         pass
 
+    def next_event(self, cycles):
+        """The earliest cycle count at which this needs its `on_event` (or
+        `on_cycle`) called when nothing in the cpu has changed, or None if
+        that's never; `cycles` is the cpu's cycle count now. Besides deciding
+        when devices get called, this lets idle loops get skipped (see
+        halting.FastForward). Unless a device says otherwise, anything that
+        only has `on_cycle` might do something right away.
+        """
+        return cycles if polled(self) else None
+
+    def watched(self):
+        """A list of ranges of addresses this wants its `on_write` called for
+        writes to, each as (start, stop, region). `region` is anything that
+        tells them apart; it can be left off, making it None.
+        """
+        return []
+
+    def reschedule(self):
+        """Tell the cpu running this that its `next_event` or `watched` might
+        have changed, after something outside the cpu has changed it.
+        """
+        if self.scheduler is not None:
+            self.scheduler.reschedule(self)
+
+
+def polled(device):
+    """Whether a device only has the old `on_cycle`, and so needs calling after
+    every instruction.
+    """
+    cls = type(device)
+    on_cycle = getattr(cls, "on_cycle", None)
+    if on_cycle is None or on_cycle.im_func is Hardware.on_cycle.im_func:
+        return False
+    for name in ("on_event", "on_write", "on_write_range"):
+        method = getattr(cls, name, None)
+        if method is not None and method.im_func is not getattr(Hardware,
+                name).im_func:
+            return False
+    return True
+
 
 class Keyboard(Hardware):
     """
@@ -108,8 +198,107 @@ class Keyboard(Hardware):
         """
         self.queue.append(keypress)
         self.changed = True
-        
-    def on_cycle(self, changed_registers, changed_ram):
+        self.reschedule()
+
+    def on_event(self, cycles, changed_ram):
         if self.interrupt_mode and len(self.queue) and self.changed:
             self.changed = False
             return self.message
+
+    def next_event(self, cycles):
+        "Keypresses come from outside; until then there's nothing to do."
+        if self.interrupt_mode and len(self.queue) and self.changed:
+            return cycles
+
+
+class Clock(Hardware):
+    """
+    Name: Generic Clock (compatible)
+    ID: 0x12d0b402
+    Version: 1
+
+    Ticks happen at exact cycle counts, worked out from the DCPU-16's 100 kHz
+    clock, so nothing gets done between them; and since `next_event` says
+    when the next one is, a program sleeping until the clock interrupts can
+    be skipped straight there (see halting.FastForward). Given `wall=True`,
+    it ticks with the real time instead, as told by `now`, for running
+    things interactively.
+    """
+    name = "Generic Clock (compatible)"
+    identifier = 0x12d0b402
+    version = 1
+
+    # the cpu's cycles per second
+    hz = 100000
+
+    def __init__(self, wall=False, now=time):
+        self.wall = wall
+        self.now = now
+        # the clock ticks 60 / divider times a second; 0 is off.
+        self.divider = 0
+        # the cycle count (or the time, with `wall`) it was last set at
+        self.start = None
+        # ticks since it was last set
+        self.ticks = 0
+        self.interrupt_mode = False
+        self.message = None
+
+    def on_interrupt_at(self, registers, ram, cycles):
+        """From the docs for the generic clock:
+        0 - The B register is read, and the clock will tick 60/B times per
+            second. If B is 0, the clock is turned off.
+        1 - Store number of ticks elapsed since last call to 0 in C register
+        2 - If register B is non-zero, turn on interrupts with message B. If B
+            is zero, disable interrupts
+        """
+        if registers["A"] == 0:
+            self.divider = registers["B"]
+            self.ticks = 0
+            self.start = self.now() if self.wall else cycles
+        elif registers["A"] == 1:
+            # a tick due this very cycle counts, even though `on_event` only
+            # hears about it after this.
+            ticks = self.elapsed(cycles) if self.divider else self.ticks
+            registers["C"] = ticks & 0xffff
+        elif registers["A"] == 2:
+            if registers["B"] == 0:
+                self.interrupt_mode = False
+            else:
+                self.interrupt_mode = True
+                self.message = registers["B"]
+
+    def tick(self, n):
+        """The cycle count of the `n`th tick since the clock was set, rounded
+        up so it's never early.
+        """
+        return self.start + -(-n * self.divider * self.hz // 60)
+
+    def elapsed(self, cycles):
+        "How many ticks there have been by some cycle count."
+        if self.wall:
+            return int((self.now() - self.start) * 60 / self.divider)
+        return (cycles - self.start) * 60 // (self.divider * self.hz)
+
+    def next_event(self, cycles):
+        "The next tick, or None if the clock's off."
+        if not self.divider:
+            return None
+        if self.wall:
+            # guess how many cycles that'll be, going at full speed, but
+            # check at least every 60th of a second's worth in case the cpu
+            # isn't; if it's early, on_event just asks again.
+            left = (self.start + (self.ticks + 1) * self.divider / 60.0 -
+                self.now())
+            return cycles + max(0, min(int(ceil(left * self.hz)),
+                self.hz // 60))
+        return self.tick(self.ticks + 1)
+
+    def on_event(self, cycles, changed_ram):
+        if not self.divider:
+            return None
+        ticks = self.elapsed(cycles)
+        if ticks > self.ticks:
+            # if more than one went by at once, that's still one interrupt.
+            self.ticks = ticks
+            if self.interrupt_mode:
+                return self.message
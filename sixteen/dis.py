@@ -1,18 +1,20 @@
 # -*- coding: utf-8 -*-
 
 from sixteen.dcpu16 import DCPU16
-from sixteen.utilities import OpcodeError
+from sixteen.registers import PC
 
 
 def disassembler(cpu=None):
     "An iterator that disassembles."
     cpu = cpu or DCPU16()
+    table = cpu.table or cpu.decode_table()
     n = 0
     while any(cpu.ram[n:]):
-        try:
-            _, _, state = cpu.get_instruction(n)
-            yield state.dis, n
-            n = state.registers["PC"]
-        except OpcodeError:
+        # only decode the rest of the instruction if the first word's legal
+        if table[cpu.ram[n]].mnemonic is None:
             yield "dat 0x%04x" % cpu.ram[n], n
             n += 1
+            continue
+        _, _, state = cpu.get_instruction(n)
+        yield state.dis, n
+        n = state.registers[PC]
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""Superinstructions: a few common runs of instructions that the block
+compiler can translate as one, doing less work than it would one at a time
+while taking exactly as many cycles.
+
+- a conditional followed by a jump to a constant address is a branch, so the
+  block doesn't have to end at the conditional and start again at the jump;
+  counted loops (ADD / IFN / SET PC) become a single block.
+- runs of SET PUSH, x move SP once and write the stack with one slice.
+- runs of SET x, POP read the stack with one slice.
+- runs of STI [I], [J] copy with one slice.
+
+Each of these has a fast path and falls back to the usual code when the
+stack or the copy would wrap around the end of RAM (or the copy overlaps
+itself in a way a slice wouldn't get right). `pairs` and `profile` count
+which instructions follow each other in a program, to see what's worth
+fusing.
+"""
+
+from sixteen.utilities import OpcodeError
+from sixteen.registers import PC
+from sixteen.blocks import BlockCompiler, Instruction, conditions, find, names, \
+    operand, standard, tokens, translate_instruction
+
+
+class Fused(object):
+    "Some instructions that get translated together."
+    conditional = False
+    ends_block = False
+
+    def __init__(self, instructions, start):
+        self.instructions = instructions
+        # where the block these are in starts.
+        self.start = start
+        self.address = instructions[0].address
+        self.next = instructions[-1].next
+        self.cost = sum(i.cost for i in instructions)
+        self.mnemonic = "%s x%d" % (self.kind, len(instructions))
+
+    @classmethod
+    def matches(cls, instruction):
+        "Whether an instruction can be part of one of these."
+        return False
+
+    def fallback(self):
+        "The usual lines for each instruction, indented to go after an else."
+        lines, written = [], set()
+        for instruction in self.instructions:
+            more, _, more_written, _ = translate_instruction(instruction)
+            lines.extend("    " + line for line in more)
+            written |= more_written
+        return lines, written
+
+    def finish(self, lines, written, stores):
+        "Put together what `translate` returns."
+        fallback, also_written = self.fallback()
+        lines = lines + ["else:"] + fallback
+        used = set(tokens("\n".join(lines))) & names
+        return lines, used, written | also_written, stores
+
+
+class Pushes(Fused):
+    kind = "push"
+
+    @classmethod
+    def matches(cls, instruction):
+        # SET PUSH, with a register (not SP or PC), EX or a literal
+        a = instruction.a
+        return (instruction.mnemonic == "set" and instruction.b == 0x18 and
+                (a < 0x08 or a in (0x1d, 0x1f) or a >= 0x20))
+
+    def translate(self):
+        n = len(self.instructions)
+        values = [operand(i.a, True, i.a_word, "a").read
+                for i in reversed(self.instructions)]
+        lines = [
+            "if SP >= %d:" % n,
+            "    SP -= %d" % n,
+            "    ram[SP:SP + %d] = [%s]" % (n, ", ".join(values)),
+        ]
+        for k, value in enumerate(values):
+            lines.append("    changed[SP + %d] = %s" % (k, value))
+        lines.append("    store = max(SP, 0x%04x) if SP + %d > 0x%04x else -1"
+                % (self.start, n, self.start))
+        return self.finish(lines, set(["SP"]), True)
+
+
+class Pops(Fused):
+    kind = "pop"
+
+    @classmethod
+    def matches(cls, instruction):
+        # SET a register (not SP or PC) or EX, POP
+        return (instruction.mnemonic == "set" and instruction.a == 0x18 and
+                (instruction.b < 0x08 or instruction.b == 0x1d))
+
+    def translate(self):
+        n = len(self.instructions)
+        targets = [operand(i.b, False, None, "b").register
+                for i in self.instructions]
+        lines = [
+            "if SP <= 0x%04x:" % (0x10000 - n),
+            "    %s, = ram[SP:SP + %d]" % (", ".join(targets), n),
+            "    SP = (SP + %d) & 0xffff" % n,
+        ]
+        return self.finish(lines, set(targets + ["SP"]), False)
+
+
+class Copies(Fused):
+    kind = "sti"
+
+    @classmethod
+    def matches(cls, instruction):
+        # STI [I], [J]
+        return (instruction.mnemonic == "sti" and instruction.b == 0x0e and
+                instruction.a == 0x0f)
+
+    def translate(self):
+        n = len(self.instructions)
+        lines = [
+            # a slice copies the same as a word at a time unless it would
+            # read something it's already written.
+            "if (I <= 0x%04x and J <= 0x%04x and (I <= J or I >= J + %d)):"
+                % (0x10000 - n, 0x10000 - n, n),
+            "    ram[I:I + %d] = ram[J:J + %d]" % (n, n),
+            "    changed.update(zip(xrange(I, I + %d), ram[I:I + %d]))"
+                % (n, n),
+            "    store = max(I, 0x%04x) if I + %d > 0x%04x else -1"
+                % (self.start, n, self.start),
+            "    I = (I + %d) & 0xffff" % n,
+            "    J = (J + %d) & 0xffff" % n,
+        ]
+        return self.finish(lines, set(["I", "J"]), True)
+
+
+class Branch(Fused):
+    "A conditional and the constant jump after it."
+    kind = "branch"
+    ends_block = True
+
+    def __init__(self, instructions, start):
+        Fused.__init__(self, instructions, start)
+        # the jump only costs anything if it's taken
+        self.cost = instructions[0].cost
+        self.mnemonic = "%s / %s pc" % (instructions[0].mnemonic,
+                instructions[1].mnemonic)
+
+    @classmethod
+    def jumps(cls, cpu, instruction):
+        "Whether an instruction is a jump to an address known ahead of time."
+        return (not instruction.special and instruction.b == 0x1c and
+                instruction.mnemonic in ("set", "add", "sub") and
+                (instruction.a == 0x1f or instruction.a >= 0x20) and
+                instruction.next <= cpu.cells and
+                standard(cpu, instruction.mnemonic))
+
+    def translate(self):
+        test, jump = self.instructions
+        lines, used, written, stores = translate_instruction(test)
+        jumping, jump_used, jump_written, _ = translate_instruction(jump)
+        lines.append("if %s:" % conditions[test.mnemonic])
+        lines.extend("    " + line for line in jumping)
+        lines.extend([
+            "    state.cycles += %d" % jump.cost,
+            "else:",
+            # skipping the jump takes a cycle.
+            "    PC = 0x%04x" % (jump.next & 0xffff),
+            "    state.cycles += 1",
+        ])
+        written = written | jump_written | set(["PC"])
+        return lines, used | jump_used, written, stores
+
+
+# the kinds of runs of instructions that get fused.
+runs = [Pushes, Pops, Copies]
+
+
+def fuse(cpu, instructions):
+    "Replace any runs of instructions in a block that can be fused."
+    items = []
+    n = 0
+    while n < len(instructions):
+        instruction = instructions[n]
+        for kind in runs:
+            if not kind.matches(instruction):
+                continue
+            run = [instruction]
+            while (n + len(run) < len(instructions) and
+                    kind.matches(instructions[n + len(run)])):
+                run.append(instructions[n + len(run)])
+            if len(run) > 1:
+                items.append(kind(run, instructions[0].address))
+                n += len(run)
+                break
+        else:
+            items.append(instruction)
+            n += 1
+            continue
+    # a block that ends in a conditional might be a branch.
+    last = items[-1] if items else None
+    if last is not None and last.conditional and last.next < cpu.cells:
+        try:
+            jump = Instruction(cpu, last.next)
+        except OpcodeError:
+            jump = None
+        if jump is not None and Branch.jumps(cpu, jump):
+            items[-1] = Branch([last, jump], instructions[0].address)
+    return items
+
+
+class FusingCompiler(BlockCompiler):
+    "A BlockCompiler that fuses superinstructions in each block."
+    def find(self, address):
+        return fuse(self.cpu, find(self.cpu, address, self.limit))
+
+
+def end_of_code(cpu):
+    "The address after the last word of RAM that isn't zero."
+    end = len(cpu.ram)
+    while end and not cpu.ram[end - 1]:
+        end -= 1
+    return end
+
+
+def pairs(cpu, start=0, end=None):
+    """Count the pairs of mnemonics that follow each other in some code,
+    reading it straight through. Returns a dictionary of pairs to counts.
+    """
+    table = cpu.table or cpu.decode_table()
+    if end is None:
+        end = end_of_code(cpu)
+    counts = {}
+    previous = None
+    address = start
+    while address < end:
+        entry = table[cpu.ram[address]]
+        if previous is not None and entry.mnemonic is not None:
+            pair = previous, entry.mnemonic
+            counts[pair] = counts.get(pair, 0) + 1
+        previous = entry.mnemonic
+        address += entry.length
+    return counts
+
+
+def profile(cpu, **conditions):
+    """Run a cpu (taking the same arguments as `run`, except `until`),
+    counting the pairs of mnemonics that run one after another. Returns the
+    RunResult and a dictionary of pairs to counts.
+    """
+    table = cpu.table or cpu.decode_table()
+    ram, registers = cpu.ram, cpu.register_file
+    counts = {}
+    # the last instruction that ran and the one about to
+    seen = [None, table[ram[registers[PC]]].mnemonic]
+
+    def count(cpu):
+        previous, ran = seen
+        if previous is not None:
+            pair = previous, ran
+            counts[pair] = counts.get(pair, 0) + 1
+        seen[:] = ran, table[ram[registers[PC]]].mnemonic
+        return False
+
+    return cpu.run(until=count, **conditions), counts
+
+
+def report(counts, top=None):
+    "Format some pair counts, most frequent first."
+    ordered = sorted(counts.iteritems(), key=lambda (pair, n): (-n, pair))
+    return ["%8d  %s / %s" % (n, first, second)
+            for (first, second), n in ordered[:top]]
@@ -1,4 +1,209 @@
 # -*- coding: utf-8 -*-
+"""Noticing when a program is just waiting. A busy-wait loop -- `SUB PC, 1`,
+`SET PC, self`, or a few conditionals polling a flag before jumping back --
+can't change anything but PC, so every trip around it is the same as the
+last until a device does something. `FastForward` notices these and moves
+the cycle counter straight on to the next thing that could make a
+difference, rather than running every iteration.
+
+Programs that are finished usually say so in one of a few ways: running into
+an illegal word (most often 0x0000), a particular word put there to stop on,
+a `SUB PC, 1` that never goes anywhere, or running off the end of the code.
+The `Halt`s here can be given to `run` to stop when the next instruction is
+one of those, as a "halt" rather than an "error".
+"""
+
+from sixteen.utilities import OpcodeError
+from sixteen.registers import PC
+from sixteen.blocks import Instruction, standard
+from sixteen.aot import constant, successors
+
+
+def idle_loop(cpu, address, limit=8):
+    """If the code at `address` is a loop that can only ever change PC --
+    at most `limit` instructions, all of them conditionals that don't push
+    or pop, ending in a jump back to `address` with a literal -- return the
+    address after the jump. Otherwise, return None.
+    """
+    start = address
+    for _ in xrange(limit):
+        try:
+            instruction = Instruction(cpu, address)
+        except OpcodeError:
+            return None
+        if (instruction.next > cpu.cells or
+                not standard(cpu, instruction.mnemonic)):
+            return None
+        if instruction.conditional:
+            # POP and PUSH move SP, even in a conditional.
+            if 0x18 in (instruction.a, instruction.b):
+                return None
+        elif (not instruction.special and instruction.b == 0x1c and
+                instruction.mnemonic in ("set", "add", "sub") and
+                constant(instruction) is not None):
+            if successors(cpu, instruction) != [start]:
+                return None
+            return instruction.next
+        else:
+            return None
+        address = instruction.next
+    return None
+
+
+class FastForward(object):
+    """Runs a cpu a step at a time, skipping idle loops. Every time one goes
+    around without changing any registers, the cpu's cycle counter is
+    moved forward by as many whole iterations as it can be without passing
+    the next device event (see Hardware.next_event) or the end of `run`'s
+    budget; then it keeps running as usual. `skipped` counts the cycles
+    that didn't need running.
+
+    Skipped iterations don't count as instructions for `run`, and `until`
+    only gets checked after the ones that actually ran.
+    """
+    # the most instructions an idle loop can have.
+    limit = 8
+
+    def __init__(self, cpu, step=None, limit=None):
+        self.cpu = cpu
+        # what runs an instruction (or a block).
+        self.inner = step or cpu.cycle
+        if limit is not None:
+            self.limit = limit
+        self.skipped = 0
+        self.skips = 0
+        # the cycle count `run` is going to stop at, if there is one.
+        self.budget = None
+        # addresses to the words that were checked there and the end of
+        # the idle loop there, or None
+        self.loops = {}
+        # the start and end of the idle loop we're in, and the cycles and
+        # registers when it last got back to its start
+        self.mark = None
+
+    def step(self):
+        "Run an instruction, fast-forwarding if it finished an idle loop."
+        cpu = self.cpu
+        registers = cpu.register_file
+        before = registers[PC]
+        state = self.inner()
+        pc = registers[PC]
+        mark = self.mark
+        if mark is not None:
+            start, end, cycles, snapshot = mark
+            if pc == start:
+                # if nothing's changed, the next time around is the same.
+                if registers == snapshot:
+                    self.fast_forward(cpu.cycles - cycles)
+                self.mark = None
+            elif not start <= pc < end:
+                self.mark = None
+        # loops only get back to their start by jumping backwards.
+        if self.mark is None and pc <= before:
+            end = self.loop(pc)
+            if end is not None:
+                self.mark = pc, end, cpu.cycles, list(registers)
+        return state
+
+    def run(self, cycles=None, **conditions):
+        "Like the cpu's `run`, skipping idle loops."
+        self.budget = None if cycles is None else self.cpu.cycles + cycles
+        try:
+            return self.cpu.run(cycles=cycles, step=self.step, **conditions)
+        finally:
+            self.budget = None
+
+    def loop(self, address):
+        "The end of the idle loop at an address, or None if there isn't one."
+        # an instruction is at most three words long.
+        words = tuple(self.cpu.ram[address:address + 3 * self.limit])
+        cached = self.loops.get(address)
+        if cached is not None and cached[0] == words:
+            return cached[1]
+        end = idle_loop(self.cpu, address, self.limit)
+        self.loops[address] = words, end
+        return end
+
+    def fast_forward(self, period):
+        """Skip whole trips around the loop, each `period` cycles long, up to
+        the next device event or the budget.
+        """
+        cpu = self.cpu
+        # an interrupt that's waiting to happen could happen any time.
+        if cpu.interrupt_queue and not cpu.queuing:
+            return
+        now = cpu.cycles
+        room = []
+        if self.budget is not None:
+            room.append(self.budget - now)
+        for device in cpu.hardware:
+            event = device.next_event(now)
+            if event is not None:
+                # stop short of it, so the device sees it on time.
+                room.append(event - now - 1)
+        # with nothing coming, there's nothing to skip to.
+        if not room:
+            return
+        iterations = min(room) // period
+        if iterations > 0:
+            cpu.cycles += iterations * period
+            self.skipped += iterations * period
+            self.skips += 1
+
+
+class Halt(object):
+    """Something that says a program is finished, checked before each
+    instruction `run` runs (or each block, for a BlockCompiler's `step`).
+    """
+    def check(self, cpu, pc, word):
+        """Whether the program's finished, with PC at `pc` and the first word
+        of the next instruction being `word`.
+        """
+        return False
+
+    def __repr__(self):
+        return "<%s>" % type(self).__name__
+
+
+class HaltWord(Halt):
+    "Stop at a particular word; by default, 0x0000."
+    def __init__(self, word=0x0000):
+        self.word = word
+
+    def check(self, cpu, pc, word):
+        return word == self.word
+
+    def __repr__(self):
+        return "<HaltWord 0x%04x>" % self.word
+
+
+class IllegalOpcode(Halt):
+    "Stop at any illegal first word, without raising an OpcodeError."
+    def check(self, cpu, pc, word):
+        return (cpu.table or cpu.decode_table())[word].mnemonic is None
+
+
+class SelfLoop(Halt):
+    "Stop at a jump to itself, like `SUB PC, 1` or `:self SET PC, self`."
+    def check(self, cpu, pc, word):
+        entry = (cpu.table or cpu.decode_table())[word]
+        # most instructions aren't even jumps
+        if entry.op == 0 or entry.b != 0x1c:
+            return False
+        return idle_loop(cpu, pc, limit=1) is not None
+
+
+class OutsideRange(Halt):
+    "Stop once PC leaves the addresses from `start` up to `stop`."
+    def __init__(self, start, stop):
+        self.start = start
+        self.stop = stop
+
+    def check(self, cpu, pc, word):
+        return not self.start <= pc < self.stop
+
+    def __repr__(self):
+        return "<OutsideRange 0x%04x-0x%04x>" % (self.start, self.stop)
 
 
 class LoopDetecting(object):
@@ -7,21 +212,8 @@ class LoopDetecting(object):
     stop = False
 
     def is_looping(self):
-        if self.stop:
-            return True
-        else:
-            # if it's sub pc, 1, it's a loop...
-            if self.RAM[self.registers["PC"]] == 0x85c3:
-                self.stop = True
-            else:
-                # if it's something like :loop set pc, loop, it's a loop
-                first = self.RAM[self.registers["PC"]]
-                # handle over/underflow.
-                if self.registers["PC"] + 1 > len(self.RAM) - 1:
-                    second = self.RAM[0]
-                else:
-                    second = self.RAM[self.registers["PC"] + 1]
-                if first == 0x7dc1 and second == self.registers["PC"]:
-                    self.stop = True
-            return self.stop
-
+        # if it's sub pc, 1 or :loop set pc, loop, it's a loop...
+        if not self.stop:
+            pc = self.registers["PC"]
+            self.stop = idle_loop(self, pc, limit=1) is not None
+        return self.stop
@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+"""Running lots of copies of a DCPU-16 at once, for when the same program
+needs running over and over with different registers or RAM. Every machine's
+registers are a row of an N×12 matrix and its RAM a row of an N×65536 one;
+each step, the machines that are at the same PC with the same instruction
+there get it decoded once and run together with NumPy. Machines that go
+different ways just end up in different groups.
+
+This needs NumPy. It does what DCPU16 does, with no hardware attached;
+anything that would make DCPU16 raise an exception (illegal opcodes, DVI or
+MDI by zero, ASR by a negative amount) stops that machine with an "error".
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from sixteen.utilities import OpcodeError
+from sixteen.dcpu16 import DCPU16, RunResult
+from sixteen.memory import words
+from sixteen.registers import names, A, I, J, PC, SP, EX, IA
+
+
+class Register(object):
+    "A register of each machine in a group."
+    def __init__(self, rows, slot):
+        self.rows = rows
+        self.slot = slot
+
+    def get(self, machines):
+        return machines.registers[self.rows, self.slot].astype(numpy.int64)
+
+    def set(self, machines, values, keep=None):
+        rows = self.rows if keep is None else self.rows[keep]
+        values = values if keep is None else values[keep]
+        machines.registers[rows, self.slot] = values & 0xffff
+
+
+class Pointer(object):
+    """A register plus an offset as a pointer; it's worked out whenever it's
+    used, since the register might have changed since it was fetched.
+    """
+    def __init__(self, rows, slot, offset=0):
+        self.rows = rows
+        self.slot = slot
+        self.offset = offset
+
+    def addresses(self, machines):
+        return (machines.registers[self.rows, self.slot].astype(numpy.int64)
+            + self.offset) & 0xffff
+
+    def get(self, machines):
+        return machines.ram[self.rows, self.addresses(machines)].astype(
+            numpy.int64)
+
+    def set(self, machines, values, keep=None):
+        addresses = self.addresses(machines)
+        rows = self.rows
+        if keep is not None:
+            rows, addresses, values = rows[keep], addresses[keep], values[keep]
+        machines.ram[rows, addresses] = values & 0xffff
+
+
+class Address(Pointer):
+    "An address that was known when it was fetched: a next word, or PUSH."
+    def __init__(self, rows, addresses):
+        self.rows = rows
+        self.fixed = addresses
+
+    def addresses(self, machines):
+        return self.fixed
+
+
+class Constant(object):
+    "A literal, or a value that's already been read (POP)."
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, machines):
+        return self.values
+
+    def set(self, machines, values, keep=None):
+        # setting literals is silently ignored.
+        pass
+
+
+def signed(x):
+    return numpy.where(x >= 0x8000, x - 0x10000, x)
+
+
+def from_signed(x):
+    # this is what bits.from_signed does, even past sixteen bits.
+    return numpy.where(x >= 0, x, ((-x) ^ 0xffff) + 1)
+
+
+def signed_result(value):
+    "What a signed operation leaves in b and in EX."
+    value = from_signed(value)
+    return value, value >> 16
+
+
+def never(b):
+    return numpy.zeros(len(b), dtype=bool)
+
+
+# each operation takes b, a and EX and returns what to put in b, what to
+# put in EX (or None to leave it alone), and which machines can't do it.
+def set_(b, a, ex):
+    return a, None, never(b)
+
+
+def add(b, a, ex):
+    t = b + a
+    return t, (t > 0xffff).astype(numpy.int64), never(b)
+
+
+def sub(b, a, ex):
+    t = b - a
+    return t, numpy.where(t < 0, 0xffff, 0), never(b)
+
+
+def mul(b, a, ex):
+    t = b * a
+    return t, t >> 16, never(b)
+
+
+def mli(b, a, ex):
+    value, overflow = signed_result(signed(b) * signed(a))
+    return value, overflow, never(b)
+
+
+def div(b, a, ex):
+    zero = a == 0
+    a = numpy.where(zero, 1, a)
+    return (numpy.where(zero, 0, b // a),
+        numpy.where(zero, 0, (b << 16) // a), never(b))
+
+
+def dvi(b, a, ex):
+    a = signed(a)
+    zero = a == 0
+    value, overflow = signed_result(signed(b) // numpy.where(zero, 1, a))
+    return value, overflow, zero
+
+
+def mod(b, a, ex):
+    zero = a == 0
+    return numpy.where(zero, 0, b % numpy.where(zero, 1, a)), None, never(b)
+
+
+def mdi(b, a, ex):
+    a = signed(a)
+    zero = a == 0
+    a = numpy.where(zero, 1, a)
+    value, overflow = signed_result(signed(b) % a - a)
+    return value, overflow, zero
+
+
+def and_(b, a, ex):
+    return b & a, None, never(b)
+
+
+def bor(b, a, ex):
+    return b | a, None, never(b)
+
+
+def xor(b, a, ex):
+    return b ^ a, None, never(b)
+
+
+def shr(b, a, ex):
+    a = numpy.minimum(a, 63)
+    return b >> a, (b << 16) >> a, never(b)
+
+
+def asr(b, a, ex):
+    a = signed(a)
+    negative = a < 0
+    value, overflow = signed_result(signed(b) >>
+        numpy.clip(a, 0, 63))
+    return value, overflow, negative
+
+
+def shl(b, a, ex):
+    t = b << numpy.minimum(a, 32)
+    return t, t >> 16, never(b)
+
+
+def adx(b, a, ex):
+    t = b + a + ex
+    return t, (t > 0xffff).astype(numpy.int64), never(b)
+
+
+def sbx(b, a, ex):
+    t = b - a + ex
+    return t, numpy.where((t >> 16) != 0, 0xffff, 0), never(b)
+
+
+operations = {
+    "set": set_, "add": add, "sub": sub, "mul": mul, "mli": mli, "div": div,
+    "dvi": dvi, "mod": mod, "mdi": mdi, "AND": and_, "bor": bor, "xor": xor,
+    "shr": shr, "asr": asr, "shl": shl, "adx": adx, "sbx": sbx,
+}
+
+# what can make a machine fail, for each operation that can
+failures = {
+    "dvi": lambda: ZeroDivisionError("integer division or modulo by zero"),
+    "mdi": lambda: ZeroDivisionError("integer division or modulo by zero"),
+    "asr": lambda: ValueError("negative shift count"),
+}
+
+conditions = {
+    "ifb": lambda b, a: (b & a) != 0,
+    "ifc": lambda b, a: (b & a) == 0,
+    "ife": lambda b, a: b == a,
+    "ifn": lambda b, a: b != a,
+    "ifg": lambda b, a: b > a,
+    "ifa": lambda b, a: signed(b) > signed(a),
+    "ifl": lambda b, a: b < a,
+    "ifu": lambda b, a: signed(b) < signed(a),
+}
+
+
+class Lockstep(object):
+    """`n` DCPU-16s running the same way at the same time. They all start
+    out as copies of `cpu`, if there is one, or blank; after that, change
+    `registers` (indexed by machine and slot) and `ram` (by machine and
+    address) to give them different inputs.
+    """
+    cells = DCPU16.cells
+
+    def __init__(self, n, cpu=None):
+        if numpy is None:
+            raise ImportError("running in lockstep needs numpy")
+        self.n = n
+        self.registers = numpy.zeros((n, len(names)), dtype=numpy.uint16)
+        self.ram = numpy.zeros((n, self.cells), dtype=numpy.uint16)
+        self.cycles = numpy.zeros(n, dtype=numpy.int64)
+        self.queuing = numpy.zeros(n, dtype=bool)
+        # the decode table, and the parts of it that skipping needs
+        self.table = DCPU16().decode_table()
+        self.lengths = numpy.array([e.length for e in self.table])
+        self.conditional = numpy.array([e.conditional for e in self.table])
+        self.legal = numpy.array([e.mnemonic is not None for e in self.table])
+        if cpu is not None:
+            self.registers[:] = cpu.register_file
+            self.ram[:] = numpy.frombuffer(cpu.ram[:], dtype=numpy.uint16)
+            self.cycles[:] = cpu.cycles
+            self.queuing[:] = cpu.queuing
+
+    def load(self, data, offset=0, bigendian=True):
+        "Load the same program (as bytes) into every machine."
+        loaded = numpy.frombuffer(words(data, bigendian),
+            dtype=numpy.uint16)[:self.cells - offset]
+        self.ram[:, offset:offset + len(loaded)] = loaded
+        return len(loaded)
+
+    def machine(self, index):
+        "A DCPU16 in the state one of the machines is in."
+        cpu = DCPU16()
+        cpu.ram[:] = self.ram[index].tolist()
+        cpu.register_file[:] = self.registers[index].tolist()
+        cpu.cycles = int(self.cycles[index])
+        cpu.queuing = bool(self.queuing[index])
+        return cpu
+
+    def run(self, cycles=None, max_instructions=None, breakpoints=()):
+        """Run every machine until it has to stop, the same way `DCPU16.run`
+        does; returns a list of RunResults, one for each.
+        """
+        started = self.cycles.copy()
+        budget = None if cycles is None else started + cycles
+        count = numpy.zeros(self.n, dtype=numpy.int64)
+        reasons = [None] * self.n
+        errors = [None] * self.n
+        active = numpy.ones(self.n, dtype=bool)
+        breakpoints = numpy.array(sorted(set(breakpoints)), dtype=numpy.int64)
+
+        def stop(rows, reason):
+            for row in rows:
+                reasons[row] = reason
+            active[rows] = False
+
+        while active.any():
+            if max_instructions is not None:
+                stop(numpy.flatnonzero(active & (count == max_instructions)),
+                    "instructions")
+            if budget is not None:
+                stop(numpy.flatnonzero(active & (self.cycles >= budget)),
+                    "cycles")
+            rows = numpy.flatnonzero(active)
+            if not len(rows):
+                break
+            failed = self.step(rows)
+            for row, error in failed.iteritems():
+                errors[row] = error
+                stop([row], "error")
+            ran = rows[active[rows]]
+            count[ran] += 1
+            if len(breakpoints):
+                pcs = self.registers[ran, PC].astype(numpy.int64)
+                stop(ran[numpy.in1d(pcs, breakpoints)], "breakpoint")
+        return [RunResult(reasons[i], int(self.cycles[i] - started[i]),
+            int(count[i]), errors[i]) for i in xrange(self.n)]
+
+    def step(self, rows):
+        """Run an instruction on each of some machines, returning a dict of
+        the ones that couldn't to their exceptions.
+        """
+        pcs = self.registers[rows, PC].astype(numpy.int64)
+        keys = (pcs << 16) | self.ram[rows, pcs]
+        order = numpy.argsort(keys, kind="mergesort")
+        keys, rows = keys[order], rows[order]
+        starts = numpy.flatnonzero(numpy.diff(keys)) + 1
+        failed = {}
+        for group, key in zip(numpy.split(rows, starts),
+                keys[numpy.concatenate(([0], starts))]):
+            failed.update(self.execute(int(key >> 16), int(key & 0xffff),
+                group))
+        return failed
+
+    def operand(self, code, is_a, rows, pc):
+        "Fetch a value for some machines, returning it and the new PCs."
+        registers, ram = self.registers, self.ram
+        if code < 0x08:
+            return Register(rows, code), pc
+        elif code < 0x10:
+            return Pointer(rows, code - 0x08), pc
+        elif code < 0x18:
+            word = ram[rows, pc].astype(numpy.int64)
+            return Pointer(rows, code - 0x10, word), (pc + 1) & 0xffff
+        elif code == 0x18:
+            sp = registers[rows, SP].astype(numpy.int64)
+            if is_a:
+                # POP
+                value = ram[rows, sp].astype(numpy.int64)
+                registers[rows, SP] = (sp + 1) & 0xffff
+                return Constant(value), pc
+            # PUSH
+            sp = (sp - 1) & 0xffff
+            registers[rows, SP] = sp
+            return Address(rows, sp), pc
+        elif code == 0x19:
+            return Pointer(rows, SP), pc
+        elif code == 0x1a:
+            word = ram[rows, pc].astype(numpy.int64)
+            return Pointer(rows, SP, word), (pc + 1) & 0xffff
+        elif code in (0x1b, 0x1c, 0x1d):
+            return Register(rows, {0x1b: SP, 0x1c: PC, 0x1d: EX}[code]), pc
+        elif code == 0x1e:
+            word = ram[rows, pc].astype(numpy.int64)
+            return Address(rows, word), (pc + 1) & 0xffff
+        elif code == 0x1f:
+            return Constant(ram[rows, pc].astype(numpy.int64)), \
+                (pc + 1) & 0xffff
+        return Constant(numpy.full(len(rows), (code - 0x21) & 0xffff,
+            dtype=numpy.int64)), pc
+
+    def execute(self, address, word, rows):
+        """Run the instruction at `address`, starting with `word`, on some
+        machines; returns a dict of the ones that failed to their exceptions.
+        """
+        entry = self.table[word]
+        if entry.mnemonic is None:
+            return dict((row, OpcodeError(entry.illegal, address))
+                for row in rows)
+        registers = self.registers
+        # if anything goes wrong, the machine stays as it was.
+        saved = registers[rows].copy()
+        cycles = numpy.full(len(rows), entry.cost, dtype=numpy.int64)
+        bad = never(rows)
+        errors = {}
+        pc = numpy.full(len(rows), (address + 1) & 0xffff, dtype=numpy.int64)
+        a, pc = self.operand(entry.a, True, rows, pc)
+        if entry.op == 0:
+            registers[rows, PC] = pc
+            self.special(entry.mnemonic, a, rows)
+        else:
+            b, pc = self.operand(entry.b, False, rows, pc)
+            registers[rows, PC] = pc
+            mnemonic = entry.mnemonic
+            if mnemonic in conditions:
+                passed = conditions[mnemonic](b.get(self), a.get(self))
+                skipped, bad, errors = self.skip(rows, ~passed)
+                cycles += skipped
+            elif mnemonic in ("sti", "std"):
+                b.set(self, a.get(self))
+                step = 1 if mnemonic == "sti" else -1
+                for slot in (I, J):
+                    registers[rows, slot] = (registers[rows, slot].astype(
+                        numpy.int64) + step) & 0xffff
+            else:
+                ex = registers[rows, EX].astype(numpy.int64)
+                value, overflow, bad = operations[mnemonic](b.get(self),
+                    a.get(self), ex)
+                keep = ~bad
+                if overflow is not None:
+                    registers[rows[keep], EX] = overflow[keep] & 0xffff
+                b.set(self, value, keep)
+                for row in rows[bad]:
+                    errors[row] = failures[mnemonic]()
+        if bad.any():
+            registers[rows[bad]] = saved[bad]
+        self.cycles[rows[~bad]] += cycles[~bad]
+        return errors
+
+    def skip(self, rows, skipping):
+        """Skip instructions for the machines whose conditional failed, the
+        way DCPU16 does. Returns the cycles that took, which machines hit an
+        illegal instruction and their OpcodeErrors.
+        """
+        registers, ram = self.registers, self.ram
+        pc = registers[rows, PC].astype(numpy.int64)
+        cycles = numpy.zeros(len(rows), dtype=numpy.int64)
+        bad = never(rows)
+        errors = {}
+        skipping = skipping.copy()
+        while skipping.any():
+            which = numpy.flatnonzero(skipping)
+            found = ram[rows[which], pc[which]].astype(numpy.int64)
+            cycles[which] += 1
+            legal = self.legal[found]
+            for n, word in zip(which[~legal], found[~legal]):
+                errors[rows[n]] = OpcodeError(self.table[word].illegal,
+                    int(pc[n]))
+                bad[n] = True
+            skipping[which[~legal]] = False
+            which, found = which[legal], found[legal]
+            pc[which] = (pc[which] + self.lengths[found]) & 0xffff
+            skipping[which] = self.conditional[found]
+        registers[rows, PC] = pc
+        return cycles, bad, errors
+
+    def push(self, rows, values):
+        registers = self.registers
+        sp = (registers[rows, SP].astype(numpy.int64) - 1) & 0xffff
+        registers[rows, SP] = sp
+        self.ram[rows, sp] = values & 0xffff
+
+    def pop(self, rows):
+        registers = self.registers
+        sp = registers[rows, SP].astype(numpy.int64)
+        registers[rows, SP] = (sp + 1) & 0xffff
+        return self.ram[rows, sp].astype(numpy.int64)
+
+    def special(self, mnemonic, a, rows):
+        "Run a special instruction; there's no hardware attached."
+        registers = self.registers
+        if mnemonic == "jsr":
+            self.push(rows, registers[rows, PC].astype(numpy.int64))
+            registers[rows, PC] = a.get(self) & 0xffff
+        elif mnemonic == "iag":
+            a.set(self, registers[rows, IA].astype(numpy.int64))
+        elif mnemonic == "ias":
+            registers[rows, IA] = a.get(self) & 0xffff
+        elif mnemonic == "int":
+            message = a.get(self)
+            on = registers[rows, IA] != 0
+            rows, message = rows[on], message[on]
+            # an interrupt while queuing gets A as its message straight away
+            old = registers[rows, A].astype(numpy.int64)
+            message = numpy.where(self.queuing[rows], old, message)
+            self.queuing[rows] = True
+            self.push(rows, registers[rows, PC].astype(numpy.int64))
+            self.push(rows, old)
+            registers[rows, A] = message & 0xffff
+            registers[rows, PC] = registers[rows, IA]
+        elif mnemonic == "rfi":
+            self.queuing[rows] = False
+            registers[rows, A] = self.pop(rows)
+            registers[rows, PC] = self.pop(rows)
+        elif mnemonic == "iaq":
+            self.queuing[rows] = a.get(self) != 0
+        elif mnemonic == "hwn":
+            a.set(self, numpy.zeros(len(rows), dtype=numpy.int64))
+        # hwq and hwi do nothing without any hardware.
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+import sys
+from array import array
+from itertools import chain
+
+
+def words(data, bigendian=True):
+    """Turn a string of bytes -- or anything else with the buffer interface,
+    like an mmap -- into an array of words. A trailing odd byte is ignored.
+    """
+    if len(data) % 2:
+        data = buffer(data, 0, len(data) - 1)
+    loaded = array("H")
+    loaded.fromstring(data)
+    # arrays are in the machine's byte order
+    if bigendian != (sys.byteorder == "big"):
+        loaded.byteswap()
+    return loaded
+
+
+def as_words(values):
+    "Make an array of words out of some values, truncating them to 16 bits."
+    if isinstance(values, array) and values.typecode == "H":
+        return values
+    return array("H", (v & 0xffff for v in values))
+
+
+class Memory(object):
+    "What every kind of RAM can do, given indexing and slicing."
+    def load(self, data, offset=0, bigendian=True):
+        """Copy a program (as bytes, or an mmap) in starting at `offset`, all
+        at once; returns the number of words loaded.
+        """
+        loaded = words(data, bigendian)[:len(self) - offset]
+        self[offset:offset + len(loaded)] = loaded
+        return len(loaded)
+
+
+class RAM(Memory, array):
+    """An array of words that tells its watchers whenever it gets written to.
+    Each watcher is a function that gets called with the first address written
+    and the address after the last one. Anything stored gets truncated to
+    sixteen bits, and it can't change size.
+
+    Snapshots and clones of this are copies of the whole thing; see PagedRAM
+    for ones that share what they can.
+    """
+    def __new__(cls, cells):
+        return array.__new__(cls, "H", "\0\0" * cells)
+
+    def __init__(self, cells):
+        self.watchers = []
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = as_words(value)
+            if len(value) != len(xrange(*index.indices(len(self)))):
+                raise ValueError("can't change the size of RAM")
+            array.__setitem__(self, index, value)
+            if self.watchers:
+                start, stop, _ = index.indices(len(self))
+                for watcher in self.watchers:
+                    watcher(start, stop)
+        else:
+            # watchers get the address itself, not how far from the end it is
+            if index < 0:
+                index += len(self)
+            array.__setitem__(self, index, value & 0xffff)
+            if self.watchers:
+                for watcher in self.watchers:
+                    watcher(index, index + 1)
+
+    def __setslice__(self, i, j, values):
+        values = as_words(values)
+        i, j, _ = slice(i, j).indices(len(self))
+        if len(values) != max(j - i, 0):
+            raise ValueError("can't change the size of RAM")
+        array.__setslice__(self, i, j, values)
+        if self.watchers:
+            for watcher in self.watchers:
+                watcher(i, i + len(values))
+
+    def clone(self):
+        "A new RAM with the same contents (and no watchers)."
+        ram = RAM(len(self))
+        array.__setslice__(ram, 0, len(self), self)
+        return ram
+
+    def snapshot(self):
+        "Something `restore` can put this RAM back the way it is now with."
+        return self[:]
+
+    def restore(self, snapshot):
+        "Go back to a snapshot, copying the whole thing."
+        self[:] = snapshot
+
+    @property
+    def resident(self):
+        "How many bytes the words take up."
+        return len(self) * self.itemsize
+
+
+# the number of words in a page of PagedRAM is 2 ** page_bits.
+page_bits = 10
+page_size = 1 << page_bits
+page_mask = page_size - 1
+
+# every page nobody's written to yet; PagedRAM never writes to it, since it
+# isn't any PagedRAM's own.
+zero_page = array("H", "\0\0" * page_size)
+
+
+class PagedRAM(Memory):
+    """RAM split into pages, which can be shared between clones of it and
+    snapshots of it until one of them writes to a page; then that one gets
+    its own copy. So cloning, snapshotting and restoring only cost as much
+    as the number of pages written since.
+
+    Pages start out as the same page of zeros, so a new PagedRAM is sparse:
+    a page only gets allocated the first time something's written to it, and
+    `resident` only counts those.
+
+    Otherwise this works like RAM -- watchers, truncating to sixteen bits,
+    slices, a fixed size.
+    """
+    typecode = "H"
+    itemsize = 2
+
+    def __init__(self, cells, pages=None):
+        self.cells = cells
+        if pages is None:
+            pages = [zero_page] * (cells // page_size)
+        self.pages = list(pages)
+        # whether each page is this RAM's own, rather than shared; shared
+        # ones get copied before they're written to.
+        self.owned = [False] * len(self.pages)
+        self.watchers = []
+
+    def __len__(self):
+        return self.cells
+
+    def __getitem__(self, index):
+        try:
+            return self.pages[index >> page_bits][index & page_mask]
+        except TypeError:
+            if not isinstance(index, slice):
+                raise
+        start, stop, step = index.indices(self.cells)
+        if step != 1:
+            return array("H", (self[i] for i in xrange(start, stop, step)))
+        words = array("H")
+        for n, offset, count in self.spans(start, stop):
+            words.extend(self.pages[n][offset:offset + count])
+        return words
+
+    def __setitem__(self, index, value):
+        try:
+            n = index >> page_bits
+        except TypeError:
+            if not isinstance(index, slice):
+                raise
+            return self.set_slice(index, value)
+        if index < 0:
+            index += self.cells
+            n = index >> page_bits
+        if not self.owned[n]:
+            self.own(n)
+        self.pages[n][index & page_mask] = value & 0xffff
+        if self.watchers:
+            for watcher in self.watchers:
+                watcher(index, index + 1)
+
+    def set_slice(self, index, values):
+        start, stop, step = index.indices(self.cells)
+        values = as_words(values)
+        addresses = xrange(start, stop, step)
+        if len(values) != len(addresses):
+            raise ValueError("can't change the size of RAM")
+        if not len(values):
+            return
+        if step != 1:
+            for address, value in zip(addresses, values):
+                n = address >> page_bits
+                if not self.owned[n]:
+                    self.own(n)
+                self.pages[n][address & page_mask] = value
+            start, stop = min(addresses), max(addresses) + 1
+        else:
+            done = 0
+            for n, offset, count in self.spans(start, stop):
+                if not self.owned[n]:
+                    self.own(n)
+                self.pages[n][offset:offset + count] = \
+                    values[done:done + count]
+                done += count
+        for watcher in self.watchers:
+            watcher(start, stop)
+
+    def spans(self, start, stop):
+        "The page, offset and length of each part of a range of addresses."
+        while start < stop:
+            n, offset = start >> page_bits, start & page_mask
+            count = min(page_size - offset, stop - start)
+            yield n, offset, count
+            start += count
+
+    def own(self, n):
+        "Make page `n` this RAM's own copy."
+        self.pages[n] = self.pages[n][:]
+        self.owned[n] = True
+
+    def __iter__(self):
+        return chain.from_iterable(list(self.pages))
+
+    @property
+    def resident(self):
+        """How many bytes the pages that have been written to take up,
+        including any shared with clones or snapshots.
+        """
+        pages = set(id(page) for page in self.pages if page is not zero_page)
+        return len(pages) * page_size * self.itemsize
+
+    def tolist(self):
+        return list(self)
+
+    def __eq__(self, other):
+        if isinstance(other, PagedRAM):
+            return len(self) == len(other) and all(mine is theirs or
+                mine == theirs for mine, theirs in zip(self.pages,
+                other.pages))
+        return self[:] == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def share(self):
+        "From now on, copy every page before writing to it."
+        self.owned = [False] * len(self.pages)
+
+    def clone(self):
+        "A new PagedRAM with the same contents (and no watchers)."
+        self.share()
+        return PagedRAM(self.cells, self.pages)
+
+    def snapshot(self):
+        "Something `restore` can put this RAM back the way it is now with."
+        self.share()
+        return tuple(self.pages)
+
+    def restore(self, snapshot):
+        """Go back to a snapshot, telling the watchers about every page that
+        changed.
+        """
+        for n, page in enumerate(snapshot):
+            if self.pages[n] is not page:
+                self.pages[n] = page
+                for watcher in self.watchers:
+                    watcher(n << page_bits, (n + 1) << page_bits)
+        self.share()
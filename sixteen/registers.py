@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""The register file. A cpu keeps its registers in a list indexed by slot,
+so the parts that run instructions never have to hash a name; everything else
+can use a RegisterView, which works like a dictionary keyed by name.
+"""
+
+
+# the names of the registers, in slot order.
+names = ["A", "B", "C", "X", "Y", "Z", "I", "J", "PC", "SP", "EX", "IA"]
+
+# the slot of each register
+A, B, C, X, Y, Z, I, J, PC, SP, EX, IA = range(len(names))
+slots = dict((name, slot) for slot, name in enumerate(names))
+
+
+class RegisterView(object):
+    """Something indexed by slot (a register file, or a state's registers)
+    seen as a dictionary keyed by register name.
+    """
+    def __init__(self, file):
+        self.file = file
+
+    def __getitem__(self, name):
+        return self.file[slots[name]]
+
+    def __setitem__(self, name, value):
+        self.file[slots[name]] = value
+
+    def get(self, name, default=None):
+        slot = slots.get(name)
+        return default if slot is None else self.file[slot]
+
+    def __iter__(self):
+        return iter(names)
+
+    def __len__(self):
+        return len(names)
+
+    def __contains__(self, name):
+        return name in slots
+
+    def keys(self):
+        return list(names)
+
+    def values(self):
+        return [self.file[slot] for slot in xrange(len(names))]
+
+    def iteritems(self):
+        return ((name, self.file[slot]) for slot, name in enumerate(names))
+
+    def items(self):
+        return list(self.iteritems())
+
+    def copy(self):
+        return dict(self.iteritems())
+
+    def __eq__(self, other):
+        if isinstance(other, RegisterView):
+            other = other.copy()
+        return self.copy() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+def register_property(slot):
+    """A property for something with a `register_file`, reading and writing
+    the register in `slot`.
+    """
+    def get(self):
+        return self.register_file[slot]
+
+    def set(self, value):
+        self.register_file[slot] = value & 0xffff
+    return property(get, set, doc="The %s register." % names[slot])
+
+
+def named(changes):
+    "Turn a dictionary of slots to values into one of names to values."
+    return dict((names[slot], value) for slot, value in changes.iteritems())
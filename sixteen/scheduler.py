@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""Deciding which devices need to hear about an instruction. Rather than
+calling every device after every instruction, each one says when it next
+needs attention (`Hardware.next_event`) and which addresses it wants to hear
+about writes to (`Hardware.watched`); the scheduler keeps a heap of the
+upcoming events and only calls a device's `on_event` when one of them is due,
+and hands each write to mapped memory straight to the device that mapped it,
+through a MemoryMap.
+
+Devices that only have the old `on_cycle` still get called after every
+instruction, the way they always were.
+"""
+
+from heapq import heappush, heappop
+from sixteen.devices import Hardware, polled
+from sixteen.registers import RegisterView, named
+
+
+class MemoryMap(object):
+    """Which devices have mapped which ranges of memory, indexed a page at a
+    time: finding who owns an address (if anyone) takes one lookup, and
+    mapping or unmapping a range only touches its own pages.
+    """
+    # each page is 2 ** bits words.
+    bits = 8
+
+    def __init__(self, cells=0x10000):
+        # each page's list of (start, stop, owner, region) for every range
+        # that overlaps it, or None if there aren't any.
+        self.pages = [None] * (cells >> self.bits)
+        self.mask = len(self.pages) - 1
+        # each owner's ranges, as (start, stop, region)
+        self.ranges = {}
+
+    def spanned(self, start, stop):
+        "The numbers of the pages a range overlaps."
+        return xrange(start >> self.bits,
+            (min(stop, len(self.pages) << self.bits) - 1 >> self.bits) + 1)
+
+    def map(self, owner, ranges):
+        """Make `ranges` -- (start, stop) or (start, stop, region) -- the only
+        ones `owner` has mapped.
+        """
+        self.unmap(owner)
+        ranges = [tuple(r) + (None,) * (3 - len(r)) for r in ranges]
+        ranges = [r for r in ranges if r[0] < r[1]]
+        if not ranges:
+            return
+        self.ranges[owner] = ranges
+        for start, stop, region in ranges:
+            for n in self.spanned(start, stop):
+                if self.pages[n] is None:
+                    self.pages[n] = []
+                self.pages[n].append((start, stop, owner, region))
+
+    def unmap(self, owner):
+        "Forget whatever `owner` has mapped."
+        for start, stop, _ in self.ranges.pop(owner, ()):
+            for n in self.spanned(start, stop):
+                entries = [e for e in self.pages[n] or () if e[2] != owner]
+                self.pages[n] = entries or None
+
+    def find(self, address):
+        "Return (owner, region, offset) for each range including `address`."
+        entries = self.pages[(address >> self.bits) & self.mask] or ()
+        return [(owner, region, address - start)
+            for start, stop, owner, region in entries
+            if start <= address < stop]
+
+    def __nonzero__(self):
+        return bool(self.ranges)
+
+
+def consecutive(words):
+    """Split some (offset, value) pairs into runs of consecutive offsets,
+    as (offset, values).
+    """
+    runs = []
+    for offset, value in sorted(words):
+        if runs and runs[-1][0] + len(runs[-1][1]) == offset:
+            runs[-1][1].append(value)
+        else:
+            runs.append((offset, [value]))
+    return runs
+
+
+def write_range(device, region, offset, values):
+    """Tell a device about a run of writes, a word at a time if it isn't
+    Hardware and doesn't know about runs; returns whatever it says to
+    interrupt with.
+    """
+    if hasattr(device, "on_write_range"):
+        return device.on_write_range(region, offset, values)
+    return Hardware.on_write_range.im_func(device, region, offset, values)
+
+
+class Scheduler(object):
+    "Runs a cpu's devices when they need running."
+    def __init__(self, cpu):
+        self.cpu = cpu
+        # the hardware list this was set up for, and how long it was
+        self.hardware = None
+        self.count = 0
+
+    def adopt(self):
+        "Set up for the cpu's hardware as it is now."
+        hardware = self.hardware = self.cpu.hardware
+        self.count = len(hardware)
+        # the indices of devices with only `on_cycle`
+        self.polled = []
+        # the cycles each of the other devices is next due at, by index
+        self.due = {}
+        # a heap of events, as (cycles, index); ones whose cycles don't match
+        # `due` any more have been superseded.
+        self.events = []
+        # the memory the devices have mapped, owned by index
+        self.memory = MemoryMap(self.cpu.cells)
+        self.watched = {}
+        for index, device in enumerate(hardware):
+            if polled(device):
+                self.polled.append(index)
+            elif hasattr(device, "on_event"):
+                device.scheduler = self
+                self.schedule(index, self.cpu.cycles)
+
+    def reschedule(self, device):
+        """Ask a device again when it needs attention and what it watches,
+        after something outside the cpu has changed it.
+        """
+        if self.hardware is not None:
+            for index, other in enumerate(self.hardware):
+                if other is device and index in self.due:
+                    self.schedule(index, self.cpu.cycles)
+
+    def schedule(self, index, cycles):
+        "Ask a device when it needs attention and what it watches."
+        device = self.hardware[index]
+        due = self.due[index] = device.next_event(cycles)
+        if due is not None:
+            heappush(self.events, (due, index))
+        ranges = list(device.watched() or ())
+        if ranges != self.watched.get(index, []):
+            self.watched[index] = ranges
+            self.memory.map(index, ranges)
+
+    def run(self, state):
+        """Hand a state's hardware interrupts to their devices, and call every
+        device that needs calling after its instruction.
+        """
+        hardware = self.cpu.hardware
+        if hardware is not self.hardware or len(hardware) != self.count:
+            self.adopt()
+        cycles = state.cycles
+        # hand hardware interrupts to devices; they see registers by name.
+        for index in state.interrupts:
+            hardware[index].on_interrupt_at(RegisterView(state.registers),
+                state.ram, cycles)
+            if index in self.due:
+                self.schedule(index, cycles)
+        changes = state.ram.changes
+        if changes and self.memory:
+            pages, bits, mask = self.memory.pages, self.memory.bits, \
+                self.memory.mask
+            # gather the writes to each range, so each run of them can go to
+            # its device in one call.
+            written = {}
+            for address, value in changes.iteritems():
+                entries = pages[(address >> bits) & mask]
+                if entries is None:
+                    continue
+                for start, stop, index, region in entries:
+                    if start <= address < stop:
+                        written.setdefault((index, start, region),
+                            []).append((address - start, value))
+            for (index, _, region), words in sorted(written.iteritems()):
+                device = hardware[index]
+                for offset, values in consecutive(words):
+                    message = write_range(device, region, offset, values)
+                    if message is not None:
+                        state.interrupt(message)
+        events = self.events
+        if not (events and events[0][0] <= cycles) and not self.polled:
+            return
+        calling = []
+        while events and events[0][0] <= cycles:
+            due, index = heappop(events)
+            if self.due[index] == due:
+                self.due[index] = None
+                calling.append(index)
+        if self.polled:
+            changed = named(state.registers.changes)
+        for index in sorted(calling + self.polled):
+            device = hardware[index]
+            if index in self.due:
+                message = device.on_event(cycles, changes)
+                self.schedule(index, cycles)
+            else:
+                message = device.on_cycle(changed, changes)
+            if message is not None:
+                state.interrupt(message)
@@ -55,34 +55,54 @@ class LEM1802(Hardware):
             end = start + len(self.palette)
             ram[start:end] = self.palette
 
-    def on_cycle(self, changed_registers, changed_ram):
-        for addr, value in changed_ram.iteritems():
-            # if font memory-mapping is on and the address is in that region
-            if self.mem_map_font is not None and (
-                    0 <= addr - self.mem_map_font < len(self.font)):
-                self.font[addr - self.mem_map_font] = value
-                if self.change_font:
-                    self.change_font(addr, value)
-            # if screen memory-mapping is on and the address is in that region
-            if self.mem_map_screen is not None and (
-                    0 <= addr - self.mem_map_screen < 0x182 ):
-                # The LEM1802 has no internal video ram, but rather relies on being assigned
-                # an area of the DCPU-16 ram. The size of this area is 386 words, and is
-                # made up of 32x12 cells of the following bit format (in LSB-0):
-                #     ffffbbbbBccccccc
-                # The lowest 7 bits (ccccccc) select define character to display.
-                # ffff and bbbb select which foreground and background color to use.
-                # If B (bit 7) is set the character color will blink slowly.
-                foreground = (0b1111000000000000 & value) >> 12
-                background = (0b0000111100000000 & value) >> 8
-                blink = (0b0000000010000000 & value) >> 7
-                char = 0b00000000011111111 & value
-                index = addr - self.mem_map_screen
-                if self.change_screen:
-                    self.change_screen(index, foreground, background, blink, char)
-            # if palette memory-mapping is on and the address is in that region
-            if self.mem_map_palette is not None and (
-                    0 <= addr - self.mem_map_palette < len(self.palette)):
-                self.palette[addr - self.mem_map_palette] = value
-                if self.change_palette:
-                    self.change_palette(addr, value)
+    def next_event(self, cycles):
+        "This only ever does anything when RAM changes."
+        return None
+
+    def watched(self):
+        "Whichever of the screen, font and palette are mapped."
+        ranges = []
+        if self.mem_map_screen is not None:
+            ranges.append((self.mem_map_screen, self.mem_map_screen + 0x182,
+                "screen"))
+        if self.mem_map_font is not None:
+            ranges.append((self.mem_map_font,
+                self.mem_map_font + len(self.font), "font"))
+        if self.mem_map_palette is not None:
+            ranges.append((self.mem_map_palette,
+                self.mem_map_palette + len(self.palette), "palette"))
+        return ranges
+
+    def on_write_range(self, region, offset, values):
+        # unless something's listening for each word, the font and palette
+        # can take the whole run at once.
+        if region == "font" and not self.change_font:
+            self.font[offset:offset + len(values)] = values
+        elif region == "palette" and not self.change_palette:
+            self.palette[offset:offset + len(values)] = values
+        else:
+            return Hardware.on_write_range(self, region, offset, values)
+
+    def on_write(self, region, offset, value):
+        if region == "font":
+            self.font[offset] = value
+            if self.change_font:
+                self.change_font(self.mem_map_font + offset, value)
+        elif region == "screen":
+            # The LEM1802 has no internal video ram, but rather relies on being assigned
+            # an area of the DCPU-16 ram. The size of this area is 386 words, and is
+            # made up of 32x12 cells of the following bit format (in LSB-0):
+            #     ffffbbbbBccccccc
+            # The lowest 7 bits (ccccccc) select define character to display.
+            # ffff and bbbb select which foreground and background color to use.
+            # If B (bit 7) is set the character color will blink slowly.
+            foreground = (0b1111000000000000 & value) >> 12
+            background = (0b0000111100000000 & value) >> 8
+            blink = (0b0000000010000000 & value) >> 7
+            char = 0b00000000011111111 & value
+            if self.change_screen:
+                self.change_screen(offset, foreground, background, blink, char)
+        elif region == "palette":
+            self.palette[offset] = value
+            if self.change_palette:
+                self.change_palette(self.mem_map_palette + offset, value)
@@ -1,11 +1,22 @@
 # -*- coding: utf-8 -*-
 
+from itertools import izip
+from sixteen.values import Operand
+from sixteen.registers import A, PC, SP, IA
+
+
+# how much a state keeps track of about the instruction it's running, least
+# first: nothing, the words it consumed, or those and its disassembly.
+details = ["none", "consumed", "full"]
+
 
 class DeltaDict(object):
     """A dictionary-like object that's initialized with either a dictionary or
     a list. Setting to it, though, doesn't mutate the original; instead, those
     changes get put into a new dictionary.
     """
+    __slots__ = ["_original", "changes"]
+
     def __init__(self, original):
         self._original = original
         self.changes = {}
@@ -27,23 +38,131 @@ class DeltaDict(object):
     def iteritems(self):
         return self.changes.iteritems()
 
+    def write(self, start, values):
+        "Set a run of keys starting at `start` all at once."
+        self.changes.update(izip(xrange(start, start + len(values)), values))
+
+
+class WriteThrough(DeltaDict):
+    """A dictionary-like object that writes straight through to the original,
+    wrapping keys and values to sixteen bits. It still remembers what changed,
+    so devices can be told about it.
+    """
+    __slots__ = ["cells", "addresses"]
+
+    def __init__(self, original, cells=0x10000, addresses=False):
+        DeltaDict.__init__(self, original)
+        self.cells = cells
+        # whether the keys are addresses, and so should wrap too
+        self.addresses = addresses
+
+    def __setitem__(self, key, value):
+        value %= self.cells
+        if self.addresses:
+            key %= self.cells
+        self._original[key] = value
+        self.changes[key] = value
+
+    def __getitem__(self, key):
+        return self._original[key]
+
+    def write(self, start, values):
+        """Write a run of values starting at `start` in one go, so whatever's
+        watching the original only hears about it once. They have to fit.
+        """
+        self._original[start:start + len(values)] = values
+        DeltaDict.write(self, start, values)
+
+
+class Undoable(WriteThrough):
+    """A WriteThrough for registers that also remembers what each one held
+    before it first changed, so a failed instruction can be undone.
+    """
+    __slots__ = ["old"]
+
+    def __init__(self, original, cells=0x10000):
+        WriteThrough.__init__(self, original, cells)
+        self.old = {}
+
+    def __setitem__(self, key, value):
+        changes = self.changes
+        if key not in changes:
+            self.old[key] = self._original[key]
+        value %= self.cells
+        self._original[key] = value
+        changes[key] = value
+
+    def undo(self):
+        "Put back everything that's changed since `changes` was cleared."
+        for key in self.changes:
+            self._original[key] = self.old[key]
+        self.changes.clear()
+
 
 class State(object):
-    "Create a mutable state of a given cpu without mutating the CPU itself."
-    def __init__(self, cpu, location=None):
+    """Create a mutable state of a given cpu without mutating the CPU itself.
+
+    A cpu keeps one of these around and `reset`s it for every instruction
+    `cycle` runs, so it can't be used once the next instruction has started;
+    make a new one to hold on to.
+
+    `detail` is one of `details`: with "none", `consumed` stays empty and
+    `dis` is None; with "consumed", only `dis` is None.
+    """
+    __slots__ = ["cpu", "consumed", "cells", "interrupts", "queuing",
+        "interrupt_queue", "cycles", "registers", "ram", "ram_iter", "a", "b",
+        "decoded", "detail", "reading", "recording"]
+
+    def __init__(self, cpu, location=None, detail="full"):
         self.cpu = cpu
-        self.consumed = []
         self.cells = cpu.cells
+        self.consumed = []
         self.interrupts = []
-        self.queuing = cpu.queuing
         self.interrupt_queue = []
-        self.cycles = cpu.cycles
-        self.registers = DeltaDict(cpu.registers)
-        if location is not None:
-            self.registers["PC"] = location
-        self.ram_iter = self.ram_iterator()
+        self.registers = DeltaDict(cpu.register_file)
         self.ram = DeltaDict(cpu.ram)
-        self.dis = None
+        self.iterators()
+        # the operands of the instruction this state is running
+        self.a, self.b = Operand(self), Operand(self)
+        self.reset(location, detail)
+
+    def iterators(self):
+        """Make the iterators over RAM that instructions read their words
+        from, with and without remembering them in `consumed`. They keep
+        reading from wherever PC happens to be, so they can be reused from
+        instruction to instruction.
+        """
+        self.reading = self.ram_iterator(False)
+        self.recording = self.ram_iterator(True)
+
+    def reset(self, location=None, detail="full"):
+        "Forget about the last instruction, ready for the next one."
+        self.detail = detail
+        self.ram_iter = self.reading if detail == "none" else self.recording
+        del self.consumed[:]
+        del self.interrupts[:]
+        del self.interrupt_queue[:]
+        self.queuing = self.cpu.queuing
+        self.cycles = self.cpu.cycles
+        self.registers.changes.clear()
+        self.ram.changes.clear()
+        if location is not None:
+            self.registers[PC] = location
+        # the Decoded instruction this is running, once there is one
+        self.decoded = None
+        return self
+
+    @property
+    def dis(self):
+        "The instruction this is running, disassembled."
+        decoded = self.decoded
+        if decoded is None or self.detail != "full":
+            return None
+        elif decoded.b is None:
+            return "{0} {1}".format(decoded.mnemonic, self.a.dis)
+        else:
+            return "{0} {1}, {2}".format(decoded.mnemonic, self.b.dis,
+                self.a.dis)
 
     @property
     def last_cycles(self):
@@ -51,26 +170,27 @@ class State(object):
 
     def pop(self):
         "Pop from the cpu's stack."
-        value = self.ram[self.registers["SP"]]
-        self.registers["SP"] += 1
-        self.registers["SP"] %= 0x10000
+        value = self.ram[self.registers[SP]]
+        self.registers[SP] += 1
+        self.registers[SP] %= 0x10000
         return value
 
     def push(self, value):
         "Push to the cpu's stack."
-        self.registers["SP"] -= 1
-        self.registers["SP"] %= 0x10000
-        self.ram[self.registers["SP"]] = value
+        self.registers[SP] -= 1
+        self.registers[SP] %= 0x10000
+        self.ram[self.registers[SP]] = value
 
-    def ram_iterator(self):
-        """Return an iterator over this cpu's RAM and a list that will be updated
-        whenever a value is drawn.
+    def ram_iterator(self, record=True):
+        """Return an iterator over this cpu's RAM, appending every value drawn
+        to `consumed` if `record` is true.
         """
         while True:
-            value = self.ram[self.registers["PC"]]
-            self.consumed.append(value)
-            self.registers["PC"] += 1
-            self.registers["PC"] %= self.cells
+            value = self.ram[self.registers[PC]]
+            if record:
+                self.consumed.append(value)
+            self.registers[PC] += 1
+            self.registers[PC] %= self.cells
             yield value
 
     def interrupt(self, message):
@@ -80,9 +200,9 @@ class State(object):
         > followed by pushing A to the stack, then set the PC to IA, and A to
         > the interrupt message.
         """
-        if self.registers["IA"] != 0:
+        if self.registers[IA] != 0:
             if self.queuing:
-                self.interrupt_queue.append(self.registers["A"])
+                self.interrupt_queue.append(self.registers[A])
             else:
                 self.do_interrupt(message)
 
@@ -90,7 +210,28 @@ class State(object):
     def do_interrupt(self, message):
         "Execute this interrupt right now dammit (don't queue it)."
         self.queuing = True
-        self.push(self.registers["PC"])
-        self.push(self.registers["A"])
-        self.registers["A"] = message
-        self.registers["PC"] = self.registers["IA"]
+        self.push(self.registers[PC])
+        self.push(self.registers[A])
+        self.registers[A] = message
+        self.registers[PC] = self.registers[IA]
+
+
+class Direct(State):
+    """A state that reads and writes its cpu's registers and RAM in place,
+    rather than collecting changes to be committed later. It can't be used to
+    preview an instruction, but it's a lot cheaper; like a State, one gets
+    made per cpu and reset before every instruction.
+    """
+    __slots__ = []
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.cells = cpu.cells
+        self.consumed = []
+        self.interrupts = []
+        self.interrupt_queue = []
+        self.registers = Undoable(cpu.register_file, cpu.cells)
+        self.ram = WriteThrough(cpu.ram, cpu.cells, addresses=True)
+        self.iterators()
+        self.a, self.b = Operand(self), Operand(self)
+        self.reset()
@@ -2,5 +2,19 @@
 
 from sixteen.tests.bits import *
 from sixteen.tests.dcpu16 import *
+from sixteen.tests.registers import *
+from sixteen.tests.memory import *
 from sixteen.tests.devices import *
 from sixteen.tests.keyboard import *
+from sixteen.tests.direct import *
+from sixteen.tests.cache import *
+from sixteen.tests.blocks import *
+from sixteen.tests.traces import *
+from sixteen.tests.aot import *
+from sixteen.tests.fusion import *
+from sixteen.tests.halting import *
+from sixteen.tests.bulk import *
+from sixteen.tests.lockstep import *
+from sixteen.tests.paged import *
+from sixteen.tests.scheduler import *
+from sixteen.tests.clock import *
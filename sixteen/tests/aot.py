@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+import imp
+import unittest
+from sixteen.dcpu16 import DCPU16
+from sixteen.aot import Precompiled, discover, generate
+from sixteen.tests.dcpu16 import BaseDCPU16Test
+
+
+class TestAOT(BaseDCPU16Test, unittest.TestCase):
+    loop = [
+        # set a, 0 / set i, 0x1000
+        0x8401, 0x7cc1, 0x1000,
+        # loop: add a, 3 / sti [i], a / ifn i, 0x1100 / set pc, loop
+        0x9002, 0x01de, 0x7cd3, 0x1100, 0x7f81, 0x0003,
+        # sub pc, 1
+        0x8b83,
+    ]
+
+    def translate(self, code, entries=(0,)):
+        "Translate some code ahead of time and import the module."
+        cpu = DCPU16()
+        cpu.ram[:len(code)] = code
+        module = imp.new_module("translated")
+        exec generate(cpu, entries) in vars(module)
+        return module
+
+    def run_both(self, code, module, steps=1000):
+        "Run some code precompiled and interpreted, checking they agree."
+        self.cpu.ram[:len(code)] = code
+        self.blocks = Precompiled(self.cpu, module)
+        self.assert_same_as_interpreter(code, self.blocks.step, steps)
+
+    def test_discover(self):
+        cpu = DCPU16()
+        cpu.ram[:len(self.loop)] = self.loop
+        self.assertEqual(sorted(discover(cpu)), [0, 3, 7, 9])
+
+    def test_loop(self):
+        module = self.translate(self.loop)
+        self.run_both(self.loop, module, steps=600)
+        self.assertRegister("I", 0x1100)
+        self.assertRAM(0x10ff, 0x300)
+        # nothing had to be interpreted
+        self.assertEqual([a for a, b in self.blocks.blocks.items()
+            if b is None], [])
+
+    def test_calls_and_interrupts(self):
+        code = [
+            # ias 6 / jsr 8 / int 5 / sub pc, 1
+            0x9d40, 0xa420, 0x9900, 0x8b83, 0x0000, 0x0000,
+            # handler: set x, a / rfi 0
+            0x0061, 0x8560,
+            # subroutine: set y, 1 / set pc, pop
+            0x8881, 0x6381,
+        ]
+        module = self.translate(code)
+        self.assertEqual(sorted(module.blocks), [0, 2, 3, 6, 8])
+        self.run_both(code, module, steps=10)
+        self.assertRegister("X", 5)
+        self.assertRegister("Y", 1)
+
+    def test_computed_jump(self):
+        code = [
+            # set a, 3 / set pc, a / sub pc, 1 / set b, 2 / sub pc, 1
+            0x9001, 0x0381, 0x8b83, 0x8c21, 0x8b83,
+        ]
+        module = self.translate(code)
+        self.assertEqual(sorted(module.blocks), [0])
+        self.run_both(code, module, steps=5)
+        self.assertRegister("B", 2)
+        # unless it's given as an entry point
+        self.assertEqual(sorted(self.translate(code, [0, 3]).blocks),
+            [0, 3, 4])
+
+    def test_end_of_ram(self):
+        # ife a, 1 / set pc, 4 / set pc, 0xffff, with set a, 1 at 0xffff
+        # running off the end of RAM back to the start.
+        code = [0x8812, 0x9781, 0x7f81, 0xffff] + [0] * 0xfffb + [0x8801]
+        module = self.translate(code)
+        self.assertEqual(sorted(module.blocks), [0, 1, 2, 0xffff])
+        self.run_both(code, module, steps=5)
+        self.assertRegister("A", 1)
+        self.assertRegister("PC", 4)
+
+    def test_overwritten(self):
+        module = self.translate(self.loop)
+        # add a, 4
+        changed = self.loop[:3] + [0x9402] + self.loop[4:]
+        self.run_both(changed, module, steps=1200)
+        self.assertRegister("A", 0x400)
+        # the blocks that changed were left to the interpreter
+        self.assertEqual(sorted(a for a, b in self.blocks.blocks.items()
+            if b is not None), [7, 9])
+        # and if it's changed while running
+        self.cpu.ram[7] = 0x8b83
+        self.assertEqual(self.blocks.invalidations, 1)
+
+    def test_overridden(self):
+        class Custom(DCPU16):
+            def set(self, state, b, a):
+                state.cycles += 1
+                b.set(a.get() + 1)
+        module = self.translate(self.loop)
+        cpu = Custom()
+        cpu.ram[:len(self.loop)] = self.loop
+        blocks = Precompiled(cpu, module)
+        # the blocks with a set in them are left to the interpreter
+        self.assertEqual(sorted(a for a, b in blocks.blocks.items()
+            if b is not None), [9])
+        for _ in xrange(4):
+            blocks.step()
+        self.assertEqual(cpu.registers["A"], 4)
+        self.assertEqual(cpu.registers["I"], 0x1002)
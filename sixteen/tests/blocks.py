@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from sixteen.dcpu16 import DCPU16
+from sixteen.blocks import BlockCompiler
+from sixteen.registers import A, SP, PC, IA
+from sixteen.tests import dcpu16
+from sixteen.tests.dcpu16 import BaseDCPU16Test
+from sixteen.tests.devices import TestDevice
+
+
+class BlockTest(object):
+    "Run everything a block at a time."
+    def setUp(self):
+        super(BlockTest, self).setUp()
+        self.blocks = BlockCompiler(self.cpu)
+        self.cpu.cycle = self.blocks.step
+
+
+# make a block version of every cpu test case, except the ones for `run`,
+# which count blocks as instructions, and for the states `cycle` runs
+# instructions with.
+globals().update(dcpu16.variants("Block", BlockTest, dcpu16,
+    exclude=(dcpu16.TestRun, dcpu16.TestStates)))
+
+
+class TestBlocks(BlockTest, BaseDCPU16Test, unittest.TestCase):
+    loop = [
+        # set a, 0 / set i, 0x1000
+        0x8401, 0x7cc1, 0x1000,
+        # loop: add a, 3 / sti [i], a / ifn i, 0x1100 / set pc, loop
+        0x9002, 0x01de, 0x7cd3, 0x1100, 0x7f81, 0x0003,
+    ]
+
+    def test_loop(self):
+        self.assert_same_as_interpreter(self.loop + [0x8b83])
+        self.assertRegister("I", 0x1100)
+        self.assertRAM(0x1000, 3)
+        self.assertRAM(0x10ff, 0x300 & 0xffff)
+
+    def test_compiled_once(self):
+        self.assert_same_as_interpreter(self.loop)
+        # the setup, the body of the loop and its jump back.
+        self.assertEqual(self.blocks.compiled, 3)
+
+    def test_stack(self):
+        self.assert_same_as_interpreter([
+            # set push, 1 / set push, 2 / add peek, pop / set b, [sp + 0]
+            0x8b01, 0x8f01, 0x6322, 0x6821, 0x0000,
+            # jsr 7 / sub pc, 1 / set a, pop / set pc, a
+            0xa020, 0x8b83, 0x6001, 0x0381
+        ], steps=20)
+        self.assertRegister("B", 3)
+        self.assertRegister("A", 6)
+        self.assertRegister("PC", 6)
+
+    def test_ending_in_int(self):
+        code = [
+            # ias 0x10 / set a, 5 / int 0x42
+            0x7d40, 0x0010, 0x9801, 0x7d00, 0x0042,
+        ]
+        self.cpu.hardware.append(TestDevice())
+        self.cpu.ram[:len(code)] = code
+        interpreted = DCPU16([TestDevice()])
+        interpreted.ram[:len(code)] = code
+        state = self.cpu.cycle()
+        while interpreted.cycles < self.cpu.cycles:
+            interpreted.cycle()
+        self.assertEqual(interpreted.registers, self.cpu.registers)
+        # the interrupt's changes are still there alongside the block's
+        changes = state.registers.changes
+        self.assertEqual((changes[A], changes[SP], changes[PC], changes[IA]),
+            (0x42, 0xfffe, 0x10, 0x10))
+
+    def test_chained_conditionals(self):
+        self.assert_same_as_interpreter([
+            # ife a, 1 / ife a, 0 / set b, 1 / set c, 1
+            0x8812, 0x8412, 0x8821, 0x8841,
+            # ife a, 0 / ife a, 0 / set x, 1 / set y, 1
+            0x8412, 0x8412, 0x8861, 0x8881,
+        ])
+        self.assertRegister("B", 0)
+        self.assertRegister("C", 1)
+        self.assertRegister("X", 1)
+
+    def test_self_modifying(self):
+        self.assert_same_as_interpreter([
+            # set [3], 0x8c01 (set a, 2) / set a, 1 / set b, a
+            0x7fc1, 0x8c01, 0x0003, 0x8801, 0x0021,
+        ])
+        self.assertRegister("A", 2)
+        self.assertRegister("B", 2)
+
+    def test_invalidation(self):
+        self.assert_same_as_interpreter(self.loop)
+        self.assertRegister("A", 0x300)
+        # add a, 4
+        self.cpu.ram[3] = 0x9402
+        # both the first block and the loop body run through there
+        self.assertEqual(self.blocks.invalidations, 2)
+        for register in self.cpu.registers:
+            self.cpu.registers[register] = 0
+        # loading it again throws everything away, so it's all recompiled
+        self.run_instructions(self.loop[:3] + [0x9402] + self.loop[4:])
+        self.assertRegister("A", 0x400)
+        self.assertEqual(self.blocks.compiled, 6)
+
+    def test_arithmetic(self):
+        self.assert_same_as_interpreter([
+            # set a, 0xfff0 / mul a, 0x100 / set b, ex / mli a, -3
+            0x7c01, 0xfff0, 0x7c04, 0x0100, 0x7421, 0x7c05, 0xfffd,
+            # div b, 7 / dvi a, 0xfff9 / mdi b, 3 / asr a, 2 / shl c, 30
+            0xa026, 0x7c07, 0xfff9, 0x9029, 0x8c0e, 0xfc4f,
+            # shr b, 1 / sub x, 1 / adx x, 5 / sbx y, 2 / xor c, a
+            0x882d, 0x8863, 0x987a, 0x8c9b, 0x004c,
+            # bor y, 0x8000 / and y, 0xff00 / mod y, 0 / div y, 0
+            0x7c8b, 0x8000, 0x7c8a, 0xff00, 0x8488, 0x8486,
+            # ifa a, 0xffff / ifu a, 0 / ifb a, 1 / ifc a, 1 / ifg a, 2
+            0x8015, 0x8417, 0x8810, 0x8811, 0x8c14,
+            # ifl a, 2 / set z, 7
+            0x8c16, 0xa0a1,
+        ])
+
+    def test_hardware(self):
+        device = TestDevice()
+        self.cpu = DCPU16([device])
+        self.blocks = BlockCompiler(self.cpu)
+        self.run_instructions([
+            # hwn z / hwq 0 / set a, 3 / hwi 0 / set i, b
+            0x1600, 0x8620, 0x9001, 0x8640, 0x04c1
+        ])
+        self.assertRegister("Z", 1)
+        self.assertRegister("B", 9)
+        self.assertRegister("I", 9)
+
+    def test_interrupts(self):
+        self.assert_same_as_interpreter([
+            # ias 4 / int 5 / sub pc, 1
+            0x9540, 0x9900, 0x8b83, 0x8b83,
+            # handler: set x, a / rfi 0
+            0x0061, 0x8560,
+        ], steps=5)
+        self.assertRegister("X", 5)
+        self.assertRegister("PC", 2)
+
+    def test_run(self):
+        self.cpu.ram[:len(self.loop)] = self.loop
+        # the first block, then the jump back and the body twice
+        result = self.blocks.run(max_instructions=5)
+        self.assertEqual(result.instructions, 5)
+        self.assertRegister("A", 9)
+        result = self.blocks.run(breakpoints=[7], cycles=1000)
+        self.assertEqual(result.reason, "breakpoint")
+        self.assertEqual(result.instructions, 2)
+        self.assertRegister("A", 12)
+
+    def test_end_of_ram(self):
+        # ife a, 1 / set pc, 4 / set pc, 0xffff, with set a, 1 at 0xffff
+        # running off the end of RAM back to the start.
+        code = [0x8812, 0x9781, 0x7f81, 0xffff] + [0] * 0xfffb + [0x8801]
+        self.assertEqual(self.assert_same_as_interpreter(code, steps=5), 5)
+        self.assertRegister("A", 1)
+        self.assertRegister("PC", 4)
+
+    def test_falls_back(self):
+        class Custom(DCPU16):
+            def set(self, state, b, a):
+                state.cycles += 1
+                b.set(a.get() + 1)
+        self.cpu = Custom()
+        self.blocks = BlockCompiler(self.cpu)
+        self.run_instructions([0x8801, 0x8c21])
+        self.assertRegister("A", 2)
+        self.assertRegister("B", 3)
+        self.assertEqual(self.blocks.compiled, 0)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from sixteen.dcpu16 import DCPU16
+from sixteen.devices import Hardware
+from sixteen.tests.dcpu16 import BaseDCPU16Test
+
+
+class Watcher(Hardware):
+    "A device that remembers every batch of RAM changes it's told about."
+    def __init__(self):
+        self.batches = []
+
+    def on_cycle(self, changed_registers, changed_ram):
+        if changed_ram:
+            self.batches.append(dict(changed_ram))
+
+
+class TestCountedLoops(BaseDCPU16Test, unittest.TestCase):
+    direct = False
+
+    def setUp(self):
+        self.cpu = DCPU16([Watcher()], direct=self.direct)
+        self.cpu.bulk = True
+
+    def run_both(self, code, data=(), start=0x2000):
+        """Run some code with counted loops and without until it runs off
+        the end, checking they agree; returns the cpu that used them.
+        """
+        self.cpu.ram[start:start + len(data)] = data
+        self.assert_same_as_interpreter(code)
+        return self.cpu
+
+    def copy(self, i, j, end, counter=0x7cd3):
+        "set i, i / set j, j / sti [i], [j] / ifn i, end / sub pc, 4"
+        return [0x7cc1, i, 0x7ce1, j, 0x3dde, counter, end, 0x9783]
+
+    def test_copy(self):
+        cpu = self.run_both(self.copy(0x1000, 0x2000, 0x1100), range(0x100))
+        self.assertEqual(cpu.ram[0x1000:0x1100].tolist(), range(0x100))
+        self.assertEqual(cpu.registers["J"], 0x2100)
+        self.assertEqual(cpu.registers["PC"], 8)
+        # the devices saw the whole thing at once.
+        self.assertEqual(len(cpu.hardware[0].batches), 1)
+        self.assertEqual(len(cpu.hardware[0].batches[0]), 0x100)
+
+    def test_counting_j(self):
+        # ifn j, 0x2080
+        self.run_both(self.copy(0x1000, 0x2000, 0x2080, 0x7cf3), range(0x80))
+
+    def test_once(self):
+        self.run_both(self.copy(0x10ff, 0x2000, 0x1100), [5])
+
+    def test_overlapping(self):
+        # these smear, so they go a word at a time.
+        self.run_both(self.copy(0x2001, 0x2000, 0x2011), range(1, 0x20))
+        self.setUp()
+        self.run_both(self.copy(0x1ff0, 0x2000, 0x2000), range(1, 0x20))
+
+    def test_wrapping(self):
+        cpu = self.run_both(self.copy(0xfff0, 0x2000, 0x0010), range(0x20))
+        self.assertEqual(cpu.ram[0xffff], 15)
+
+    def test_overwriting_itself(self):
+        # copies a set a, 1 / sub pc, 1 over the end of the code
+        self.run_both(self.copy(0x0008, 0x2000, 0x000a), [0x8801, 0x8b83])
+
+    def test_std_fill(self):
+        self.run_both([
+            # set a, 0x1234 / set i, 0x1200
+            0x7c01, 0x1234, 0x7cc1, 0x1200,
+            # std [i], a / ifn i, 0x0fff / set pc, 4
+            0x01df, 0x7cd3, 0x0fff, 0x9781,
+        ])
+
+    def test_fill_literal(self):
+        cpu = self.run_both([
+            # set i, 0x1000 / sti [i], 0xbeef / ifn i, 0x1010 / add pc, 0xfffa
+            0x7cc1, 0x1000, 0x7dde, 0xbeef, 0x7cd3, 0x1010, 0x7f82, 0xfffa,
+        ])
+        self.assertEqual(cpu.ram[0x100f], 0xbeef)
+        self.assertEqual(cpu.registers["EX"], 1)
+
+    def test_stopping_partway(self):
+        cpu = DCPU16()
+        cpu.bulk = True
+        code = self.copy(0x1000, 0x2000, 0x1100)
+        cpu.ram[:len(code)] = code
+        result = cpu.run(breakpoints=[4], max_instructions=20)
+        self.assertEqual(result.reason, "breakpoint")
+        cpu.run(breakpoints=[4], max_instructions=20)
+        self.assertEqual(cpu.registers["I"], 0x1001)
+        self.assertTrue(cpu.bulk)
+
+    def test_cached(self):
+        cpu = self.run_both(self.copy(0x1000, 0x2000, 0x1100), range(0x100))
+        self.assertTrue(cpu.cache.loops[5] is not None)
+        # ifn i, 0x1080 instead
+        cpu.ram[6] = 0x1080
+        self.assertFalse(5 in cpu.cache.loops)
+        cpu.registers["PC"] = 0
+        while cpu.registers["PC"] != 8:
+            cpu.cycle()
+        self.assertEqual(cpu.registers["I"], 0x1080)
+
+
+class TestDirectCountedLoops(TestCountedLoops):
+    direct = True
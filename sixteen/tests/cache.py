@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from sixteen.dcpu16 import DCPU16
+from sixteen.tests.dcpu16 import BaseDCPU16Test
+
+
+class TestInstructionCache(BaseDCPU16Test, unittest.TestCase):
+    def test_loop_decodes_once(self):
+        self.run_instructions([
+            # set a, 10
+            0xac01,
+            # sub a, 1 / ifn a, 0 / sub pc, 3
+            0x8803, 0x8413, 0x9383,
+        ])
+        self.assertRegister("A", 0)
+        stats = self.cpu.cache.stats()
+        # four distinct instructions, so four misses; the last sub pc, 3
+        # gets skipped, which doesn't need decoding.
+        self.assertEqual(stats["misses"], 4)
+        self.assertEqual(stats["hits"], 1 + 3 * 10 - 1 - 4)
+        self.assertEqual(stats["size"], 4)
+
+    def test_decoded(self):
+        self.run_instructions([
+            # set [0x1337], 0xbeef
+            0x7fc1, 0xbeef, 0x1337
+        ])
+        decoded = self.cpu.cache.entries[0]
+        self.assertEqual(decoded.mnemonic, "set")
+        self.assertEqual(decoded.length, 3)
+        self.assertEqual(decoded.cost, 3)
+        self.assertEqual(self.cpu.cycles, 3)
+
+    def test_self_modifying_code(self):
+        self.run_instructions([
+            # set a, 1
+            0x8801,
+            # ifn ex, 0 / set pc, 9 -- the second time around, stop.
+            0x87b3, 0x7f81, 0x0009,
+            # set [0], 0x8c01 (set a, 2)
+            0x7fc1, 0x8c01, 0x0000,
+            # set ex, 1 / set pc, 0
+            0x8ba1, 0x8781,
+        ])
+        self.assertRegister("A", 2)
+        self.assertEqual(self.cpu.cache.invalidations, 1)
+
+    def test_loading_invalidates(self):
+        self.cpu.ram[:2] = [0x7c01, 0xbeef]
+        self.cpu.cycle()
+        self.assertRegister("A", 0xbeef)
+        self.cpu.ram[:2] = [0x7c21, 0xdead]
+        self.cpu.registers["PC"] = 0
+        self.cpu.cycle()
+        self.assertRegister("B", 0xdead)
+        self.assertEqual(self.cpu.cache.invalidations, 1)
+
+    def test_negative_index_invalidates(self):
+        self.cpu.registers["PC"] = 0xffff
+        self.cpu.ram[0xffff] = 0x8801
+        self.cpu.cycle()
+        self.assertRegister("A", 1)
+        # set a, 2
+        self.cpu.ram[-1] = 0x8c01
+        self.cpu.registers["PC"] = 0xffff
+        self.cpu.cycle()
+        self.assertRegister("A", 2)
+
+    def test_previews_uncached(self):
+        self.cpu.ram[:2] = [0x7c01, 0xbeef]
+        self.cpu.get_instruction()
+        stats = self.cpu.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]),
+            (0, 0, 0))
+
+    def test_without_cache(self):
+        class Uncached(DCPU16):
+            def ram_init(self):
+                self.ram = [0x0000] * self.cells
+        self.cpu = Uncached()
+        self.run_instructions([0x7c01, 0xbeef])
+        self.assertRegister("A", 0xbeef)
+
+
+class TestDecodeTable(unittest.TestCase):
+    def test_shared(self):
+        class Custom(DCPU16):
+            def set(self, state, b, a):
+                b.set(a.get() + 1)
+        table = DCPU16().decode_table()
+        self.assertEqual(len(table), 0x10000)
+        self.assertTrue(DCPU16().decode_table() is table)
+        # overriding a method doesn't need a new table
+        self.assertTrue(Custom().decode_table() is table)
+
+    def test_entries(self):
+        table = DCPU16().decode_table()
+        # set [0x1337], 0xbeef
+        entry = table[0x7fc1]
+        self.assertEqual((entry.op, entry.b, entry.a), (0x01, 0x1e, 0x1f))
+        self.assertEqual(entry.mnemonic, "set")
+        self.assertEqual((entry.length, entry.cost), (3, 3))
+        self.assertFalse(entry.conditional)
+        # ifn a, 0
+        self.assertTrue(table[0x8413].conditional)
+        # jsr 7
+        self.assertEqual(table[0xa020].mnemonic, "jsr")
+        self.assertEqual(table[0xa020].b_value, None)
+        # illegal words
+        self.assertEqual(table[0x0000].mnemonic, None)
+        self.assertEqual(table[0x0000].illegal, 0x00)
+        self.assertEqual(table[0x0018].illegal, 0x18)
+
+    def test_new_opcodes(self):
+        class Extended(DCPU16):
+            operations = dict(DCPU16.operations)
+            operations[0x18] = "set"
+        table = Extended().decode_table()
+        self.assertFalse(table is DCPU16().decode_table())
+        self.assertEqual(table[0x0018].mnemonic, "set")
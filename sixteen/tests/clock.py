@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from sixteen.dcpu16 import DCPU16
+from sixteen.devices import Clock
+from sixteen.halting import FastForward
+
+
+class TestClock(unittest.TestCase):
+    # ias 0x10 / set a, 2 / set b, 0xbeef / hwi 0 /
+    # set a, 0 / set b, 6 / hwi 0 / sub pc, 1
+    program = [0x7d40, 0x0010, 0x8c01, 0x7c21, 0xbeef, 0x8640,
+        0x8401, 0x7c21, 0x0006, 0x8640, 0x8b83]
+    # :0x10 add x, 1 / rfi 0
+    handler = [0x8862, 0x8560]
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cpu = DCPU16([self.clock])
+        self.cpu.ram[:len(self.program)] = self.program
+        self.cpu.ram[0x10:0x12] = self.handler
+
+    def test_ticks(self):
+        # asking when the next tick is doesn't change anything
+        self.assertEqual(self.clock.next_event(1234), None)
+        self.cpu.run(max_instructions=7)
+        # it starts counting from the hwi, not from whenever it's asked
+        start = self.clock.start
+        self.assertEqual(start, self.cpu.cycles)
+        # 60 / 6 ticks a second is one every 10000 cycles.
+        self.assertEqual(self.clock.next_event(start + 5000), start + 10000)
+        self.assertEqual(self.clock.tick(3), start + 30000)
+        self.clock.divider = 1
+        self.assertEqual(self.clock.tick(1), start + 1667)
+        self.assertEqual(self.clock.tick(3), start + 5000)
+
+    def test_interrupts(self):
+        self.cpu.run(cycles=25000)
+        self.assertEqual(self.cpu.registers["X"], 2)
+        self.assertEqual(self.clock.ticks, 2)
+
+    def test_fast_forward(self):
+        runner = FastForward(self.cpu)
+        runner.run(cycles=25000)
+        self.assertEqual(self.cpu.registers["X"], 2)
+        # nearly all of it was skipped.
+        self.assertTrue(runner.skipped > 24000)
+
+    def test_elapsed(self):
+        # set a, 1 / hwi 0
+        self.cpu.ram[0x0a:0x0c] = [0x8801, 0x8640]
+        self.cpu.run(max_instructions=7)
+        self.cpu.cycles += 30000
+        # set a, 1 / (the interrupt) add x, 1 / rfi 0 / hwi 0
+        self.cpu.run(max_instructions=4)
+        self.assertEqual(self.cpu.registers["C"], 3)
+
+    def test_elapsed_on_a_tick(self):
+        self.cpu.run(max_instructions=7)
+        tick = self.clock.tick(1)
+        # an hwi that finishes right on a tick sees it, before the clock's
+        # own event for it comes round.
+        registers = {"A": 1, "C": 0}
+        self.clock.on_interrupt_at(registers, self.cpu.ram, tick - 1)
+        self.assertEqual(registers["C"], 0)
+        self.clock.on_interrupt_at(registers, self.cpu.ram, tick)
+        self.assertEqual(registers["C"], 1)
+        self.assertEqual(self.clock.ticks, 0)
+
+    def test_off(self):
+        self.cpu.ram[8] = 0x0000
+        self.cpu.run(cycles=25000)
+        self.assertEqual(self.clock.next_event(self.cpu.cycles), None)
+        self.assertEqual(self.cpu.registers["X"], 0)
+
+    def test_wall(self):
+        times = [1000.0]
+        clock = Clock(wall=True, now=lambda: times[0])
+        cpu = DCPU16([clock])
+        cpu.ram[:len(self.program)] = self.program
+        cpu.ram[0x10:0x12] = self.handler
+        cpu.run(max_instructions=10)
+        self.assertEqual(clock.start, 1000.0)
+        # no time's passed, however many cycles go by.
+        cpu.run(cycles=2000)
+        self.assertEqual(cpu.registers["X"], 0)
+        times[0] += 0.25
+        cpu.run(cycles=2000)
+        self.assertEqual(clock.ticks, 2)
+        self.assertEqual(cpu.registers["X"], 1)
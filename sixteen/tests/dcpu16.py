@@ -6,8 +6,10 @@ from sixteen.bits import as_signed, from_signed
 
 
 class BaseDCPU16Test(object):
+    paged = False
+
     def setUp(self):
-        self.cpu = DCPU16()
+        self.cpu = DCPU16(paged=self.paged)
 
     def run_instructions(self, words):
         self.cpu.ram[:len(words)] = list(words)
@@ -20,6 +22,52 @@ class BaseDCPU16Test(object):
     def assertRAM(self, addr, value):
         self.assertEquals(self.cpu.ram[addr], value)
 
+    def assert_same_as_interpreter(self, code=(), step=None, steps=1000,
+            cycles=None, interpreted=None):
+        """Run some code on this test's cpu a `step` at a time -- its `cycle`,
+        unless that's given -- with an interpreter catching up after every
+        step, checking that they agree. It stops once PC gets past the code,
+        after `steps` steps, or once `cycles` cycles have gone by; returns
+        how many steps it took. The interpreter (`interpreted`, or a new
+        DCPU16) starts with a copy of the cpu's RAM, so put any data there
+        first.
+        """
+        cpu = self.cpu
+        # leave it be if it's already there, so nothing watching hears of it
+        if list(cpu.ram[:len(code)]) != list(code):
+            cpu.ram[:len(code)] = code
+        if interpreted is None:
+            interpreted = DCPU16()
+        interpreted.ram[:] = cpu.ram[:]
+        step = step or cpu.cycle
+        budget = None if cycles is None else cpu.cycles + cycles
+        taken = 0
+        while (cpu.registers["PC"] < len(code) and taken < steps and
+                (budget is None or cpu.cycles < budget)):
+            step()
+            while interpreted.cycles < cpu.cycles:
+                interpreted.cycle()
+            self.assertEqual(interpreted.registers, cpu.registers)
+            self.assertEqual(interpreted.cycles, cpu.cycles)
+            taken += 1
+        self.assertEqual(interpreted.ram, cpu.ram)
+        return taken
+
+
+def variants(prefix, mixin, *modules, **options):
+    """Make a version of every test case in some modules with `mixin` mixed
+    in, named with `prefix`, leaving out any in `exclude`. They're returned
+    by name, to go in the calling module's globals.
+    """
+    exclude = options.get("exclude", ())
+    made = {}
+    for module in modules:
+        for name, case in vars(module).items():
+            if (isinstance(case, type) and issubclass(case, unittest.TestCase)
+                    and case not in exclude):
+                made[prefix + name] = type(prefix + name, (mixin, case), {})
+    return made
+
 
 class TestSet(BaseDCPU16Test, unittest.TestCase):
     def test_set_ram_pointer(self):
@@ -570,6 +618,21 @@ class TestConditionals(BaseDCPU16Test, unittest.TestCase):
         # make sure a didn't get set to 0x1234
         self.assertRegister("A", 0)
 
+    def test_chained_conditional_cycles(self):
+        self.run_instructions([
+            # ife a, 1 / ifn [0x1000 + b], 0x1234 / ifg a, 2 / set a, [0x1000]
+            0x8812, 0x7e33, 0x1234, 0x1000, 0x8c14, 0x7801, 0x1000,
+            # ife a, 0 / ife a, 1 / set b, 1 / set c, 1
+            0x8412, 0x8812, 0x8821, 0x8841,
+        ])
+        # 2 for the first ife, plus one for each instruction it skips (not
+        # counting the words they take up), then 2 + 2 + 1 for the rest.
+        self.assertEqual(self.cpu.cycles, 2 + 3 + 2 + 2 + 1 + 1)
+        self.assertRegister("A", 0)
+        self.assertRegister("B", 0)
+        self.assertRegister("C", 1)
+        self.assertRegister("PC", 11)
+
 
 class TestAdx(BaseDCPU16Test, unittest.TestCase):
     def test_adx(self):
@@ -679,3 +742,123 @@ class TestJsr(BaseDCPU16Test, unittest.TestCase):
             0x9b01, 0xaf01, 0x63e1, 0x0000, 0x6420    
         ])
         self.assertRegister("PC", 5)
+
+
+class TestRun(BaseDCPU16Test, unittest.TestCase):
+    loop = [
+        # set a, 0 / add a, 1 / set pc, 1
+        0x8401, 0x8802, 0x8b81,
+    ]
+
+    def setUp(self):
+        super(TestRun, self).setUp()
+        self.cpu.ram[:len(self.loop)] = self.loop
+
+    def test_cycles(self):
+        result = self.cpu.run(cycles=100)
+        self.assertEqual(result.reason, "cycles")
+        self.assertEqual(result.cycles, 100)
+        self.assertEqual(self.cpu.cycles, 100)
+        self.assertRegister("A", 33)
+
+    def test_max_instructions(self):
+        result = self.cpu.run(max_instructions=7)
+        self.assertEqual(result.reason, "instructions")
+        self.assertEqual(result.instructions, 7)
+        self.assertEqual(result.cycles, 1 + 3 * 2 + 3 * 1)
+        self.assertRegister("A", 3)
+
+    def test_breakpoints(self):
+        self.cpu.run(breakpoints=[1])
+        self.assertRegister("PC", 1)
+        # it runs at least one instruction before stopping at one
+        result = self.cpu.run(breakpoints=[1])
+        self.assertEqual(result.reason, "breakpoint")
+        self.assertRegister("A", 1)
+
+    def test_until(self):
+        result = self.cpu.run(until=lambda cpu: cpu.registers["A"] == 5)
+        self.assertEqual(result.reason, "until")
+        self.assertRegister("A", 5)
+
+    def test_error(self):
+        self.cpu.ram[2] = 0x0000
+        result = self.cpu.run(cycles=100)
+        self.assertEqual(result.reason, "error")
+        self.assertEqual(result.instructions, 2)
+        self.assertEqual(result.error.address, 2)
+        # PC is left at the illegal instruction
+        self.assertRegister("PC", 2)
+
+
+class TestStates(BaseDCPU16Test, unittest.TestCase):
+    def test_reused(self):
+        self.cpu.detail = "full"
+        # set a, 0xbeef / set push, a
+        self.cpu.ram[:3] = [0x7c01, 0xbeef, 0x0301]
+        first = self.cpu.cycle()
+        self.assertEqual(first.dis, "set A, 0xbeef")
+        self.assertEqual(first.consumed, [0x7c01, 0xbeef])
+        second = self.cpu.cycle()
+        # the same state, with the first instruction forgotten
+        self.assertTrue(second is first)
+        self.assertEqual(second.dis, "set PUSH, A")
+        self.assertEqual(second.consumed, [0x0301])
+        self.assertEqual(second.ram.changes, {0xffff: 0xbeef})
+        self.assertRAM(0xffff, 0xbeef)
+
+    def test_previews_are_new(self):
+        self.cpu.ram[:2] = [0x7c01, 0xbeef]
+        _, _, state = self.cpu.get_instruction()
+        self.assertFalse(state is self.cpu.cycle())
+        self.assertEqual(state.dis, "set A, 0xbeef")
+
+    def test_no_instance_dicts(self):
+        state = self.cpu.state()
+        direct = self.cpu.direct_state()
+        for thing in [state, state.registers, state.ram, direct, direct.ram] \
+                + DCPU16.values.values():
+            self.assertFalse(hasattr(thing, "__dict__"), thing)
+
+    def test_details(self):
+        # set a, 0xbeef
+        self.cpu.ram[:2] = [0x7c01, 0xbeef]
+        state = self.cpu.cycle()
+        self.assertEqual((state.consumed, state.dis), ([], None))
+        self.cpu.registers["PC"] = 0
+        self.cpu.detail = "consumed"
+        state = self.cpu.cycle()
+        self.assertEqual((state.consumed, state.dis), ([0x7c01, 0xbeef], None))
+        self.cpu.registers["PC"] = 0
+        self.cpu.detail = "full"
+        state = self.cpu.cycle()
+        self.assertEqual(state.dis, "set A, 0xbeef")
+        self.assertRegister("A", 0xbeef)
+
+    def test_run_detail(self):
+        self.cpu.ram[:2] = [0x7c01, 0xbeef]
+        seen = []
+
+        def until(cpu):
+            seen.append(cpu.state().detail)
+            return True
+        self.cpu.run(until=until, detail="consumed")
+        self.assertEqual(seen, ["consumed"])
+        self.assertEqual(self.cpu.detail, "none")
+
+
+class TestHandlers(BaseDCPU16Test, unittest.TestCase):
+    def test_table(self):
+        handlers = self.cpu.handlers
+        self.assertEqual(handlers["add"], self.cpu.add)
+        self.assertEqual(handlers["jsr"], self.cpu.jsr)
+
+    def test_overridden(self):
+        class Backwards(DCPU16):
+            def add(self, state, b, a):
+                DCPU16.sub(self, state, b, a)
+        cpu = Backwards()
+        # set a, 5 / add a, 3
+        cpu.ram[:2] = [0x9801, 0x9002]
+        cpu.run(max_instructions=2)
+        self.assertEqual(cpu.registers["A"], 2)
@@ -36,7 +36,7 @@ class TestDevice(Hardware):
 class DeviceTest(BaseDCPU16Test):
     def setUp(self):
         self.device = TestDevice()
-        self.cpu = DCPU16([self.device])
+        self.cpu = DCPU16([self.device], paged=self.paged)
 
 
 
@@ -93,7 +93,7 @@ class TestDeviceOperations(DeviceTest, unittest.TestCase):
         self.assertRegister("A", 0xdead)
 
     def test_multiple_interrupts(self):
-        self.cpu.ram[:5] = [
+        self.cpu.ram[:6] = [
             # ias, :handler
             0x7d40, 0x0003,
             # sub pc, 1
@@ -120,7 +120,7 @@ class TestDeviceOperations(DeviceTest, unittest.TestCase):
         self.assertRegister("B", 160)
 
     def test_interrupt_queueing(self):
-        self.cpu.ram[:5] = [
+        self.cpu.ram[:6] = [
             # ias, :handler
             0x7d40, 0x0003,
             # sub pc, 1
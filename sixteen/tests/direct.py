@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"Run the cpu and device tests again, with the cpu mutating itself in place."
+
+import unittest
+from sixteen.registers import A, PC
+from sixteen.utilities import OpcodeError
+from sixteen.tests import dcpu16, devices, keyboard
+
+
+class DirectTest(object):
+    def setUp(self):
+        super(DirectTest, self).setUp()
+        self.cpu.direct = True
+
+
+# make a direct version of every test case in those modules.
+globals().update(dcpu16.variants("Direct", DirectTest, dcpu16, devices,
+    keyboard))
+
+
+class TestDirect(dcpu16.BaseDCPU16Test, unittest.TestCase):
+    def test_no_state_committed(self):
+        self.cpu.direct = True
+        self.cpu.ram[:2] = [0x7c01, 0xbeef]
+        state = self.cpu.cycle()
+        # the registers were changed while the instruction ran
+        self.assertRegister("A", 0xbeef)
+        self.assertEqual(state.registers.changes, {A: 0xbeef, PC: 2})
+
+    def test_wraparound(self):
+        self.cpu.direct = True
+        self.run_instructions([
+            # sub a, 1
+            0x8803,
+            # set [0xffff + a], 0xbeef
+            0x7e01, 0xbeef, 0xffff,
+        ])
+        self.assertRegister("A", 0xffff)
+        self.assertRAM(0xfffe, 0xbeef)
+
+    def test_same_as_transactional(self):
+        code = [
+            # set a, 10 / set push, a / sub a, 1 / ifn a, 0 / sub pc, 3
+            0xac01, 0x0301, 0x8803, 0x8413, 0x9383,
+        ]
+        self.run_instructions(code)
+        direct = dcpu16.DCPU16(direct=True)
+        direct.ram[:len(code)] = code
+        while direct.registers["PC"] < len(code):
+            direct.cycle()
+        self.assertEqual(direct.registers, self.cpu.registers)
+        self.assertEqual(direct.ram, self.cpu.ram)
+        self.assertEqual(direct.cycles, self.cpu.cycles)
+
+    def test_operands_reused(self):
+        self.cpu.direct = True
+        self.cpu.detail = "full"
+        self.cpu.ram[:3] = [
+            # set push, 0xbeef / set a, pop
+            0x7f01, 0xbeef, 0x6001,
+        ]
+        first = self.cpu.cycle()
+        a, b = first.a, first.b
+        self.assertTrue(b.value is dcpu16.DCPU16.values[0x18].as_b)
+        second = self.cpu.cycle()
+        self.assertTrue(second.a is a and second.b is b)
+        self.assertRegister("A", 0xbeef)
+        self.assertEqual(second.dis, "set A, POP")
+
+    def test_illegal_unchanged(self):
+        self.cpu.direct = True
+        # ife a, pop, which fails and skips into 0x0000
+        self.cpu.ram[:2] = [0x6012, 0x0000]
+        before = self.cpu.register_tuple()
+        self.assertRaises(OpcodeError, self.cpu.cycle)
+        self.assertEqual(self.cpu.register_tuple(), before)
+        self.assertEqual(self.cpu.cycles, 0)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from sixteen.dcpu16 import DCPU16
+from sixteen.fusion import FusingCompiler, Branch, pairs, profile, report
+from sixteen.tests import dcpu16, blocks
+from sixteen.tests.dcpu16 import BaseDCPU16Test
+
+
+class FusingTest(object):
+    "Run everything a block at a time, with superinstructions."
+    def setUp(self):
+        super(FusingTest, self).setUp()
+        self.blocks = FusingCompiler(self.cpu)
+        self.cpu.cycle = self.blocks.step
+
+
+globals().update(dcpu16.variants("Fusing", FusingTest, dcpu16,
+    exclude=(dcpu16.TestRun, dcpu16.TestStates)))
+
+
+class TestFusion(FusingTest, BaseDCPU16Test, unittest.TestCase):
+    loop = blocks.TestBlocks.loop
+
+    def assertRegisters(self, **registers):
+        for name, value in registers.iteritems():
+            self.assertRegister(name, value)
+
+    def test_loop(self):
+        self.assert_same_as_interpreter(self.loop + [0x8b83])
+        self.assertRegister("I", 0x1100)
+        self.assertRAM(0x10ff, 0x300 & 0xffff)
+        # the setup, the body of the loop with its jump back, and the
+        # sub pc, 1 at the end.
+        self.assertEqual(self.blocks.compiled, 3)
+        self.assertIsInstance(self.blocks.find(3)[-1], Branch)
+
+    def test_pushes_and_pops(self):
+        code = [
+            # set a, 1 / set b, 2 / set push, a / set push, b / set push, 5
+            0x8801, 0x8c21, 0x0301, 0x0701, 0x9b01,
+            # set c, pop / set x, pop / set y, pop / sub pc, 1
+            0x6041, 0x6061, 0x6081, 0x8b83,
+        ]
+        # with SP at 0 they wrap around, then again with room.
+        self.assert_same_as_interpreter(code)
+        self.assertRegisters(C=5, X=2, Y=1, SP=0)
+        self.setUp()
+        # set sp, 0x100
+        self.assert_same_as_interpreter([0x7f61, 0x0100] + code)
+        self.assertRegisters(C=5, X=2, Y=1, SP=0x100)
+        self.assertRAM(0xfd, 5)
+        self.assertRAM(0xff, 1)
+
+    def test_copies(self):
+        sti = [0x3dde] * 4
+        for i, j in [(0x1000, 0x2000), (0x2001, 0x2000), (0x1fff, 0x2000),
+                (0xfffe, 0x2000)]:
+            self.setUp()
+            self.cpu.ram[0x2000:0x2004] = [1, 2, 3, 4]
+            # set i, i / set j, j / sti [i], [j] x 4 / sub pc, 1
+            self.assert_same_as_interpreter([0x7cc1, i, 0x7ce1, j] + sti +
+                [0x8b83])
+            self.assertRegisters(I=(i + 4) & 0xffff, J=j + 4)
+
+    def test_self_modifying(self):
+        self.assert_same_as_interpreter([
+            # set sp, 8 / set push, 0x8c61 / set push, 0x8c41
+            0x7f61, 0x0008, 0x7f01, 0x8c61, 0x7f01, 0x8c41,
+            # set c, 0 / set x, 0 (to be set c, 2 / set x, 2) / sub pc, 1
+            0x8441, 0x8461, 0x8b83,
+        ])
+        self.assertRegisters(C=2, X=2)
+
+    def test_end_of_ram(self):
+        # ife a, 1 / set pc, 4 / set pc, 0xffff, with set a, 1 at 0xffff
+        code = [0x8812, 0x9781, 0x7f81, 0xffff] + [0] * 0xfffb + [0x8801]
+        self.assert_same_as_interpreter(code, steps=4)
+        self.assertRegisters(A=1, PC=4)
+
+
+class TestPairs(unittest.TestCase):
+    def setUp(self):
+        self.cpu = DCPU16()
+
+    def test_pairs(self):
+        self.cpu.ram[:len(TestFusion.loop)] = TestFusion.loop
+        counts = pairs(self.cpu)
+        self.assertEqual(counts, {("set", "set"): 1, ("set", "add"): 1,
+            ("add", "sti"): 1, ("sti", "ifn"): 1, ("ifn", "set"): 1})
+
+    def test_profile(self):
+        # set a, 1 / set b, 2 / add a, b / sub pc, 1
+        self.cpu.ram[:4] = [0x8801, 0x8c21, 0x0402, 0x8b83]
+        result, counts = profile(self.cpu, max_instructions=5)
+        self.assertEqual(result.instructions, 5)
+        self.assertEqual(counts, {("set", "set"): 1, ("set", "add"): 1,
+            ("add", "sub"): 1, ("sub", "sub"): 1})
+
+    def test_report(self):
+        lines = report({("set", "set"): 1, ("ife", "set"): 3}, 1)
+        self.assertEqual(lines, ["       3  ife / set"])
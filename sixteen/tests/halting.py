@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from sixteen.dcpu16 import DCPU16
+from sixteen.devices import Hardware, Keyboard
+from sixteen.blocks import BlockCompiler
+from sixteen.halting import FastForward, idle_loop, HaltWord, IllegalOpcode, \
+    SelfLoop, OutsideRange
+from sixteen.utilities import OpcodeError
+from sixteen.tests.dcpu16 import BaseDCPU16Test
+from sixteen.tests.devices import TestDevice
+
+
+class Alarm(Hardware):
+    "A device that interrupts once, at a particular cycle."
+    def __init__(self, cpu, at):
+        self.cpu = cpu
+        self.at = at
+        self.rang = False
+
+    def on_cycle(self, changed_registers, changed_ram):
+        if not self.rang and self.cpu.cycles >= self.at:
+            self.rang = True
+            return 0x0042
+
+    def next_event(self, cycles):
+        return None if self.rang else self.at
+
+
+class TestIdleLoops(unittest.TestCase):
+    def setUp(self):
+        self.cpu = DCPU16()
+
+    def idle(self, words, address=0):
+        self.cpu.ram[:len(words)] = words
+        return idle_loop(self.cpu, address)
+
+    def test_sub_pc(self):
+        self.assertEqual(self.idle([0x8b83]), 1)
+
+    def test_set_pc(self):
+        # set a, 1 / set pc, 1
+        self.assertEqual(self.idle([0x8801, 0x7f81, 0x0001], 1), 3)
+
+    def test_poll(self):
+        # ife [0x1000], 0 / set pc, 0
+        self.assertEqual(self.idle([0x87d2, 0x1000, 0x8781]), 3)
+
+    def test_not_idle(self):
+        # add a, 1 / sub pc, 2
+        self.assertEqual(self.idle([0x8802, 0x8f83]), None)
+        # ife pop, 0 / set pc, 0
+        self.assertEqual(self.idle([0x8712, 0x8781]), None)
+        # set pc, a
+        self.assertEqual(self.idle([0x0381]), None)
+        # ife a, 0 / set pc, 0x10 (somewhere else)
+        self.assertEqual(self.idle([0x8412, 0xc781]), None)
+
+
+class TestFastForward(BaseDCPU16Test, unittest.TestCase):
+    program = [
+        # ias 4 / sub pc, 1
+        0x9540, 0x8b83, 0, 0,
+        # set b, a / ife [0x1000], 0 / set pc, 5
+        0x0021, 0x87d2, 0x1000, 0x9b81,
+    ]
+
+    def both(self, alarm=None, step=None, cycles=None, steps=1000):
+        """Run the program fast-forwarding, checking it agrees with the
+        interpreter; returns how many steps it took.
+        """
+        interpreted = DCPU16()
+        if alarm is not None:
+            self.cpu.hardware.append(Alarm(self.cpu, alarm))
+            interpreted.hardware.append(Alarm(interpreted, alarm))
+        self.forward = FastForward(self.cpu,
+            step(self.cpu).step if step else None)
+        if cycles is not None:
+            self.forward.budget = self.cpu.cycles + cycles
+        return self.assert_same_as_interpreter(self.program,
+            self.forward.step, steps, cycles, interpreted)
+
+    def test_budget(self):
+        steps = self.both(cycles=10000)
+        self.assertTrue(self.cpu.cycles >= 10000)
+        self.assertTrue(self.forward.skipped > 9000)
+        self.assertTrue(steps < 10)
+
+    def test_device_event(self):
+        self.both(alarm=5001, cycles=10000)
+        self.assertRegister("B", 0x42)
+        self.assertRegister("PC", 5)
+        # it waits on the alarm, and then on the flag.
+        self.assertEqual(self.forward.skips, 2)
+        self.assertTrue(self.forward.skipped > 9000)
+
+    def test_blocks(self):
+        self.both(alarm=5001, cycles=10000, step=BlockCompiler)
+        self.assertTrue(self.forward.skipped > 9000)
+
+    def test_no_budget(self):
+        # with nothing to wait for, there's nowhere to skip to.
+        self.both(steps=100)
+        self.assertEqual(self.forward.skipped, 0)
+
+    def test_busy_devices(self):
+        cpu = DCPU16([TestDevice()])
+        cpu.ram[:2] = self.program[:2]
+        forward = FastForward(cpu)
+        forward.run(cycles=1000)
+        self.assertEqual(forward.skipped, 0)
+
+    def test_keyboard(self):
+        keyboard = Keyboard()
+        self.assertEqual(keyboard.next_event(10), None)
+        keyboard.interrupt_mode = True
+        keyboard.register_keypress(0x20)
+        self.assertEqual(keyboard.next_event(10), 10)
+
+
+class TestHalts(unittest.TestCase):
+    def setUp(self):
+        self.cpu = DCPU16()
+        # set a, 1 / add a, 1 / <end>
+        self.cpu.ram[:2] = [0x8801, 0x8802]
+
+    def test_illegal(self):
+        self.cpu.ram[2] = 0x0018
+        result = self.cpu.run(halts=[IllegalOpcode()])
+        self.assertEqual(result.reason, "halt")
+        self.assertTrue(isinstance(result.halt, IllegalOpcode))
+        self.assertEqual(result.error, None)
+        self.assertEqual((result.instructions, result.cycles), (2, 3))
+        self.assertEqual(self.cpu.registers["PC"], 2)
+
+    def test_word(self):
+        halt = HaltWord(0x8802)
+        result = self.cpu.run(halts=[IllegalOpcode(), halt])
+        self.assertTrue(result.halt is halt)
+        self.assertEqual(result.instructions, 1)
+
+    def test_self_loop(self):
+        # sub pc, 1
+        self.cpu.ram[2] = 0x8b83
+        result = self.cpu.run(cycles=100, halts=[SelfLoop()])
+        self.assertEqual(result.reason, "halt")
+        self.assertEqual(self.cpu.registers["PC"], 2)
+        # set pc, 3
+        self.cpu.ram[2:4] = [0x9381, 0x9381]
+        result = self.cpu.run(cycles=100, halts=[SelfLoop()])
+        self.assertEqual(result.reason, "halt")
+        self.assertEqual(self.cpu.registers["PC"], 3)
+        self.assertEqual(result.instructions, 1)
+
+    def test_outside(self):
+        result = self.cpu.run(halts=[OutsideRange(0, 2)])
+        self.assertEqual(result.reason, "halt")
+        self.assertEqual(self.cpu.registers["PC"], 2)
+
+    def test_strict(self):
+        result = self.cpu.run()
+        self.assertEqual(result.reason, "error")
+        self.cpu.registers["PC"] = 0
+        with self.assertRaises(OpcodeError):
+            self.cpu.run(strict=True)
+
+    def test_blocks(self):
+        blocks = BlockCompiler(self.cpu)
+        result = blocks.run(halts=[HaltWord()])
+        self.assertEqual(result.reason, "halt")
+        self.assertEqual(self.cpu.registers["A"], 2)
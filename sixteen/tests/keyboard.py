@@ -9,10 +9,10 @@ from sixteen.tests.dcpu16 import BaseDCPU16Test
 class KeyboardTest(BaseDCPU16Test, unittest.TestCase):
     def setUp(self):
         self.device = Keyboard()
-        self.cpu = DCPU16([self.device])
+        self.cpu = DCPU16([self.device], paged=self.paged)
 
     def test_multiple_interrupts(self):
-        self.cpu.ram[:5] = [
+        self.cpu.ram[:10] = [
             # ias, :handler
             0x7d40, 0x0007,
             # turn on hardware interrupts with message "0xbeef"
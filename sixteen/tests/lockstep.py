@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import random
+import unittest
+from sixteen.dcpu16 import DCPU16
+from sixteen.utilities import OpcodeError
+from sixteen.registers import A, B, PC
+from sixteen.lockstep import Lockstep, numpy
+
+
+class TestLockstep(unittest.TestCase):
+    def setUp(self):
+        # don't let the lockstep engine go untested without anyone noticing.
+        if numpy is None:
+            self.fail("numpy isn't installed, so Lockstep can't be tested; "
+                "pip install sixteen[lockstep], or run python setup.py test")
+
+    def compare(self, machines, **conditions):
+        """Run some machines in lockstep and each of them on its own,
+        checking they agree; returns the lockstep results.
+        """
+        cpus = [machines.machine(i) for i in xrange(machines.n)]
+        results = machines.run(**conditions)
+        for i, (cpu, result) in enumerate(zip(cpus, results)):
+            # run counted loops a word at a time, like Lockstep does.
+            cpu.bulk = False
+            try:
+                expected = cpu.run(**conditions)
+            except (ZeroDivisionError, ValueError) as e:
+                self.assertEqual(result.reason, "error")
+                self.assertEqual(type(result.error), type(e))
+            else:
+                self.assertEqual(result.reason, expected.reason)
+                self.assertEqual(result.instructions, expected.instructions)
+                self.assertEqual(result.cycles, expected.cycles)
+            machine = machines.machine(i)
+            self.assertEqual(machine.registers, cpu.registers)
+            self.assertEqual(machine.cycles, cpu.cycles)
+            self.assertEqual(machine.queuing, cpu.queuing)
+            self.assertEqual(machine.ram, cpu.ram)
+        return results
+
+    def test_loop(self):
+        # set i, 0x1000 / add a, 3 / sti [i], a / ifn i, 0x1010 / sub pc, 5
+        # / sub pc, 1
+        cpu = DCPU16()
+        cpu.ram[:8] = [0x7cc1, 0x1000, 0x9002, 0x01de, 0x7cd3, 0x1010, 0x9b83,
+            0x8b83]
+        machines = Lockstep(4, cpu)
+        machines.registers[:, A] = [0, 1, 2, 0xffff]
+        results = self.compare(machines, breakpoints=[7])
+        self.assertEqual([r.reason for r in results], ["breakpoint"] * 4)
+        self.assertEqual(machines.ram[:, 0x1001].tolist(), [6, 7, 8, 5])
+
+    def test_diverging(self):
+        machines = Lockstep(3)
+        machines.ram[:, :8] = [
+            # ifg a, 1 / set pc, 4 / set b, 1 / sub pc, 1
+            0x8814, 0x9781, 0x8821, 0x8b83,
+            # mul a, a / set b, 2 / sub pc, 1
+            0x0004, 0x8c21, 0x8b83, 0,
+        ]
+        machines.registers[:, A] = [0, 2, 300]
+        self.compare(machines, cycles=50)
+        self.assertEqual(machines.registers[:, B].tolist(), [1, 2, 2])
+        self.assertEqual(machines.registers[:, PC].tolist(), [3, 6, 6])
+
+    def test_errors(self):
+        machines = Lockstep(2)
+        # dvi a, b / dat 0
+        machines.ram[:, :2] = [0x0407, 0]
+        machines.registers[:, B] = [0, 1]
+        results = self.compare(machines, max_instructions=5)
+        self.assertEqual(results[0].reason, "error")
+        self.assertIsInstance(results[0].error, ZeroDivisionError)
+        self.assertIsInstance(results[1].error, OpcodeError)
+        self.assertEqual(results[1].error.address, 1)
+
+    def test_interrupts(self):
+        machines = Lockstep(2)
+        machines.ram[:, :8] = [
+            # ias 5 / int 3 / sub pc, 1 / dat 0, 0
+            0x9940, 0x9100, 0x8b83, 0, 0,
+            # set b, a / rfi 0
+            0x0021, 0x8560, 0,
+        ]
+        machines.queuing[1] = True
+        self.compare(machines, cycles=30)
+
+    def test_fuzz(self):
+        rng = random.Random(16)
+        for _ in xrange(3):
+            cpu = DCPU16()
+            cpu.ram[:0x100] = [rng.randrange(0x10000) for _ in xrange(0x100)]
+            machines = Lockstep(16, cpu)
+            for slot in xrange(12):
+                machines.registers[:, slot] = [rng.randrange(0x100)
+                    for _ in xrange(16)]
+            self.compare(machines, cycles=200)
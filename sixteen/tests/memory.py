@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+import mmap
+import tempfile
+import unittest
+from StringIO import StringIO
+from sixteen.dcpu16 import DCPU16
+from sixteen.memory import RAM, PagedRAM, page_size, words
+from sixteen.utilities import file_to_ram
+
+
+class TestRAM(unittest.TestCase):
+    def setUp(self):
+        self.ram = RAM(0x10000)
+        self.written = []
+        self.ram.watchers.append(lambda *r: self.written.append(r))
+
+    def test_size(self):
+        self.assertEqual(len(self.ram), 0x10000)
+        self.assertEqual(self.ram.itemsize, 2)
+
+    def test_truncates(self):
+        self.ram[0] = 0x12345
+        self.ram[1:3] = [-1, 0x10000]
+        self.assertEqual(list(self.ram[:3]), [0x2345, 0xffff, 0])
+        self.assertEqual(self.written, [(0, 1), (1, 3)])
+
+    def test_negative_index(self):
+        self.ram[-1] = 0xbeef
+        self.assertEqual(self.ram[0xffff], 0xbeef)
+        self.assertEqual(self.written, [(0xffff, 0x10000)])
+
+    def test_fixed_size(self):
+        with self.assertRaises(ValueError):
+            self.ram[:5] = [1, 2, 3, 4, 5, 6]
+        with self.assertRaises(ValueError):
+            self.ram[0:8:2] = [1, 2]
+        self.assertEqual(len(self.ram), 0x10000)
+        self.assertEqual(self.written, [])
+
+    def test_load(self):
+        loaded = self.ram.load("\x7c\x01\xbe\xef\x00", offset=2)
+        self.assertEqual(loaded, 2)
+        self.assertEqual(list(self.ram[:5]), [0, 0, 0x7c01, 0xbeef, 0])
+        # one notification for the whole program
+        self.assertEqual(self.written, [(2, 4)])
+
+    def test_little_endian(self):
+        self.assertEqual(list(words("\x01\x7c\xef\xbe", False)),
+            [0x7c01, 0xbeef])
+
+    def test_load_mmap(self):
+        with tempfile.TemporaryFile() as f:
+            f.write("\x7c\x01\xbe\xef")
+            f.flush()
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.ram.load(mapped)
+            mapped.close()
+        self.assertEqual(list(self.ram[:2]), [0x7c01, 0xbeef])
+
+    def test_load_end(self):
+        # anything past the end of RAM gets left off
+        self.assertEqual(self.ram.load("\xff\xff" * 4, offset=0xfffe), 2)
+        self.assertEqual(len(self.ram), 0x10000)
+
+    def test_file_to_ram(self):
+        cpu = DCPU16()
+        file_to_ram(StringIO("\x7c\x01\xbe\xef"), cpu, offset=1)
+        self.assertEqual(list(cpu.ram[:3]), [0, 0x7c01, 0xbeef])
+
+
+class TestPagedRAM(unittest.TestCase):
+    def setUp(self):
+        self.ram = PagedRAM(0x10000)
+        self.written = []
+        self.ram.watchers.append(lambda *r: self.written.append(r))
+
+    def test_like_ram(self):
+        self.ram[0] = 0x12345
+        self.ram[0x3fe:0x402] = [1, 2, 3, -1]
+        self.assertEqual(len(self.ram), 0x10000)
+        self.assertEqual(self.ram[0], 0x2345)
+        self.assertEqual(self.ram[-1], 0)
+        self.assertEqual(list(self.ram[0x3fe:0x402]), [1, 2, 3, 0xffff])
+        self.assertEqual(list(self.ram[0x3fe:0x402:2]), [1, 3])
+        self.assertEqual(self.written, [(0, 1), (0x3fe, 0x402)])
+        ram = RAM(0x10000)
+        ram[0] = 0x2345
+        ram[0x3fe:0x402] = [1, 2, 3, 0xffff]
+        self.assertEqual(self.ram, ram)
+        self.assertEqual(self.ram.tolist(), ram.tolist())
+
+    def test_negative_index(self):
+        self.ram[-1] = 0xbeef
+        self.assertEqual(self.ram[0xffff], 0xbeef)
+        self.assertEqual(self.written, [(0xffff, 0x10000)])
+
+    def test_fixed_size(self):
+        with self.assertRaises(ValueError):
+            self.ram[:4] = [1, 2, 3]
+
+    def test_load(self):
+        self.assertEqual(self.ram.load("\x7c\x01\xbe\xef", offset=0x3ff), 2)
+        self.assertEqual(list(self.ram[0x3ff:0x401]), [0x7c01, 0xbeef])
+        self.assertEqual(self.written, [(0x3ff, 0x401)])
+
+    def test_sparse(self):
+        self.assertEqual(self.ram.resident, 0)
+        self.assertEqual(self.ram[0x8000], 0)
+        self.ram[0x8000] = 1
+        self.ram[0x8001] = 2
+        self.assertEqual(self.ram.resident, page_size * 2)
+        self.ram[0x3ff:0x401] = [1, 1]
+        self.assertEqual(self.ram.resident, page_size * 6)
+        # a clone shares what's been written
+        self.assertEqual(self.ram.clone().resident, page_size * 6)
+        self.assertEqual(RAM(0x10000).resident, 0x20000)
+
+    def test_clone(self):
+        self.ram[5] = 1
+        clone = self.ram.clone()
+        self.assertEqual(clone, self.ram)
+        # the pages are shared until someone writes to them
+        self.assertTrue(all(a is b for a, b in zip(clone.pages,
+            self.ram.pages)))
+        clone[5] = 2
+        self.ram[0x8000] = 3
+        self.assertEqual((self.ram[5], clone[5]), (1, 2))
+        self.assertEqual((self.ram[0x8000], clone[0x8000]), (3, 0))
+        shared = sum(a is b for a, b in zip(clone.pages, self.ram.pages))
+        self.assertEqual(shared, len(clone.pages) - 2)
+
+    def test_snapshot(self):
+        self.ram[5] = 1
+        snapshot = self.ram.snapshot()
+        self.ram[5] = 2
+        self.ram[0x8000] = 3
+        del self.written[:]
+        self.ram.restore(snapshot)
+        self.assertEqual((self.ram[5], self.ram[0x8000]), (1, 0))
+        # only the pages that changed get mentioned
+        self.assertEqual(self.written, [(0, 0x400), (0x8000, 0x8400)])
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"Run the cpu, block and device tests again with paged RAM, and test cloning."
+
+import unittest
+from sixteen.dcpu16 import DCPU16
+from sixteen.blocks import BlockCompiler
+from sixteen.tests import dcpu16, blocks, devices, keyboard
+
+
+class PagedTest(object):
+    paged = True
+
+
+# make a paged version of every test case in those modules.
+globals().update(dcpu16.variants("Paged", PagedTest, dcpu16, blocks, devices,
+    keyboard))
+
+
+class TestClone(unittest.TestCase):
+    paged = False
+    # set a, 0x1000 / add a, 1 / set [a], a / sub pc, 3
+    code = [0x7c01, 0x1000, 0x8802, 0x0101, 0x9383]
+
+    def setUp(self):
+        self.cpu = DCPU16(paged=self.paged)
+        self.cpu.ram[:len(self.code)] = self.code
+        self.cpu.run(max_instructions=4)
+
+    def test_clone(self):
+        clone = self.cpu.clone()
+        self.assertEqual(clone.registers, self.cpu.registers)
+        self.assertEqual(clone.ram, self.cpu.ram)
+        self.assertEqual(clone.cycles, self.cpu.cycles)
+        clone.run(max_instructions=30)
+        self.assertNotEqual(clone.registers, self.cpu.registers)
+        self.assertEqual(self.cpu.ram[0x1002], 0)
+        self.assertEqual(clone.ram[0x1002], 0x1002)
+        # and they carry on the same way
+        self.cpu.run(max_instructions=30)
+        self.assertEqual(clone.registers, self.cpu.registers)
+        self.assertEqual(clone.ram, self.cpu.ram)
+
+    def test_snapshot(self):
+        snapshot = self.cpu.snapshot()
+        registers, cycles = self.cpu.registers.copy(), self.cpu.cycles
+        blocks = BlockCompiler(self.cpu)
+        blocks.run(max_instructions=10)
+        self.cpu.restore(snapshot)
+        self.assertEqual(self.cpu.registers, registers)
+        self.assertEqual(self.cpu.cycles, cycles)
+        self.assertEqual(self.cpu.ram[0x1002], 0)
+        self.assertEqual(self.cpu.ram[:5].tolist(), self.code)
+        # it can be restored more than once
+        self.cpu.run(max_instructions=10)
+        self.cpu.restore(snapshot)
+        self.assertEqual(self.cpu.registers, registers)
+
+
+class TestPagedClone(TestClone):
+    paged = True
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from sixteen.dcpu16 import DCPU16
+from sixteen.registers import RegisterView, names, named, A, PC, IA
+
+
+class TestRegisters(unittest.TestCase):
+    def test_slots(self):
+        cpu = DCPU16()
+        cpu.registers["PC"] = 0x1234
+        self.assertEqual(cpu.register_file[PC], 0x1234)
+        cpu.register_file[A] = 7
+        self.assertEqual(cpu.registers["A"], 7)
+        self.assertEqual(cpu.a, 7)
+
+    def test_view(self):
+        file = [0] * len(names)
+        view = RegisterView(file)
+        view["IA"] = 3
+        self.assertEqual(file[IA], 3)
+        self.assertEqual(list(view), names)
+        self.assertEqual(view.get("Q", 5), 5)
+        self.assertTrue("EX" in view)
+        self.assertEqual(dict(view.items())["IA"], 3)
+        self.assertEqual(view, RegisterView(list(file)))
+        self.assertEqual(view, dict((name, 3 if name == "IA" else 0)
+            for name in names))
+        self.assertNotEqual(view, RegisterView([0] * len(names)))
+
+    def test_named(self):
+        self.assertEqual(named({A: 1, PC: 2}), {"A": 1, "PC": 2})
+
+    def test_properties(self):
+        cpu = DCPU16()
+        cpu.pc = 0x12345
+        cpu.EX = 3
+        self.assertEqual(cpu.register_file[PC], 0x2345)
+        self.assertEqual((cpu.PC, cpu.ex, cpu.Ex), (0x2345, 3, 3))
+        self.assertFalse("pc" in vars(cpu))
+
+    def test_tuples(self):
+        cpu = DCPU16()
+        cpu.registers["IA"] = 5
+        registers = cpu.register_tuple()
+        self.assertEqual(registers, tuple(cpu.registers.values()))
+        cpu.set_register_tuple(range(len(names)))
+        self.assertEqual(cpu.a, 0)
+        self.assertEqual(cpu.ia, 11)
+        cpu.set_register_tuple(registers)
+        self.assertEqual(cpu.register_tuple(), registers)
+        with self.assertRaises(ValueError):
+            cpu.set_register_tuple([0])
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from sixteen.dcpu16 import DCPU16
+from sixteen.devices import Hardware, Keyboard, polled
+from sixteen.screen import LEM1802
+from sixteen.scheduler import MemoryMap
+from sixteen.tests.devices import TestDevice
+
+
+class Timer(Hardware):
+    "A device that wants to be called at some cycle counts."
+    def __init__(self, *at):
+        self.at = list(at)
+        self.calls = []
+
+    def next_event(self, cycles):
+        return self.at[0] if self.at else None
+
+    def on_event(self, cycles, changed_ram):
+        self.calls.append(cycles)
+        if self.at and cycles >= self.at[0]:
+            self.at.pop(0)
+            return 0x0042
+
+
+class Watcher(Hardware):
+    "A device that watches some memory."
+    def __init__(self, start, stop):
+        self.range = start, stop
+        self.calls = []
+
+    def watched(self):
+        return [self.range + ("stack",)]
+
+    def on_write(self, region, offset, value):
+        self.calls.append((region, offset, value))
+
+
+class RangeWatcher(Watcher):
+    "A device that watches some memory a run of writes at a time."
+    def on_write_range(self, region, offset, values):
+        self.calls.append((region, offset, list(values)))
+
+
+class TestScheduler(unittest.TestCase):
+    # ias 0x10 / set push, a / sub pc, 1
+    program = [0x7d40, 0x0010, 0x0301, 0x8b83]
+    # :0x10 add b, 1 / rfi 0
+    handler = [0x8822, 0x8560]
+
+    def setUp(self):
+        self.timer = Timer(10, 20)
+        self.watcher = Watcher(0xfff0, 0x10000)
+        self.cpu = DCPU16([self.timer, self.watcher])
+        self.cpu.ram[:len(self.program)] = self.program
+        self.cpu.ram[0x10:0x12] = self.handler
+
+    def test_polled(self):
+        self.assertTrue(polled(TestDevice()))
+        self.assertFalse(polled(Keyboard()))
+        self.assertFalse(polled(Hardware()))
+
+    def test_events(self):
+        self.cpu.run(cycles=30)
+        # it only gets called once each time is up
+        self.assertEqual(len(self.timer.calls), 2)
+        self.assertTrue(10 <= self.timer.calls[0] < 12)
+        self.assertTrue(20 <= self.timer.calls[1] < 22)
+        self.assertEqual(self.cpu.registers["B"], 2)
+
+    def test_watched(self):
+        self.cpu.run(max_instructions=3)
+        # just the push goes there
+        self.assertEqual(self.watcher.calls, [("stack", 0xf, 0)])
+
+    def test_runs(self):
+        ranged, plain = RangeWatcher(0x1000, 0x1100), Watcher(0x1000, 0x1100)
+        cpu = DCPU16([ranged, plain])
+        cpu.bulk = True
+        cpu.ram[0x2000:0x2020] = range(0x20)
+        # set i, 0x0ff0 / set j, 0x2000 / sti [i], [j] / ifn i, 0x1010 /
+        # sub pc, 4
+        cpu.ram[:8] = [0x7cc1, 0x0ff0, 0x7ce1, 0x2000, 0x3dde, 0x7cd3,
+            0x1010, 0x9783]
+        while cpu.registers["PC"] != 8:
+            cpu.cycle()
+        # the copy goes to a device that knows about runs in one call, and
+        # to anything else a word at a time.
+        self.assertEqual(ranged.calls, [("stack", 0, range(0x10, 0x20))])
+        self.assertEqual(plain.calls, [("stack", n, 0x10 + n)
+            for n in range(0x10)])
+
+    def test_legacy(self):
+        device = TestDevice()
+        self.cpu.hardware.append(device)
+        self.cpu.run(max_instructions=2)
+        device.interrupt_next()
+        self.cpu.run(max_instructions=1)
+        self.assertEqual(self.cpu.registers["A"], 0xdead)
+
+    def test_keyboard(self):
+        keyboard = Keyboard()
+        cpu = DCPU16([keyboard])
+        # ias 0x10 / set a, 3 / set b, 0xbeef / hwi 0 / sub pc, 1
+        cpu.ram[:7] = [0x7d40, 0x0010, 0x9001, 0x7c21, 0xbeef, 0x8640, 0x8b83]
+        cpu.run(max_instructions=10)
+        self.assertEqual(cpu.registers["A"], 3)
+        # a keypress from outside gets noticed straight away
+        keyboard.register_keypress(0x20)
+        cpu.run(max_instructions=1)
+        self.assertEqual(cpu.registers["A"], 0xbeef)
+        self.assertEqual(cpu.registers["PC"], 0x10)
+
+    def test_screen(self):
+        screen = []
+        lem = LEM1802(change_screen=lambda *args: screen.append(args))
+        cpu = DCPU16([lem])
+        self.assertEqual(lem.watched(), [])
+        # set a, 0 / set b, 0x8000 / hwi 0 / set [0x8001], 0xf041 /
+        # set [0x9000], 1
+        cpu.ram[:10] = [0x8401, 0x7c21, 0x8000, 0x8640,
+            0x7fc1, 0xf041, 0x8001, 0x8bc1, 0x9000, 0x0000]
+        cpu.run(max_instructions=5)
+        self.assertEqual(lem.watched(), [(0x8000, 0x8182, "screen")])
+        self.assertEqual(screen, [(1, 0xf, 0, 0, 0x41)])
+
+
+class TestMemoryMap(unittest.TestCase):
+    def setUp(self):
+        self.memory = MemoryMap()
+        self.memory.map("screen", [(0x8000, 0x8182, "screen"),
+            (0x8180, 0x8190)])
+        self.memory.map("stack", [(0xfff0, 0x10000)])
+
+    def test_find(self):
+        self.assertEqual(self.memory.find(0x8000), [("screen", "screen", 0)])
+        self.assertEqual(self.memory.find(0x8181), [("screen", "screen",
+            0x181), ("screen", None, 1)])
+        self.assertEqual(self.memory.find(0xffff), [("stack", None, 0xf)])
+        self.assertEqual(self.memory.find(0x7fff), [])
+        # addresses that aren't anywhere near anything don't have a page
+        self.assertEqual(self.memory.pages[0x10], None)
+
+    def test_remap(self):
+        self.memory.map("screen", [(0x1000, 0x1010)])
+        self.assertEqual(self.memory.find(0x8000), [])
+        self.assertEqual(self.memory.find(0x1001), [("screen", None, 1)])
+        self.assertEqual(self.memory.pages[0x80], None)
+        self.memory.unmap("stack")
+        self.assertEqual(self.memory.find(0xffff), [])
+        self.assertEqual([n for n, page in enumerate(self.memory.pages)
+            if page], [0x10])
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from sixteen.dcpu16 import DCPU16
+from sixteen.traces import Tracer
+from sixteen.tests.dcpu16 import BaseDCPU16Test
+
+
+class TestTracer(BaseDCPU16Test, unittest.TestCase):
+    # copy 0x200 words from 0x1000 to 0x2000, adding them up in b as we go.
+    memcpy = [
+        # set i, 0x2000 / set j, 0x1000
+        0x7cc1, 0x2000, 0x7ce1, 0x1000,
+        # loop: add b, [j] / sti [i], [j] / ifn i, 0x2200 / sub pc, 5
+        0x3c22, 0x3dde, 0x7cd3, 0x2200, 0x9b83,
+        # set c, 1
+        0x8841,
+    ]
+
+    def setUp(self):
+        self.cpu = DCPU16()
+        self.tracer = Tracer(self.cpu, threshold=10, iterations=64)
+        for n in xrange(0x200):
+            self.cpu.ram[0x1000 + n] = n * 7
+
+    def run_both(self, code):
+        "Run some code with a tracer and without, checking they agree."
+        self.assert_same_as_interpreter(code, self.tracer.step,
+            steps=0x10000)
+
+    def test_memcpy(self):
+        self.run_both(self.memcpy)
+        self.assertRegister("C", 1)
+        self.assertRAM(0x21ff, (0x1ff * 7) & 0xffff)
+        report = self.tracer.report()
+        self.assertEqual(len(report["traces"]), 1)
+        trace = report["traces"][0]
+        self.assertEqual(trace["header"], 4)
+        self.assertEqual(trace["length"], 4)
+        # it only leaves the loop once, when the ifn fails
+        self.assertEqual(trace["guard failures"], 1)
+        self.assertTrue(report["cycles"]["trace"] >
+                report["cycles"]["interpreter"])
+
+    def test_branches(self):
+        self.run_both([
+            # set a, 0x300
+            0x7c01, 0x0300,
+            # loop: ifb a, 1 / add b, 1 / sub a, 1 / ifn a, 0 / sub pc, 6
+            0x8810, 0x8822, 0x8803, 0x8413, 0x9b83,
+        ])
+        self.assertRegister("B", 0x180)
+        # the ifb goes both ways, so it can't stay in the trace for long
+        trace = self.tracer.report()["traces"][0]
+        self.assertTrue(trace["failure rate"] > 0.9)
+
+    def test_invalidation(self):
+        self.run_both(self.memcpy)
+        self.assertEqual(len(self.tracer.traces), 1)
+        # add b, j
+        self.cpu.ram[4] = 0x1c22
+        self.assertEqual(len(self.tracer.traces), 0)
+        self.assertEqual(self.tracer.invalidations, 1)
+
+    def test_untraceable(self):
+        self.run_both([
+            # set a, 0x100 / loop: hwn b / sub a, 1 / ifn a, 0 / sub pc, 4
+            0x7c01, 0x0100, 0x0600, 0x8803, 0x8413, 0x9783,
+        ])
+        self.assertEqual(self.tracer.traces, {2: None})
+        self.assertEqual(self.tracer.report()["traces"], [])
+
+    def test_modified_while_recording(self):
+        self.run_both([
+            # set a, 0x30 / loop: add b, 1 / sub a, 1 / ife a, 0x25 /
+            # set [2], 0x0600 (hwn b) / ifn a, 0 / sub pc, 9
+            0x7c01, 0x0030, 0x8822, 0x8803, 0x7c12, 0x0025,
+            0x7fc1, 0x0600, 0x0002, 0x8413, 0xab83,
+        ])
+        self.assertRegister("A", 0)
+        # the hwn it recorded over can't go in a trace
+        self.assertEqual(self.tracer.traces, {2: None})
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""Tracing hot loops. The cpu runs as usual, counting how many times each
+backwards jump lands on its target; once a target gets hot enough, the next
+trip around the loop is recorded, and the path it took gets compiled into a
+Python function that runs the loop over and over until something goes a
+different way than it did while recording. Then it hands control back to the
+interpreter.
+"""
+
+import time
+from sixteen.bits import as_signed, from_signed
+from sixteen.utilities import OpcodeError
+from sixteen.registers import slots, PC
+from sixteen.blocks import Instruction, arithmetic, conditions, names, \
+    standard, skip, translate_instruction
+
+
+# the operations that can appear in a trace; everything else needs the
+# interpreter (and usually the devices).
+traceable = set(arithmetic) | set(conditions) | set(["sti", "std", "iag",
+    "ias"])
+
+
+class Trace(object):
+    "A compiled loop and what happened when it ran."
+    def __init__(self, header, path, function):
+        self.header = header
+        # the addresses of the instructions, in the order they ran
+        self.path = path
+        self.function = function
+        self.source = function.source
+        # the number of times it's been entered, and how many times around
+        # the loop it's been in total
+        self.runs = 0
+        self.iterations = 0
+        # exits by guard index; guard 0 means it ran out of iterations.
+        self.exits = {}
+
+    @property
+    def guard_failures(self):
+        return sum(n for guard, n in self.exits.iteritems() if guard)
+
+    @property
+    def failure_rate(self):
+        "How often a run ended because a guard failed."
+        return float(self.guard_failures) / self.runs if self.runs else 0.0
+
+
+class Tracer(object):
+    """Runs a cpu a step at a time, tiering up hot loops into traces. Call
+    `step` in place of `cpu.step`.
+    """
+    # the number of backwards jumps to an address before it gets traced.
+    threshold = 50
+    # the longest a loop can be, in instructions, and still get traced.
+    limit = 128
+    # the most times a trace goes around before letting the devices see.
+    iterations = 256
+
+    def __init__(self, cpu, threshold=None, iterations=None):
+        self.cpu = cpu
+        if threshold is not None:
+            self.threshold = threshold
+        if iterations is not None:
+            self.iterations = iterations
+        # backwards jump targets to the number of times they've been hit
+        self.counters = {}
+        # loop headers to Traces, or None if they can't be traced
+        self.traces = {}
+        # the addresses each trace depends on
+        self.covering = {}
+        # the header and the path so far, if we're recording.
+        self.recording = None
+        self.invalidations = 0
+        # the time (in seconds) and cycles spent in each tier; the time is
+        # only looked at when the tier changes, rather than every step.
+        self.time = {"interpreter": 0.0, "recording": 0.0, "trace": 0.0}
+        self.cycles = {"interpreter": 0, "recording": 0, "trace": 0}
+        # the tier running now, and when it started
+        self.tier = "interpreter"
+        self.since = time.time()
+        cpu.ram.watchers.append(self.invalidate)
+
+    def invalidate(self, start, stop):
+        "Throw away every trace that depends on an address in this range."
+        if self.recording is not None:
+            # don't finish a recording of code that's changed under us
+            header, path = self.recording
+            if any(start <= a < stop for a in path):
+                self.recording = None
+        covering = self.covering
+        if not covering:
+            return
+        if stop - start > len(covering):
+            addresses = [a for a in covering if start <= a < stop]
+        else:
+            addresses = [a for a in xrange(start, stop) if a in covering]
+        for address in addresses:
+            for header in covering.pop(address, ()):
+                if header in self.traces:
+                    del self.traces[header]
+                    self.counters.pop(header, None)
+                    self.invalidations += 1
+
+    def step(self):
+        "Run a trace if there's one at PC; otherwise, run one instruction."
+        cpu = self.cpu
+        pc = cpu.register_file[PC]
+        trace = self.traces.get(pc)
+        if trace is not None:
+            return self.run_trace(trace)
+        tier = "interpreter" if self.recording is None else "recording"
+        if tier != self.tier:
+            self.switch(tier)
+        cycles = cpu.cycles
+        word = cpu.ram[pc]
+        queuing = cpu.queuing
+        state = cpu.step()
+        after = cpu.register_file[PC]
+        if self.recording is not None:
+            self.record(pc, after, queuing)
+        # SET PC, SUB PC, ADD PC (and so on) that went backwards
+        elif after < pc and word & 0x1f and (word >> 5) & 0x1f == 0x1c:
+            count = self.counters.get(after, 0) + 1
+            self.counters[after] = count
+            if count >= self.threshold and after not in self.traces:
+                self.recording = after, []
+        self.cycles[tier] += cpu.cycles - cycles
+        return state
+
+    def switch(self, tier):
+        """Move on to another tier, counting the time since the last switch
+        towards the one before.
+        """
+        now = time.time()
+        self.time[self.tier] += now - self.since
+        self.tier, self.since = tier, now
+
+    def run(self, **conditions):
+        "Like the cpu's `run`, using traces where there are some."
+        return self.cpu.run(step=self.step, **conditions)
+
+    def record(self, pc, after, queuing):
+        "Add an instruction that's just run to the recording."
+        header, path = self.recording
+        path.append(pc)
+        try:
+            instruction = Instruction(self.cpu, pc)
+        except OpcodeError:
+            instruction = None
+        if (instruction is None or instruction.mnemonic not in traceable or
+                not standard(self.cpu, instruction.mnemonic) or
+                # an interrupt happened in the middle of it
+                self.cpu.queuing != queuing or
+                len(path) > self.limit):
+            # give up on this one for good.
+            self.recording = None
+            self.traces[header] = None
+            self.covering.setdefault(header, set()).add(header)
+        elif after == header:
+            self.recording = None
+            self.compile(header, path)
+
+    def run_trace(self, trace):
+        "Run a trace and keep track of how it went."
+        cpu = self.cpu
+        if self.tier != "trace":
+            self.switch("trace")
+        cycles = cpu.cycles
+        state = cpu.direct_state()
+        guard, iterations = trace.function(state, cpu.register_file, cpu.ram,
+                state.ram.changes, self.iterations)
+        trace.runs += 1
+        trace.iterations += iterations
+        trace.exits[guard] = trace.exits.get(guard, 0) + 1
+        if cpu.hardware:
+            registers = cpu.register_file
+            state.registers.changes.update((r, registers[r])
+                    for r in trace.function.writes)
+        cpu.settle(state)
+        self.cycles["trace"] += cpu.cycles - cycles
+        return state
+
+    def compile(self, header, path):
+        """Compile a recorded path into a Trace, unless the code there isn't
+        all traceable any more.
+        """
+        cpu = self.cpu
+        try:
+            instructions = [Instruction(cpu, address) for address in path]
+        except OpcodeError:
+            instructions = None
+        if instructions is None or not all(i.mnemonic in traceable and
+                standard(cpu, i.mnemonic) for i in instructions):
+            self.traces[header] = None
+            self.covering.setdefault(header, set()).add(header)
+            return
+        covered = set()
+        for instruction in instructions:
+            covered.update(xrange(instruction.address, instruction.next))
+            if instruction.conditional:
+                covered.update(xrange(instruction.next,
+                    skip(cpu, instruction.next)[0]))
+        source, writes = self.translate(instructions, covered)
+        namespace = {
+            "as_signed": as_signed, "from_signed": from_signed,
+            "code": frozenset(covered),
+        }
+        exec compile(source, "<trace 0x%04x>" % header, "exec") in namespace
+        function = namespace["trace"]
+        function.source = source
+        function.writes = sorted(slots[r] for r in writes)
+        self.traces[header] = Trace(header, path, function)
+        for address in covered:
+            self.covering.setdefault(address, set()).add(header)
+
+    def translate(self, instructions, covered):
+        """Write the source of a trace function. It returns the index of the
+        guard that failed (or 0 if it ran out of iterations) and how many
+        times it went around.
+        """
+        body = []
+        reads = set()
+        writes = set(["PC"])
+        cycles = 0
+        guards = 0
+        for n, instruction in enumerate(instructions):
+            lines, used, written, stores = translate_instruction(instruction)
+            cycles += instruction.decoded.cost
+            body.append("# 0x%04x: %s" % (instruction.address,
+                instruction.mnemonic))
+            body.extend(lines)
+            reads |= used
+            writes |= written
+            # the address we expect to go to next
+            if n + 1 < len(instructions):
+                expected = instructions[n + 1].address
+            else:
+                expected = instructions[0].address
+            if instruction.conditional:
+                skip_to, skipped = skip(self.cpu, instruction.next)
+                guards += 1
+                if expected == instruction.next & 0xffff:
+                    # it passed while recording
+                    body.append("if not (%s):" %
+                            conditions[instruction.mnemonic])
+                    body.append(("exit", guards,
+                        "0x%04x" % (skip_to & 0xffff), cycles + skipped))
+                else:
+                    body.append("if %s:" % conditions[instruction.mnemonic])
+                    body.append(("exit", guards, "0x%04x" %
+                        (instruction.next & 0xffff), cycles))
+                    cycles += skipped
+            elif "PC" in written:
+                guards += 1
+                body.append("if PC != 0x%04x:" % expected)
+                body.append(("exit", guards, "PC", cycles))
+            if stores:
+                # if the loop just wrote to its own code, get out.
+                guards += 1
+                body.append("if store in code:")
+                body.append(("exit", guards, "0x%04x" % expected, cycles))
+        registers = sorted((reads | writes) & names)
+        stored = sorted((writes - set(["PC"])) & names)
+        lines = ["def trace(state, registers, ram, changed, iterations):"]
+        for r in registers:
+            lines.append("    %s = registers[%d]" % (r, slots[r]))
+        lines.append("    n = 0")
+        lines.append("    while True:")
+        for line in body:
+            if isinstance(line, tuple):
+                _, guard, pc, exit_cycles = line
+                for r in stored:
+                    lines.append("            registers[%d] = %s" %
+                            (slots[r], r))
+                lines.append("            registers[%d] = %s" % (PC, pc))
+                lines.append("            state.cycles += %d" % exit_cycles)
+                lines.append("            return %d, n" % guard)
+            else:
+                lines.append("        " + line)
+        lines.extend([
+            "        state.cycles += %d" % cycles,
+            "        n += 1",
+            "        if n == iterations:",
+        ])
+        for r in stored:
+            lines.append("            registers[%d] = %s" % (slots[r], r))
+        lines.extend([
+            "            registers[%d] = 0x%04x" % (PC, instructions[0].address),
+            "            return 0, n",
+        ])
+        return "\n".join(lines) + "\n", writes
+
+    def report(self):
+        "Summarize the traces and the tiers."
+        # bring the time for the tier we're in up to date
+        self.switch(self.tier)
+        traces = []
+        for header, trace in sorted(self.traces.iteritems()):
+            if trace is None:
+                continue
+            traces.append({
+                "header": header, "length": len(trace.path),
+                "runs": trace.runs, "iterations": trace.iterations,
+                "guard failures": trace.guard_failures,
+                "failure rate": trace.failure_rate,
+            })
+        return {
+            "traces": traces, "time": dict(self.time),
+            "cycles": dict(self.cycles), "invalidations": self.invalidations,
+        }
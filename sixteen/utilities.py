@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+from sixteen.memory import words
+
 
 class HexRead(object):
     "A file-like object for reading hex dumps with possible whitespace."
@@ -40,23 +42,8 @@ def file_to_ram(f, cpu, bigendian=True, offset=0):
     """Given a file-like object if 16-bit words and a cpu object with a RAM
     attribute, read words from the file and store them in the RAM.
     """
-    for n, _ in enumerate(cpu.ram[offset:]):
-        # read two bytes as ints
-        word = [ord(c) for c in f.read(2)]
-        # if there are exactly two bytes, go on
-        if len(word) == 2:
-            # unpack the top and the bottom of the word
-            if bigendian:
-                top, bottom = word
-            else:
-                bottom, top = word
-            # bitshift the top up and then add to the bottom
-            word_int = (top << 8) + bottom
-            # set this n in the ram to that number
-            cpu.ram[n] = word_int
-        # if there aren't two bytes, stop
-        else:
-            break
+    loaded = words(f.read(2 * (cpu.cells - offset)), bigendian)
+    cpu.ram[offset:offset + len(loaded)] = loaded
 
 class OpcodeError(Exception):
     def __init__(self, value, address=None):
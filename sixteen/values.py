@@ -1,143 +1,235 @@
 # -*- coding: utf-8 -*-
+"""Operands. There's one object per kind of operand, shared by every
+instruction and every cpu; none of them hold any state of their own. Instead,
+decoding an instruction `fetch`es each of its operands (a before b, as the
+spec says), which does anything that has to happen right then -- reading the
+next word, popping, pushing -- and returns a word to remember. `get` and `set`
+take the state and that word.
 
-from functools import wraps
+Instructions see their operands through `Operand`s, which each State keeps two
+of and rebinds for every instruction, so nothing gets allocated.
+"""
+
+from sixteen.registers import slots, SP
 
 
 class Value(object):
-    def __init__(self, state, is_a):
-        """Values get initialized with a state object, whose attributes it can
-        safely modify.
-        """
-        self.state = state
-        self.registers = state.registers
-        self.ram = state.ram
-        self.is_a = is_a
-        self.is_b = not is_a
+    # none of these hold any state, so they don't need instance dicts.
+    __slots__ = []
 
-    def set(self, value):
-        """This should update self.registers or self.ram."""
-        pass
+    # whether this takes the next word (and so another cycle).
+    consumes = False
 
-    def get(self):
+    def fetch(self, state):
+        "Do whatever happens when this operand is evaluated."
+        return None
+
+    def get(self, state, word):
         "This should return whatever value that should be gotten."
         raise NotImplementedError()
 
+    def set(self, state, word, value):
+        "This should update the state's registers or ram."
+        pass
+
+    def dis(self, word):
+        raise NotImplementedError()
+
+    # the operands to use in the a and b positions; see POPorPUSH.
+    @property
+    def as_a(self):
+        return self
+
+    @property
+    def as_b(self):
+        return self
+
 
 class Consumes(Value):
-    "A type of value that consumes a value from RAM on initialization."
-    def __init__(self, state, is_a):
-        Value.__init__(self, state, is_a)
-        self.value = next(state.ram_iter)
+    "A type of value that consumes a value from RAM when it's evaluated."
+    __slots__ = []
+    consumes = True
+
+    def fetch(self, state):
         state.cycles += 1
+        return next(state.ram_iter)
 
 
-class NextWord(Consumes):
-    def get(self):
-        return self.value
+class NextWordValue(Consumes):
+    __slots__ = []
+
+    def get(self, state, word):
+        return word
 
     # setting to next word literals is silently ignored.
 
-    @property
-    def dis(self):
-        return "0x%04x" % self.value
+    def dis(self, word):
+        return "0x%04x" % word
 
 
-class NextWordPointer(Consumes):
-    def get(self):
-        return self.ram[self.value]
+class NextWordPointerValue(Consumes):
+    __slots__ = []
 
-    def set(self, value):
-        self.ram[self.value] = value
+    def get(self, state, word):
+        return state.ram[word]
 
-    @property
-    def dis(self):
-        return "[0x%04x]" % self.value
+    def set(self, state, word, value):
+        state.ram[word] = value
+
+    def dis(self, word):
+        return "[0x%04x]" % word
+
+
+NextWord = NextWordValue()
+NextWordPointer = NextWordPointerValue()
 
 
 class Register(Value):
-    """A base class for register values. Create a new class for a register with
+    """A base class for register values. Get one for a register with
     `Myclass.named("PC")`, substituting the name of the register in.
     """
+    __slots__ = ["name", "slot"]
+
+    def __init__(self, name):
+        self.name = name
+        self.slot = slots[name]
+
     @classmethod
     def named(cls, name):
-        return type(name, (cls,), {"name": name})
+        return cls(name)
 
 
 class RegisterValue(Register):
     "A register's value."
-    def get(self):
-        return self.registers[self.name]
+    __slots__ = []
 
-    def set(self, value):
-        self.registers[self.name] = value
+    def get(self, state, word):
+        return state.registers[self.slot]
 
-    @property
-    def dis(self):
+    def set(self, state, word, value):
+        state.registers[self.slot] = value
+
+    def dis(self, word):
         return self.name
 
 
 class RegisterPointer(Register):
     "A register's value as a pointer."
-    def get(self):
-        return self.ram[self.registers[self.name]]
+    __slots__ = []
 
-    def set(self, value):
-        self.ram[self.registers[self.name]] = value
+    def get(self, state, word):
+        return state.ram[state.registers[self.slot]]
 
-    @property
-    def dis(self):
+    def set(self, state, word, value):
+        state.ram[state.registers[self.slot]] = value
+
+    def dis(self, word):
         return "[%s]" % self.name
 
 
 class RegisterPlusNextWord(Register, Consumes):
     "The value of a register and the next word as a pointer."
-    def get(self):
-        return self.ram[self.registers[self.name] + self.value]
+    __slots__ = []
 
-    def set(self, value):
-        self.ram[self.registers[self.name] + self.value] = value
+    def get(self, state, word):
+        return state.ram[self.address(state, word)]
 
-    @property
-    def dis(self):
-        return "[%s + 0x%04x]" % (self.name, self.value)
+    def set(self, state, word, value):
+        state.ram[self.address(state, word)] = value
+
+    def address(self, state, word):
+        # wrap around, rather than running off the end of RAM
+        return (state.registers[self.slot] + word) % 0x10000
+
+    def dis(self, word):
+        return "[%s + 0x%04x]" % (self.name, word)
+
+
+class LiteralValue(Value):
+    __slots__ = ["n"]
+
+    def __init__(self, n):
+        self.n = n
+
+    def get(self, state, word):
+        return self.n
+
+    def dis(self, word):
+        return "0x%04x" % self.n
 
 
 def Literal(n):
-    return type(hex(n), (Value,), {
-        "get": lambda self: n,
-        "dis": "0x%04x" % n
-    })
+    return LiteralValue(n)
 
 
-def POPorPUSH(state, is_a):
-    if is_a:
-        return POP(state, is_a)
-    else:
-        return PUSH(state, is_a)
+class POPValue(Value):
+    __slots__ = []
 
+    def fetch(self, state):
+        return state.pop()
 
-class POP(Register):
-    dis = "POP"
+    def get(self, state, word):
+        return word
 
-    def __init__(self, *args):
-        Register.__init__(self, *args)
-        self.value = self.state.pop()
+    def dis(self, word):
+        return "POP"
 
-    def get(self):
-        return self.value
 
+class PUSHValue(Value):
+    __slots__ = []
+
+    def fetch(self, state):
+        state.registers[SP] -= 1
+        state.registers[SP] %= 0x10000
+        return state.registers[SP]
 
-class PUSH(Register):
-    dis = "PUSH"
+    def get(self, state, word):
+        return state.ram[word]
 
-    def __init__(self, *args):
-        Register.__init__(self, *args)
-        self.state.registers["SP"] -= 1
-        self.state.registers["SP"] %= 0x10000
-        self.location = self.state.registers["SP"]
+    def set(self, state, word, value):
+        state.ram[word] = value
+
+    def dis(self, word):
+        return "PUSH"
+
+
+POP = POPValue()
+PUSH = PUSHValue()
+
+
+class POPorPUSHValue(Value):
+    "POP in a, PUSH in b."
+    __slots__ = []
+    as_a = POP
+    as_b = PUSH
+
+
+POPorPUSH = POPorPUSHValue()
+
+
+class Operand(object):
+    """An operand of the instruction a state is running, as the instruction's
+    method sees it.
+    """
+    __slots__ = ["state", "value", "word"]
+
+    def __init__(self, state):
+        self.state = state
+        self.value = None
+        self.word = None
+
+    def bind(self, value):
+        "Evaluate a value for a new instruction."
+        self.value = value
+        self.word = value.fetch(self.state)
+        return self
 
     def get(self):
-        return self.state.ram[self.location]
+        return self.value.get(self.state, self.word)
 
     def set(self, value):
-        self.state.ram[self.location] = value
+        self.value.set(self.state, self.word, value)
+
+    @property
+    def dis(self):
+        return self.value.dis(self.word)
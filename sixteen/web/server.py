@@ -57,12 +57,13 @@ class DCPU16Protocol(protocol.Protocol):
             self.keyboard.register_keypress(k)
         try:
             # cycle as many times as we're supposed to,
-            for _ in xrange(count):
-                self.cpu.cycle()
+            result = self.cpu.run(max_instructions=count)
         # if we get any errors, let the frontend know.
         except Exception as e:
             self.errors.append(str(e))
             raise
+        if result.error is not None:
+            self.errors.append(str(result.error))
         # and then pass everything to the frontend.
         self.write_changes()
 